@@ -0,0 +1,105 @@
+# benchmarks/db_benchmark.py
+
+"""
+قياس عدد العمليات في الثانية لأهم دوال قاعدة البيانات، قبل وبعد مجمع الاتصالات:
+- before: اتصال جديد لكل استدعاء خلف قفل عام، بوضع الـ journal الافتراضي (السلوك القديم).
+- after: ConnectionPool (كاتب واحد وعدة قرّاء طويلة العمر، WAL، pragmas مضبوطة).
+قراءة المستخدم تُقاس مباشرة من الواجهة الخلفية (get_user)، فذاكرة الملفات الشخصية لا تخفي الفرق بين الحالتين.
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.db_benchmark [عدد المستخدمين]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+
+import db.database as db
+from db.backends.sqlite import SQLiteBackend
+from db.connection import ConnectionPool
+
+DURATION_SECONDS = 1.0
+
+
+class PerCallConnections:
+    """السلوك القديم: اتصال جديد لكل استدعاء، خلف قفل عام واحد للقراءة والكتابة."""
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _connection(self):
+        with self.lock:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    writer = reader = _connection
+
+    def close(self):
+        pass
+
+
+def make_marks(user_index: int, variant: int = 0) -> list:
+    return [
+        {"subject": f"مادة {i}", "session": "الدورة الأولى", "mark": str(50 + (i + variant) % 50),
+         "status": "ناجح", "date": f"2024-{1 + i % 12:02d}-10", "semester": f"السنة {1 + i % 5}"}
+        for i in range(40)
+    ]
+
+
+def seed(users: int) -> None:
+    db.init_db()
+    for user_id in range(1, users + 1):
+        db.ensure_user(user_id)
+        db.save_user_number_and_results(user_id, "7", f"{2000000000 + user_id}", {"name": "طالب"}, make_marks(user_id))
+
+
+def ops_per_second(func) -> float:
+    count, start = 0, time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < DURATION_SECONDS:
+        func(count)
+        count += 1
+    return count / elapsed
+
+
+def claim_and_release() -> None:
+    # حجز دفعة من طابور الفحص كما يفعل الفحص الدوري ثم تحريرها، فتبقى الأرقام مستحقة للقياس التالي
+    db.claim_numbers_for_check("benchmark")
+    db.release_sweep_leases("benchmark")
+
+
+def run(label: str, pool, users: int) -> None:
+    db._backend = SQLiteBackend(pool=pool)
+    db.profiles.clear()
+    seed(users)
+    results = {
+        "get_user": ops_per_second(lambda i: db._backend.get_user(1 + i % users)),
+        "record_student_marks": ops_per_second(
+            lambda i: db.record_student_marks("7", f"{2000000000 + 1 + i % users}", make_marks(i % users, variant=i))
+        ),
+        "claim_numbers_for_check": ops_per_second(lambda i: claim_and_release()),
+    }
+    pool.close()
+    print(f"{label:<8}" + "".join(f"{name}: {value:>9.0f} ops/s   " for name, value in results.items()))
+
+
+def main(users: int = 500) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        run("before", PerCallConnections(str(Path(tmp) / "before.sqlite")), users)
+        run("after", ConnectionPool(str(Path(tmp) / "after.sqlite")), users)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,80 @@
+# benchmarks/parse_benchmark.py
+
+"""
+قياس زمن تحليل صفحات النتائج لكل واجهة تحليل متاحة ولكل وضع تحليل تدعمه (full/targeted)،
+مع التحقق من تطابق المخرجات وقياس ذروة الذاكرة المحجوزة من بايثون.
+
+التشغيل من جذر المشروع:
+    python -m benchmarks.parse_benchmark [عدد التكرارات]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+
+from services.html_parsers import available_backends, get_parser_backend
+from services.scraper_service import BaseScraper
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+REFERENCE_BACKEND = "html.parser"
+PARSE_MODES = ("full", "targeted")
+
+
+def load_fixture(name: str) -> bytes:
+    return (FIXTURES_DIR / name).read_bytes()
+
+
+def time_per_call(func, content: bytes, repeat: int) -> float:
+    """متوسط زمن الاستدعاء الواحد بالميلي ثانية."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(content)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def peak_memory_kib(func, content: bytes) -> float:
+    """ذروة الذاكرة المحجوزة أثناء استدعاء واحد (لا تشمل ذاكرة مكتبات C مثل lexbor)."""
+    tracemalloc.start()
+    func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main(repeat: int = 200) -> int:
+    pages = {name: load_fixture(name) for name in ("result.html", "result_error.html")}
+    home = load_fixture("home.html")
+
+    reference = BaseScraper(REFERENCE_BACKEND, parse_mode="full")
+    expected_pages = {name: reference.parse_student_page(content) for name, content in pages.items()}
+    expected_home = reference.parse_colleges_and_token(home)
+
+    mismatches = 0
+    print(f"{'backend':<14}{'mode':<10}{'result.html':>14}{'error page':>14}{'home.html':>14}{'peak mem':>14}  output")
+    for backend in available_backends():
+        for mode in PARSE_MODES:
+            if mode == "targeted" and not get_parser_backend(backend).supports_targeted:
+                continue
+            scraper = BaseScraper(backend, parse_mode=mode)
+            identical = (
+                all(scraper.parse_student_page(content) == expected_pages[name] for name, content in pages.items())
+                and scraper.parse_colleges_and_token(home) == expected_home
+            )
+            mismatches += not identical
+            timings = [time_per_call(scraper.parse_student_page, content, repeat) for content in pages.values()]
+            timings.append(time_per_call(scraper.parse_colleges_and_token, home, repeat))
+            peak = peak_memory_kib(scraper.parse_student_page, pages["result.html"])
+            print(
+                f"{backend:<14}{mode:<10}" + "".join(f"{t:>11.3f} ms" for t in timings)
+                + f"{peak:>10.1f} KiB  {'identical' if identical else 'MISMATCH'}"
+            )
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
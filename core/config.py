@@ -19,12 +19,101 @@ if ADMIN_ID == 0:
 
 # --- إعدادات قاعدة البيانات ---
 DATABASE_PATH = os.getenv("DATABASE_PATH", "hama_bot.sqlite")
+# عند تعيينه إلى postgres://... تُستخدم PostgreSQL بدل ملف SQLite (لتشغيل أكثر من عملية على نفس البيانات)
+DATABASE_URL = os.getenv("DATABASE_URL")
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", 1))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", 10))
+# ذاكرة الملفات الشخصية (بيانات المستخدم وعلاماته) لتجنب القراءة من القرص عند كل عرض للقائمة أو النتائج:
+# الحد الأقصى للحجم بالبايت، ومدة الصلاحية بالثواني
+PROFILE_CACHE_MAX_BYTES = int(os.getenv("PROFILE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", 600))
+# عدد اتصالات القراءة المفتوحة بالتوازي (الكتابة دائمًا عبر اتصال واحد)
+DB_READER_CONNECTIONS = int(os.getenv("DB_READER_CONNECTIONS", 4))
+# حجم ذاكرة الصفحات لكل اتصال (KiB) وحجم الملف المربوط بالذاكرة (بايت)
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", 16384))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
 
 # --- إعدادات خدمة استخلاص البيانات ---
 BASE_URL = "http://app.hama-univ.edu.sy/StdMark/"
 RESULT_URL = f"{BASE_URL}Home/Result"
 CHECK_INTERVAL_SECONDS = int(os.getenv("CHECK_INTERVAL_SECONDS", 3600))
 REQUEST_TIMEOUT = 20 
+# مدة صلاحية رمز التحقق وقائمة الكليات المخزنين، وهامش التحديث الاستباقي قبل انتهائها
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", 3600))
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", 300))
+# واجهة تحليل HTML: selectolax (الأسرع) أو lxml أو html.parser (المدمجة)
+HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "selectolax")
+# وضع تحليل صفحات النتائج: targeted (تحليل أجزاء النتائج فقط، مع html.parser وحدها) أو full (المستند كاملًا)
+HTML_PARSE_MODE = os.getenv("HTML_PARSE_MODE", "targeted")
+# إعدادات مجمع الاتصالات المشترك مع خادم الجامعة
+SCRAPER_MAX_CONNECTIONS = int(os.getenv("SCRAPER_MAX_CONNECTIONS", 32))
+SCRAPER_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SCRAPER_MAX_KEEPALIVE_CONNECTIONS", 16))
+SCRAPER_KEEPALIVE_EXPIRY = float(os.getenv("SCRAPER_KEEPALIVE_EXPIRY", 60))
+# مدة تخزين نتائج الطلاب المجلوبة (مشتركة بين كل من يطلب نفس الرقم) وأقصى عدد للأرقام المخزنة
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", 120))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 2048))
+# أقصى عمر لنتيجة مخزنة يقبله الفحص اليدوي (زر التحقق من النتائج)، حتى يرى المستخدم نتيجة شبه فورية
+MANUAL_CHECK_MAX_STALENESS_SECONDS = float(os.getenv("MANUAL_CHECK_MAX_STALENESS_SECONDS", 15))
+# محدد معدل الطلبات إلى خادم الجامعة (طلب/ثانية): يبدأ بالحد الأقصى وينخفض تلقائيًا عند الضغط حتى الحد الأدنى
+UPSTREAM_RATE_LIMIT_PER_SECOND = float(os.getenv("UPSTREAM_RATE_LIMIT_PER_SECOND", 10))
+UPSTREAM_RATE_LIMIT_MIN_PER_SECOND = float(os.getenv("UPSTREAM_RATE_LIMIT_MIN_PER_SECOND", 1))
+UPSTREAM_RATE_LIMIT_BURST = float(os.getenv("UPSTREAM_RATE_LIMIT_BURST", 10))
+# قاطع الدائرة: عدد الإخفاقات المتتالية لفتحها، والطلب الأبطأ من هذه المدة يُحسب إخفاقًا،
+# ومدة الفتح الأولى بالثواني (تتضاعف مع كل فتح متتالٍ حتى الحد الأقصى)
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 8))
+BREAKER_RESET_TIMEOUT_SECONDS = float(os.getenv("BREAKER_RESET_TIMEOUT_SECONDS", 15))
+BREAKER_MAX_RESET_TIMEOUT_SECONDS = float(os.getenv("BREAKER_MAX_RESET_TIMEOUT_SECONDS", 300))
+# الحد الأقصى للطلبات المتزامنة إلى خادم الجامعة، وحصة كل فئة منها (التفاعلية، التسجيل، النشر الجديد، الفحص الدوري).
+# حصة الفحص الدوري أقل من الحد الكلي حتى تبقى خانات محجوزة دائمًا لطلبات المستخدمين
+SCRAPER_MAX_CONCURRENT_REQUESTS = int(os.getenv("SCRAPER_MAX_CONCURRENT_REQUESTS", 24))
+SCRAPER_QUOTA_INTERACTIVE = int(os.getenv("SCRAPER_QUOTA_INTERACTIVE", 24))
+SCRAPER_QUOTA_REGISTRATION = int(os.getenv("SCRAPER_QUOTA_REGISTRATION", 12))
+SCRAPER_QUOTA_FANOUT = int(os.getenv("SCRAPER_QUOTA_FANOUT", 16))
+SCRAPER_QUOTA_SWEEP = int(os.getenv("SCRAPER_QUOTA_SWEEP", 16))
+# أقصى مدة ينتظرها طلب مستخدم لمحدد المعدل أو لقاطع الدائرة قبل إبلاغه بأن الخادم مشغول
+INTERACTIVE_MAX_WAIT_SECONDS = float(os.getenv("INTERACTIVE_MAX_WAIT_SECONDS", 3))
+
+# --- إعدادات الفحص الدوري ---
+# الحد الأقصى للطلبات المتزامنة إلى موقع الجامعة أثناء الفحص الدوري
+SWEEP_MAX_CONCURRENCY = int(os.getenv("SWEEP_MAX_CONCURRENCY", 16))
+# الحد الأقصى للطلبات المتزامنة لكل كلية على حدة
+SWEEP_PER_COLLEGE_CONCURRENCY = int(os.getenv("SWEEP_PER_COLLEGE_CONCURRENCY", 4))
+# الفحص الدوري يعمل كل SWEEP_TICK_SECONDS ويفحص في كل دورة الأرقام التي حان موعد فحصها (next_check_at في جدول numbers)،
+# فتتوزع الطلبات على الوقت بدل دفعة واحدة. مدة فحص كل رقم تتكيف مع نشاط كليته: أقصرها بعد نشر نتائج،
+# وتتضاعف كل SWEEP_INTERVAL_DOUBLING_HOURS ساعة بلا نشر حتى أطولها. الكليات بلا سجل نشر تُفحص كل CHECK_INTERVAL_SECONDS
+SWEEP_TICK_SECONDS = int(os.getenv("SWEEP_TICK_SECONDS", 300))
+SWEEP_MIN_INTERVAL_SECONDS = int(os.getenv("SWEEP_MIN_INTERVAL_SECONDS", 600))
+SWEEP_MAX_INTERVAL_SECONDS = int(os.getenv("SWEEP_MAX_INTERVAL_SECONDS", 6 * 3600))
+SWEEP_INTERVAL_DOUBLING_HOURS = float(os.getenv("SWEEP_INTERVAL_DOUBLING_HOURS", 12))
+# عدد أرقام المراقبة (canary) لكل كلية، تُفحص في كل دورة؛ إذا ظهرت علامات جديدة لأحدها تُفحص كل أرقام الكلية
+# فورًا بأولوية عالية. 0 يعطل المراقبة
+SWEEP_CANARY_COUNT = int(os.getenv("SWEEP_CANARY_COUNT", 3))
+# المهلة الكلية لكل دورة فحص بالثواني، بعدها لا تبدأ فحوصات جديدة
+SWEEP_DEADLINE_SECONDS = int(os.getenv("SWEEP_DEADLINE_SECONDS", int(SWEEP_TICK_SECONDS * 0.8)))
+# الأرقام المستحقة تُحجز من طابور قاعدة البيانات على دفعات بهذا الحجم، ويبقى الحجز (lease) صالحًا هذه المدة بالثواني؛
+# إن توقفت العملية قبل إنهاء فحص رقم محجوز يعود الرقم إلى الطابور بعد انتهاء حجزه
+SWEEP_CLAIM_BATCH_SIZE = int(os.getenv("SWEEP_CLAIM_BATCH_SIZE", 50))
+SWEEP_LEASE_SECONDS = int(os.getenv("SWEEP_LEASE_SECONDS", 2 * SWEEP_TICK_SECONDS))
+# إعادة محاولة الأرقام التي فشل فحصها: بعد SWEEP_RETRY_BASE_SECONDS، وتتضاعف المدة مع كل فشل متتالٍ حتى الحد الأقصى
+SWEEP_RETRY_BASE_SECONDS = int(os.getenv("SWEEP_RETRY_BASE_SECONDS", 60))
+SWEEP_RETRY_MAX_SECONDS = int(os.getenv("SWEEP_RETRY_MAX_SECONDS", SWEEP_MAX_INTERVAL_SECONDS))
+# تجميع كتابات الفحص الدوري: تُكتب الدفعة عند بلوغ هذا العدد من الأرقام أو بعد هذه المدة بالثواني
+WRITE_BEHIND_MAX_ITEMS = int(os.getenv("WRITE_BEHIND_MAX_ITEMS", 200))
+WRITE_BEHIND_MAX_DELAY_SECONDS = float(os.getenv("WRITE_BEHIND_MAX_DELAY_SECONDS", 5))
+
+# --- عمليات الفحص الدوري المنفصلة (sweep_worker.py) ---
+# 0 يوقف الفحص الدوري داخل عملية البوت عند تشغيل عمليات sweep_worker.py منفصلة، ويتطلب PostgreSQL (DATABASE_URL)
+# تشترك فيها العمليات (انظر sweep_worker.py)؛ الافتراضي 1: عملية البوت وحدها تفحص الأرقام.
+# عملية البوت ترسل في كل الأحوال الإشعارات التي تسجلها عمليات الفحص (جدول notifications_outbox) كل NOTIFICATIONS_POLL_SECONDS
+SWEEP_IN_BOT = int(os.getenv("SWEEP_IN_BOT", 1))
+NOTIFICATIONS_POLL_SECONDS = float(os.getenv("NOTIFICATIONS_POLL_SECONDS", 5))
+# الأرقام الجامعية مقسمة على SWEEP_SHARD_COUNT جزءًا ثابتًا، وكل عملية فحص تحجز أرقام جزئها SWEEP_SHARD_INDEX فقط.
+# إن لم يُحدد SWEEP_SHARD_INDEX يشغّل sweep_worker.py عملية لكل جزء
+SWEEP_SHARD_COUNT = int(os.getenv("SWEEP_SHARD_COUNT", 1))
+SWEEP_SHARD_INDEX = int(os.getenv("SWEEP_SHARD_INDEX", -1))
+# عدد العمليات التي تحلل صفحات النتائج لكل عملية فحص (0: التحليل في خيط داخل العملية نفسها)
+SWEEP_PARSE_PROCESSES = int(os.getenv("SWEEP_PARSE_PROCESSES", max(1, (os.cpu_count() or 1) // max(1, SWEEP_SHARD_COUNT))))
 
 # --- إعدادات التسجيل (Logging) ---
 logging.basicConfig(
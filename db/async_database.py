@@ -0,0 +1,82 @@
+# db/async_database.py
+
+"""
+واجهة غير متزامنة لدوال قاعدة البيانات.
+كل استدعاء يُنفذ في مجمع خيوط مخصص لقاعدة البيانات، فلا تتوقف حلقة الأحداث
+أثناء انتظار القرص، ويتداخل زمن قاعدة البيانات مع طلبات الشبكة.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from core.config import (
+    DB_READER_CONNECTIONS, DATABASE_URL, POSTGRES_POOL_MAX_SIZE, SWEEP_CLAIM_BATCH_SIZE
+)
+from . import database
+
+# خيط لكل اتصال: قرّاء SQLite + الكاتب حتى لا تنتظر القراءات خلف الكتابة، أو حجم مجمع PostgreSQL
+_executor = ThreadPoolExecutor(
+    max_workers=POSTGRES_POOL_MAX_SIZE if DATABASE_URL and DATABASE_URL.startswith("postgres") else DB_READER_CONNECTIONS + 1,
+    thread_name_prefix="db",
+)
+
+
+def _to_async(func):
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+    return wrapper
+
+
+async def close_db() -> None:
+    """تنتظر انتهاء العمليات الجارية ثم تغلق الاتصالات (عند إيقاف البوت)."""
+    await asyncio.get_running_loop().run_in_executor(None, partial(_executor.shutdown, wait=True))
+    database.close_db()
+
+
+init_db = _to_async(database.init_db)
+get_user_data = _to_async(database.get_user_data)
+ensure_user = _to_async(database.ensure_user)
+get_user_marks = _to_async(database.get_user_marks)
+get_profile_cache_metrics = _to_async(database.get_profile_cache_metrics)
+get_student_marks = _to_async(database.get_student_marks)
+get_number_subscribers = _to_async(database.get_number_subscribers)
+record_student_marks = _to_async(database.record_student_marks)
+save_user_number_and_results = _to_async(database.save_user_number_and_results)
+update_number_marks_hash = _to_async(database.update_number_marks_hash)
+apply_sweep_updates = _to_async(database.apply_sweep_updates)
+has_numbers_for_check = _to_async(database.has_numbers_for_check)
+get_canary_numbers = _to_async(database.get_canary_numbers)
+claim_numbers_for_check = _to_async(database.claim_numbers_for_check)
+make_college_due = _to_async(database.make_college_due)
+release_sweep_leases = _to_async(database.release_sweep_leases)
+get_queued_notifications = _to_async(database.get_queued_notifications)
+delete_queued_notification = _to_async(database.delete_queued_notification)
+toggle_notifications = _to_async(database.toggle_notifications)
+get_default_search_college = _to_async(database.get_default_search_college)
+set_default_search_college = _to_async(database.set_default_search_college)
+get_user_numbers = _to_async(database.get_user_numbers)
+add_saved_number = _to_async(database.add_saved_number)
+delete_saved_number = _to_async(database.delete_saved_number)
+toggle_notification_for_number = _to_async(database.toggle_notification_for_number)
+update_marks_hash = _to_async(database.update_marks_hash)
+record_publication_events = _to_async(database.record_publication_events)
+get_last_publication_times = _to_async(database.get_last_publication_times)
+admin_get_last_marks = _to_async(database.admin_get_last_marks)
+admin_set_last_marks = _to_async(database.admin_set_last_marks)
+
+
+async def iter_claimed_numbers(owner: str, college_id: str | None = None, shard: tuple | None = None,
+                               batch_size: int = SWEEP_CLAIM_BATCH_SIZE):
+    """
+    تحجز الأرقام المستحقة من طابور الفحص دفعة بعد دفعة للعامل owner وتُرجعها واحدًا تلو الآخر،
+    ولا تحجز الدفعة التالية إلا عند الحاجة إليها، حتى لا يبقى في الطابور رقم مستحق.
+    """
+    while True:
+        batch = await claim_numbers_for_check(owner, batch_size, college_id=college_id, shard=shard)
+        for number in batch:
+            yield number
+        if len(batch) < batch_size:
+            return
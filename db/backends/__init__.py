@@ -0,0 +1,23 @@
+# db/backends/__init__.py
+
+from core.config import DATABASE_PATH, DATABASE_URL
+from .base import StorageBackend, MARK_FIELDS
+
+
+def is_shared_database(url: str | None = DATABASE_URL) -> bool:
+    """هل قاعدة البيانات خادم مشترك (PostgreSQL) تصل إليه كل العمليات، وليست ملف SQLite محليًا لكل عملية؟"""
+    return bool(url) and url.startswith(("postgres://", "postgresql://"))
+
+
+def create_backend(url: str | None = DATABASE_URL) -> StorageBackend:
+    """
+    اختيار محرك التخزين حسب DATABASE_URL:
+    postgres:// أو postgresql:// لـ PostgreSQL، و sqlite:///path أو عدم التعيين لملف SQLite (DATABASE_PATH).
+    """
+    if is_shared_database(url):
+        from .postgres import PostgresBackend
+        return PostgresBackend(url)
+    if url and not url.startswith("sqlite:///"):
+        raise ValueError(f"نوع قاعدة البيانات غير مدعوم في DATABASE_URL: {url.split(':', 1)[0]}")
+    from .sqlite import SQLiteBackend
+    return SQLiteBackend(url.removeprefix("sqlite:///") if url else DATABASE_PATH)
@@ -0,0 +1,402 @@
+# db/backends/base.py
+
+import json
+import zlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+MARK_FIELDS = ("subject", "session", "mark", "status", "date", "semester")
+
+_INSERT_MARK_SQL = f"""
+    INSERT INTO marks (college_id, university_id, {", ".join(MARK_FIELDS)})
+    VALUES (?, ?, {", ".join("?" for _ in MARK_FIELDS)})
+    ON CONFLICT DO NOTHING
+"""
+
+_SELECT_NUMBER_MARKS_SQL = f"""
+    SELECT id, {", ".join(MARK_FIELDS)} FROM marks WHERE college_id = ? AND university_id = ?
+"""
+
+# الأرقام التي يفحصها الفحص الدوري: كل رقم مرة واحدة مهما كان عدد متابعيه، بشرط وجود متابع واحد على الأقل
+# مفعّل للإشعارات (مستخدم سجّله كرقمه الأساسي أو حفظه في الإعدادات).
+_HAS_NOTIFYING_SUBSCRIBER_SQL = """
+    (
+        EXISTS (SELECT 1 FROM users u WHERE u.university_id = n.university_id AND u.college_id = n.college_id
+                AND u.notifications_enabled = 1)
+        OR EXISTS (SELECT 1 FROM saved_numbers s WHERE s.college_id = n.college_id AND s.university_id = n.university_id
+                   AND s.notifications_enabled = 1)
+    )
+"""
+
+# هل يوجد رقم واحد على الأقل يفحصه الفحص الدوري
+HAS_NUMBERS_FOR_CHECK_SQL = f"""
+    SELECT 1 FROM numbers n WHERE {_HAS_NOTIFYING_SUBSCRIBER_SQL} LIMIT 1
+"""
+
+# متابعو رقم جامعي مفعلة إشعاراتهم: أصحاب الرقم المسجل والمستخدمون الذين حفظوه (المعاملان يُمرران مرتين)
+NUMBER_SUBSCRIBERS_SQL = """
+    SELECT id AS user_id FROM users
+    WHERE college_id = ? AND university_id = ? AND notifications_enabled = 1
+    UNION
+    SELECT user_id FROM saved_numbers
+    WHERE college_id = ? AND university_id = ? AND notifications_enabled = 1
+"""
+
+# أرقام المراقبة (canary) لكل كلية: حتى per_college رقمًا موزعة بالتساوي على ترتيب الأرقام الجامعية في الكلية
+# (فتغطي دفعات السنوات المختلفة)، من الأرقام المتابعة التي لها بصمة معروفة حتى يُقارن بها ما يظهر من جديد.
+# المعامل per_college يُمرر خمس مرات
+CANARY_NUMBERS_SQL = f"""
+    SELECT college_id, university_id, marks_hash, marks_loaded FROM (
+        SELECT n.college_id, n.university_id, n.marks_hash, n.marks_loaded,
+               ROW_NUMBER() OVER (PARTITION BY n.college_id ORDER BY n.university_id) - 1 AS rank_in_college,
+               COUNT(*) OVER (PARTITION BY n.college_id) AS total
+        FROM numbers n
+        WHERE n.marks_hash IS NOT NULL AND {_HAS_NOTIFYING_SUBSCRIBER_SQL}
+    ) AS ranked
+    WHERE rank_in_college % (CASE WHEN total < ? THEN 1 ELSE total / ? END) = 0
+      AND rank_in_college / (CASE WHEN total < ? THEN 1 ELSE total / ? END) < ?
+    ORDER BY college_id, university_id
+"""
+
+@lru_cache(maxsize=None)
+def claim_numbers_sql(by_college: bool, lock_clause: str = "", sharded: bool = False) -> str:
+    """
+    حجز دفعة من الأرقام التي حان موعد فحصها وليست محجوزة لعامل آخر (أو انتهى حجزه)، الأقدم موعدًا أولاً.
+    المعاملات: lease_owner, lease_expires_at, now, now, [college_id], [shard_count, shard_index], limit.
+    lock_clause يضيفه المحرك الذي يسمح بعدة كتّاب متزامنين (FOR UPDATE SKIP LOCKED) حتى لا يحجز عاملان نفس الرقم.
+    """
+    college_filter = "AND n.college_id = ?" if by_college else ""
+    shard_filter = "AND n.shard_key % ? = ?" if sharded else ""
+    return f"""
+        UPDATE numbers SET lease_owner = ?, lease_expires_at = ?
+        WHERE (college_id, university_id) IN (
+            SELECT n.college_id, n.university_id FROM numbers n
+            WHERE n.next_check_at <= ? AND (n.lease_expires_at IS NULL OR n.lease_expires_at <= ?)
+              {college_filter} {shard_filter}
+              AND {_HAS_NOTIFYING_SUBSCRIBER_SQL}
+            ORDER BY n.next_check_at
+            LIMIT ?
+            {lock_clause}
+        )
+        RETURNING college_id, university_id, marks_hash, marks_loaded, attempts
+    """
+
+
+# إنهاء فحص رقم: الموعد التالي، وتصفير المحاولات الفاشلة وتحرير الحجز
+_COMPLETE_CHECK_SQL = """
+    UPDATE numbers SET last_checked_at = ?, next_check_at = COALESCE(?, next_check_at), attempts = 0, last_error = NULL,
+                       lease_owner = NULL, lease_expires_at = NULL
+    WHERE college_id = ? AND university_id = ?
+"""
+
+# فشل فحص رقم: زيادة المحاولات وموعد إعادة المحاولة وتحرير الحجز
+_FAIL_CHECK_SQL = """
+    UPDATE numbers SET attempts = attempts + 1, last_error = ?, next_check_at = ?,
+                       lease_owner = NULL, lease_expires_at = NULL
+    WHERE college_id = ? AND university_id = ?
+"""
+
+# إضافة رقم إلى الأرقام المتابعة مع بصمته (أو تحديث البصمة إن كان موجودًا). المعاملات من number_hash_params
+_UPSERT_NUMBER_HASH_SQL = """
+    INSERT INTO numbers (college_id, university_id, marks_hash, shard_key) VALUES (?, ?, ?, ?)
+    ON CONFLICT (college_id, university_id) DO UPDATE SET marks_hash = excluded.marks_hash
+"""
+
+# علامات الرقم حُملت (لا يُعد ما يظهر بعدها أساسًا للمقارنة). المعاملات: college_id, university_id, shard_key
+_MARK_NUMBER_LOADED_SQL = """
+    INSERT INTO numbers (college_id, university_id, shard_key, marks_loaded) VALUES (?, ?, ?, 1)
+    ON CONFLICT (college_id, university_id) DO UPDATE SET marks_loaded = 1
+"""
+
+_INSERT_OUTBOX_SQL = """
+    INSERT INTO notifications_outbox (college_id, university_id, new_marks, created_at) VALUES (?, ?, ?, ?)
+"""
+
+
+def number_shard_key(college_id, university_id):
+    """مفتاح ثابت للرقم الجامعي (لا يتغير بين العمليات أو التشغيلات)، يُخزن مع الرقم عند إضافته."""
+    return zlib.crc32(f"{college_id}:{university_id}".encode()) & 0x7FFFFFFF
+
+
+def number_hash_params(college_id, university_id, marks_hash):
+    return (college_id, university_id, marks_hash, number_shard_key(college_id, university_id))
+
+
+def mark_params(college_id, university_id, mark):
+    return (college_id, university_id, *(str(mark.get(field, '')) for field in MARK_FIELDS))
+
+
+def mark_key(mark):
+    return tuple(str(mark.get(field, '')) for field in MARK_FIELDS)
+
+
+class StorageBackend(ABC):
+    """
+    واجهة التخزين التي تعتمد عليها db.database.
+    العمليات نفسها مكتوبة هنا بـ SQL مشترك بين SQLite و PostgreSQL (معاملات ? و ON CONFLICT و RETURNING)،
+    وكل تنفيذ يوفر الاتصالات (reader/writer) وترحيلات المخطط وما يختلف بين المحركين.
+    الدوال هنا تتعامل مع التخزين فقط؛ الذاكرة المؤقتة والسجلات في db.database.
+    """
+
+    # أنواع أخطاء قاعدة البيانات الخاصة بالمحرك (لالتقاطها دون معرفة المحرك)
+    errors: tuple = ()
+    # ما يُضاف لاستعلام حجز الأرقام حتى لا يحجز كاتبان متزامنان نفس الرقم (لا حاجة له مع كاتب حصري)
+    claim_lock_clause: str = ""
+
+    @abstractmethod
+    def reader(self):
+        """context manager يُرجع اتصال قراءة."""
+
+    @abstractmethod
+    def writer(self):
+        """context manager يُرجع اتصال كتابة داخل معاملة (commit عند النجاح و rollback عند الخطأ)."""
+
+    @abstractmethod
+    def init_schema(self) -> int:
+        """تطبيق ترحيلات المخطط وإرجاع رقم الإصدار الحالي."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """إغلاق كل الاتصالات."""
+
+    def lock_number(self, conn, college_id, university_id) -> None:
+        """
+        قفل رقم جامعي حتى نهاية المعاملة قبل مزامنة علاماته، حتى لا يعتبر كاتبان متزامنان نفس العلامة جديدة.
+        لا حاجة له عندما يكون الكاتب حصريًا (SQLite).
+        """
+
+    # --- المستخدمون ---
+    def get_user(self, user_id):
+        with self.reader() as conn:
+            row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        return dict(row) if row else None
+
+    def insert_user_if_absent(self, user_id):
+        """تُرجع صف المستخدم إن أُنشئ الآن، أو None إن كان موجودًا."""
+        with self.writer() as conn:
+            row = conn.execute(
+                "INSERT INTO users (id) VALUES (?) ON CONFLICT (id) DO NOTHING RETURNING *", (user_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def save_user_number(self, user_id, college_id, university_id, student_info_json, marks, marks_hash):
+        with self.writer() as conn:
+            conn.execute(
+                "UPDATE users SET college_id = ?, university_id = ?, student_info = ? WHERE id = ?",
+                (college_id, university_id, student_info_json, user_id)
+            )
+            conn.execute(_UPSERT_NUMBER_HASH_SQL, number_hash_params(college_id, university_id, marks_hash))
+            return self._record_student_marks(conn, college_id, university_id, marks)
+
+    def toggle_notifications(self, user_id):
+        with self.writer() as conn:
+            row = conn.execute(
+                "UPDATE users SET notifications_enabled = 1 - notifications_enabled WHERE id = ? RETURNING notifications_enabled",
+                (user_id,)
+            ).fetchone()
+        return row['notifications_enabled'] if row else None
+
+    def get_default_search_college(self, user_id):
+        with self.reader() as conn:
+            row = conn.execute("SELECT default_search_college FROM users WHERE id = ?", (user_id,)).fetchone()
+        return row['default_search_college'] if row else None
+
+    def set_default_search_college(self, user_id, college_id):
+        with self.writer() as conn:
+            conn.execute("UPDATE users SET default_search_college = ? WHERE id = ?", (college_id, user_id))
+
+    # --- العلامات ---
+    def _record_student_marks(self, conn, college_id, university_id, marks):
+        """
+        مزامنة علامات رقم جامعي مع آخر نسخة من الموقع داخل معاملة مفتوحة:
+        تُضاف العلامات غير الموجودة (insert-if-absent) وتُحذف التي اختفت من الموقع (مثل علامة صُححت).
+        تُرجع العلامات التي أضيفت للتو.
+        """
+        self.lock_number(conn, college_id, university_id)
+        conn.execute(_MARK_NUMBER_LOADED_SQL, (college_id, university_id, number_shard_key(college_id, university_id)))
+        existing = {
+            tuple(row[field] for field in MARK_FIELDS): row['id']
+            for row in conn.execute(_SELECT_NUMBER_MARKS_SQL, (college_id, university_id))
+        }
+        current = {mark_key(mark): mark for mark in marks}
+
+        # الرقم مقفل لهذه المعاملة، لذا كل ما ليس في existing سيُدرج فعلاً
+        new_marks = [mark for key, mark in current.items() if key not in existing]
+        if new_marks:
+            conn.executemany(_INSERT_MARK_SQL, [mark_params(college_id, university_id, mark) for mark in new_marks])
+
+        removed_ids = [(mark_id,) for key, mark_id in existing.items() if key not in current]
+        if removed_ids:
+            conn.executemany("DELETE FROM marks WHERE id = ?", removed_ids)
+        return new_marks
+
+    def record_student_marks(self, college_id, university_id, marks):
+        with self.writer() as conn:
+            return self._record_student_marks(conn, college_id, university_id, marks)
+
+    def get_student_marks(self, college_id, university_id, newest_first=True, limit=None, offset=0):
+        order = "DESC" if newest_first else "ASC"
+        sql = f"""
+            SELECT {', '.join(MARK_FIELDS)} FROM marks
+            WHERE college_id = ? AND university_id = ?
+            ORDER BY date {order}, subject
+        """
+        params = [college_id, university_id]
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self.reader() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def replace_student_marks(self, user_id, marks):
+        """(للمشرف) استبدال كل علامات رقم المستخدم ومسح البصمة. تُرجع (college_id, university_id)."""
+        with self.writer() as conn:
+            user = conn.execute("SELECT college_id, university_id FROM users WHERE id = ?", (user_id,)).fetchone()
+            if not user or not user['university_id']:
+                raise ValueError("المستخدم غير موجود أو ليس لديه رقم جامعي.")
+            number = (user['college_id'], user['university_id'])
+            self.lock_number(conn, *number)
+            conn.execute("DELETE FROM marks WHERE college_id = ? AND university_id = ?", number)
+            conn.executemany(_INSERT_MARK_SQL, [mark_params(*number, m) for m in marks])
+            # مسح البصمة حتى يُعاد تحليل الصفحة ومقارنتها بالعلامات الجديدة في الفحص القادم
+            # (مع بقاء الرقم محمّل العلامات، فما يزيد على علامات المشرف يُرسل كعلامات جديدة)
+            conn.execute(
+                "UPDATE numbers SET marks_hash = NULL, marks_loaded = 1 WHERE college_id = ? AND university_id = ?", number
+            )
+        return number
+
+    # --- الفحص الدوري والإشعارات ---
+    def get_number_subscribers(self, college_id, university_id):
+        with self.reader() as conn:
+            cursor = conn.execute(NUMBER_SUBSCRIBERS_SQL, (college_id, university_id, college_id, university_id))
+            return [row['user_id'] for row in cursor]
+
+    def update_number_marks_hash(self, college_id, university_id, marks_hash):
+        with self.writer() as conn:
+            conn.execute(_UPSERT_NUMBER_HASH_SQL, number_hash_params(college_id, university_id, marks_hash))
+
+    def apply_sweep_updates(self, marks_updates, hash_updates, checked_updates, failed_updates=(), notify=(),
+                            created_at=None):
+        """notify أزواج (college_id, university_id) تُسجل علاماتها المضافة فعلًا في notifications_outbox."""
+        with self.writer() as conn:
+            outbox = []
+            # ترتيب ثابت للأقفال حتى لا يتعارض كاتبان يحدثان نفس الأرقام
+            for college_id, university_id, marks in sorted(marks_updates, key=lambda update: update[:2]):
+                new_marks = self._record_student_marks(conn, college_id, university_id, marks)
+                if new_marks and (college_id, university_id) in notify:
+                    outbox.append((college_id, university_id, json.dumps(new_marks, ensure_ascii=False), created_at))
+            conn.executemany(_UPSERT_NUMBER_HASH_SQL, [number_hash_params(c, u, h) for h, c, u in hash_updates])
+            conn.executemany(_COMPLETE_CHECK_SQL, checked_updates)
+            conn.executemany(_FAIL_CHECK_SQL, failed_updates)
+            # الإشعارات تُسجل مع العلامات في نفس المعاملة ومن العلامات التي أضافتها فعلًا، فلا تُحفظ علامة جديدة
+            # دون إشعارها ولا تُشعر علامة سبقت عملية أخرى إلى كتابتها
+            conn.executemany(_INSERT_OUTBOX_SQL, outbox)
+
+    # --- طابور الفحص الدوري ---
+    def claim_numbers(self, owner, now, lease_expires_at, limit, college_id=None, shard=None):
+        """shard هو (shard_index, shard_count) لحجز أرقام جزء واحد فقط، أو None لكل الأرقام."""
+        sql = claim_numbers_sql(college_id is not None, self.claim_lock_clause, shard is not None)
+        params = (
+            owner, lease_expires_at, now, now,
+            *((college_id,) if college_id is not None else ()),
+            *((shard[1], shard[0]) if shard is not None else ()),
+            limit,
+        )
+        with self.writer() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def make_college_due(self, college_id, now, checked_before):
+        """تقديم موعد فحص أرقام الكلية إلى now، عدا التي فُحصت منذ checked_before (ISO 8601). تُرجع عدد الأرقام."""
+        with self.writer() as conn:
+            return conn.execute("""
+                UPDATE numbers SET next_check_at = ?
+                WHERE college_id = ? AND next_check_at > ? AND (last_checked_at IS NULL OR last_checked_at < ?)
+            """, (now, college_id, now, checked_before)).rowcount
+
+    def release_leases(self, owner):
+        """تحرير حجوزات العامل owner المتبقية (أرقام لم يُنهِ فحصها)، فتعود مستحقة في موعدها."""
+        with self.writer() as conn:
+            return conn.execute(
+                "UPDATE numbers SET lease_owner = NULL, lease_expires_at = NULL WHERE lease_owner = ?", (owner,)
+            ).rowcount
+
+    def has_numbers_for_check(self):
+        with self.reader() as conn:
+            return conn.execute(HAS_NUMBERS_FOR_CHECK_SQL).fetchone() is not None
+
+    # --- سجل نشر النتائج ---
+    def record_publication_events(self, events):
+        """events: [(college_id, semester, detected_at, numbers_count)]"""
+        with self.writer() as conn:
+            conn.executemany("""
+                INSERT INTO publication_events (college_id, semester, detected_at, numbers_count) VALUES (?, ?, ?, ?)
+            """, events)
+
+    def get_last_publication_times(self):
+        with self.reader() as conn:
+            cursor = conn.execute(
+                "SELECT college_id, MAX(detected_at) AS detected_at FROM publication_events GROUP BY college_id"
+            )
+            return {row['college_id']: row['detected_at'] for row in cursor}
+
+    def get_canary_numbers(self, per_college):
+        with self.reader() as conn:
+            cursor = conn.execute(CANARY_NUMBERS_SQL, (per_college,) * 5)
+            return [dict(row) for row in cursor]
+
+    # --- إشعارات عمليات الفحص المنفصلة ---
+    def get_queued_notifications(self, limit):
+        with self.reader() as conn:
+            cursor = conn.execute("""
+                SELECT id, college_id, university_id, new_marks FROM notifications_outbox ORDER BY id LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in cursor]
+
+    def delete_queued_notification(self, notification_id):
+        with self.writer() as conn:
+            conn.execute("DELETE FROM notifications_outbox WHERE id = ?", (notification_id,))
+
+    # --- الأرقام المحفوظة (الإعدادات) ---
+    def get_user_numbers(self, user_id):
+        with self.reader() as conn:
+            cursor = conn.execute("""
+                SELECT id, alias, college_id, university_id, notifications_enabled FROM saved_numbers
+                WHERE user_id = ? ORDER BY id
+            """, (user_id,))
+            return [dict(row) for row in cursor]
+
+    def add_saved_number(self, user_id, alias, college_id, university_id):
+        """حفظ رقم للمستخدم (أو تحديث اسمه المستعار إن كان محفوظًا). تُرجع معرف الرقم المحفوظ."""
+        with self.writer() as conn:
+            row = conn.execute("""
+                INSERT INTO saved_numbers (user_id, alias, college_id, university_id) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, college_id, university_id) DO UPDATE SET alias = excluded.alias
+                RETURNING id
+            """, (user_id, alias, college_id, university_id)).fetchone()
+            conn.execute(
+                "INSERT INTO numbers (college_id, university_id, shard_key) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                (college_id, university_id, number_shard_key(college_id, university_id))
+            )
+        return row['id']
+
+    def delete_saved_number(self, number_id, user_id):
+        with self.writer() as conn:
+            return conn.execute(
+                "DELETE FROM saved_numbers WHERE id = ? AND user_id = ?", (number_id, user_id)
+            ).rowcount > 0
+
+    def toggle_notification_for_number(self, number_id, user_id):
+        with self.writer() as conn:
+            row = conn.execute("""
+                UPDATE saved_numbers SET notifications_enabled = 1 - notifications_enabled
+                WHERE id = ? AND user_id = ? RETURNING notifications_enabled
+            """, (number_id, user_id)).fetchone()
+        return row['notifications_enabled'] if row else None
+
+    def update_marks_hash(self, number_id, marks_hash):
+        """تحديث بصمة صفحة النتائج للرقم الجامعي الخاص برقم محفوظ."""
+        with self.writer() as conn:
+            conn.execute("""
+                UPDATE numbers SET marks_hash = ?
+                WHERE (college_id, university_id) = (SELECT college_id, university_id FROM saved_numbers WHERE id = ?)
+            """, (marks_hash, number_id))
@@ -0,0 +1,227 @@
+# db/backends/postgres.py
+
+"""
+التخزين في PostgreSQL مع مجمع اتصالات (psycopg_pool)، حتى تعمل عدة عمليات بوت على نفس البيانات.
+يتطلب الحزمة الاختيارية psycopg[binary,pool].
+"""
+
+import re
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+except ImportError:  # pragma: no cover - الحزمة اختيارية
+    psycopg = None
+
+from core.config import POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE, logger
+from .base import StorageBackend
+
+# مفتاح قفل الترحيلات، حتى لا تطبقها عمليتان تبدآن معًا
+MIGRATIONS_LOCK_KEY = 7_200_001
+
+# ترحيلات المخطط بالترتيب: الترحيل رقم n يرفع schema_version إلى n، وكل ترحيل قائمة جمل تُنفذ واحدة واحدة.
+# الأعمدة النصية التي يُرتب بها تستخدم ترتيب "C" ليطابق ترتيب SQLite و Python.
+MIGRATIONS = (
+    (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT PRIMARY KEY,                 -- Telegram User ID
+            college_id TEXT,
+            university_id TEXT,
+            student_info TEXT,                     -- معلومات الطالب (JSON)
+            last_known_marks TEXT,                 -- (قديم) للتوافق مع مخطط SQLite
+            notifications_enabled INTEGER NOT NULL DEFAULT 1,
+            marks_hash TEXT,
+            last_checked_at TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS marks (
+            id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            college_id TEXT NOT NULL,
+            university_id TEXT NOT NULL,
+            subject TEXT COLLATE "C" NOT NULL,
+            session TEXT NOT NULL,
+            mark TEXT NOT NULL,
+            status TEXT NOT NULL,
+            date TEXT COLLATE "C" NOT NULL,
+            semester TEXT NOT NULL,
+            first_seen TIMESTAMPTZ NOT NULL DEFAULT now(),
+            UNIQUE (college_id, university_id, subject, session, mark, status, date, semester)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_marks_number_date ON marks (college_id, university_id, date)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_users_check ON users (id) INCLUDE (college_id, university_id, marks_hash)
+            WHERE university_id IS NOT NULL AND notifications_enabled = 1
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_users_number ON users (university_id, college_id)",
+    ),
+    (
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS default_search_college TEXT",
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS saved_numbers (
+            id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            alias TEXT NOT NULL,
+            college_id TEXT NOT NULL,
+            university_id TEXT NOT NULL,
+            notifications_enabled INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            UNIQUE (user_id, college_id, university_id)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_saved_numbers_number ON saved_numbers (college_id, university_id)
+            WHERE notifications_enabled = 1
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS numbers (
+            college_id TEXT NOT NULL,
+            university_id TEXT NOT NULL,
+            marks_hash TEXT,
+            last_checked_at TEXT,
+            PRIMARY KEY (college_id, university_id)
+        )
+        """,
+        """
+        INSERT INTO numbers (college_id, university_id, marks_hash, last_checked_at)
+            SELECT college_id, university_id, MAX(marks_hash), MAX(last_checked_at) FROM users
+            WHERE university_id IS NOT NULL AND college_id IS NOT NULL
+            GROUP BY college_id, university_id
+            ON CONFLICT DO NOTHING
+        """,
+        "UPDATE users SET marks_hash = NULL, last_checked_at = NULL",
+        "DROP INDEX IF EXISTS idx_users_check",
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS publication_events (
+            id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            college_id TEXT NOT NULL,
+            semester TEXT NOT NULL,
+            detected_at TEXT NOT NULL,
+            numbers_count INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_publication_events_college ON publication_events (college_id, detected_at)",
+    ),
+    # طابور الفحص الدوري (الأوقات بالثواني منذ epoch)، والأرقام الموجودة موزعة على الساعة القادمة
+    (
+        "ALTER TABLE numbers ADD COLUMN IF NOT EXISTS next_check_at BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE numbers ADD COLUMN IF NOT EXISTS lease_owner TEXT",
+        "ALTER TABLE numbers ADD COLUMN IF NOT EXISTS lease_expires_at BIGINT",
+        "ALTER TABLE numbers ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE numbers ADD COLUMN IF NOT EXISTS last_error TEXT",
+        """
+        UPDATE numbers SET next_check_at =
+            EXTRACT(EPOCH FROM now())::BIGINT + mod(hashtext(college_id || ':' || university_id) & 2147483647, 3600)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_numbers_next_check ON numbers (next_check_at)",
+    ),
+    # الأرقام الموجودة تأخذ مفتاحها من hashtext؛ الأرقام الجديدة من number_shard_key. المهم أن يبقى ثابتًا لكل رقم
+    (
+        "ALTER TABLE numbers ADD COLUMN IF NOT EXISTS shard_key INTEGER NOT NULL DEFAULT 0",
+        "UPDATE numbers SET shard_key = hashtext(college_id || ':' || university_id) & 2147483647",
+    ),
+    (
+        """
+        CREATE TABLE IF NOT EXISTS notifications_outbox (
+            id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            college_id TEXT NOT NULL,
+            university_id TEXT NOT NULL,
+            new_marks TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """,
+    ),
+    # هل حُملت علامات الرقم مرة على الأقل (انظر _add_marks_loaded في db/migrations.py)
+    (
+        "ALTER TABLE numbers ADD COLUMN IF NOT EXISTS marks_loaded INTEGER NOT NULL DEFAULT 0",
+        """
+        UPDATE numbers SET marks_loaded = 1
+        WHERE EXISTS (SELECT 1 FROM marks m WHERE m.college_id = numbers.college_id AND m.university_id = numbers.university_id)
+           OR (marks_hash IS NOT NULL AND EXISTS (
+               SELECT 1 FROM users u WHERE u.college_id = numbers.college_id AND u.university_id = numbers.university_id
+           ))
+        """,
+    ),
+)
+
+
+# النصوص والمعرفات المقتبسة والتعليقات تُنسخ كما هي، وما عداها من ? يصبح معاملًا
+_SQL_TOKENS = re.compile(
+    r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|(\$(?:[A-Za-z_]\w*)?\$).*?\1|--[^\n]*|/\*.*?\*/|\?""",
+    re.S,
+)
+
+
+@lru_cache(maxsize=256)
+def _to_pyformat(sql: str) -> str:
+    # الاستعلامات المشتركة مكتوبة بـ ? ، و psycopg يستخدم %s.
+    # psycopg يفسر % في كل الاستعلام (حتى داخل النصوص) عند تمرير معاملات، لذلك يُهرب في كل مكان
+    sql = sql.replace("%", "%%")
+    return _SQL_TOKENS.sub(lambda m: "%s" if m.group() == "?" else m.group(), sql)
+
+
+class _Connection:
+    """غلاف رقيق يجعل اتصال psycopg يقبل نفس استعلامات sqlite3 (execute و executemany على الاتصال)."""
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, sql, params=()):
+        return self._conn.execute(_to_pyformat(sql), params)
+
+    def executemany(self, sql, params_seq):
+        params_seq = list(params_seq)
+        if params_seq:
+            with self._conn.cursor() as cursor:
+                cursor.executemany(_to_pyformat(sql), params_seq)
+
+
+class PostgresBackend(StorageBackend):
+    def __init__(self, url: str, min_size: int = POSTGRES_POOL_MIN_SIZE, max_size: int = POSTGRES_POOL_MAX_SIZE):
+        if psycopg is None:
+            raise RuntimeError("DATABASE_URL يشير إلى PostgreSQL لكن الحزمة psycopg[binary,pool] غير مثبتة.")
+        self.errors = (psycopg.Error,)
+        self._pool = ConnectionPool(
+            url, min_size=min_size, max_size=max_size,
+            kwargs={"row_factory": dict_row}, open=True, name="asdfreq",
+        )
+
+    @contextmanager
+    def _connection(self):
+        # الخروج من pool.connection يُنهي المعاملة (commit أو rollback عند الخطأ)
+        with self._pool.connection() as conn:
+            yield _Connection(conn)
+
+    reader = writer = _connection
+
+    # عدة عمليات تحجز من نفس الطابور: الصفوف التي يحجزها غيرها الآن تُتخطى بدل انتظارها
+    claim_lock_clause = "FOR UPDATE OF n SKIP LOCKED"
+
+    def lock_number(self, conn, college_id, university_id) -> None:
+        conn.execute("SELECT pg_advisory_xact_lock(hashtext(?))", (f"{college_id}:{university_id}",))
+
+    def init_schema(self) -> int:
+        with self.writer() as conn:
+            conn.execute("SELECT pg_advisory_xact_lock(?)", (MIGRATIONS_LOCK_KEY,))
+            conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+            row = conn.execute("SELECT max(version) AS version FROM schema_version").fetchone()
+            version = row['version'] or 0
+            if version > len(MIGRATIONS):
+                raise RuntimeError(f"إصدار مخطط قاعدة البيانات ({version}) أحدث من إصدار الكود ({len(MIGRATIONS)}).")
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in migration:
+                    conn.execute(statement)
+                conn.execute("INSERT INTO schema_version (version) VALUES (?)", (number,))
+                logger.info(f"تم تطبيق ترحيل قاعدة البيانات رقم {number} (PostgreSQL).")
+        return len(MIGRATIONS)
+
+    def close(self) -> None:
+        self._pool.close()
@@ -0,0 +1,35 @@
+# db/backends/sqlite.py
+
+import sqlite3
+
+from core.config import DATABASE_PATH
+from ..connection import ConnectionPool
+from ..migrations import apply_migrations, check_query_plans
+from .base import StorageBackend
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    التخزين في ملف SQLite واحد: كاتب واحد وعدة قرّاء طويلة العمر (WAL).
+    مناسب لعملية بوت واحدة؛ لتشغيل أكثر من عملية على نفس البيانات استخدم PostgreSQL.
+    """
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str = DATABASE_PATH, pool: ConnectionPool | None = None):
+        self._pool = pool or ConnectionPool(path)
+
+    def reader(self):
+        return self._pool.reader()
+
+    def writer(self):
+        return self._pool.writer()
+
+    def init_schema(self) -> int:
+        with self.writer() as conn:
+            version = apply_migrations(conn)
+        with self.reader() as conn:
+            check_query_plans(conn)
+        return version
+
+    def close(self) -> None:
+        self._pool.close()
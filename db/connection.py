@@ -0,0 +1,93 @@
+# db/connection.py
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from core.config import SQLITE_CACHE_SIZE_KIB, SQLITE_MMAP_SIZE, DB_READER_CONNECTIONS, logger
+
+
+class ConnectionPool:
+    """
+    مدير اتصالات SQLite طويلة العمر:
+    - اتصال كتابة واحد محمي بقفل (SQLite لا يسمح إلا بكاتب واحد في نفس الوقت).
+    - عدة اتصالات قراءة فقط تعمل بالتوازي مع الكتابة بفضل وضع WAL.
+    إبقاء الاتصالات مفتوحة يوفر كلفة فتحها، ويسمح بإعادة استخدام الاستعلامات المحضّرة
+    من ذاكرة الاستعلامات الخاصة بكل اتصال (cached_statements).
+    """
+    def __init__(self, path: str, readers: int = DB_READER_CONNECTIONS):
+        self.path = path
+        self.max_readers = max(1, readers)
+        self._write_lock = threading.Lock()
+        self._writer: sqlite3.Connection | None = None
+        self._readers: queue.LifoQueue = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_count_lock = threading.Lock()
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute("PRAGMA synchronous = NORMAL")  # آمن مع WAL ويوفر fsync لكل معاملة
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only = 1")
+        else:
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != "wal":
+                logger.warning(f"تعذر تفعيل وضع WAL لقاعدة البيانات (الوضع الحالي: {mode}).")
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """اتصال الكتابة داخل معاملة واحدة (commit عند النجاح و rollback عند الخطأ)."""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            with self._writer:
+                yield self._writer
+
+    @contextmanager
+    def reader(self):
+        """اتصال قراءة من المجمع، يُعاد إليه بعد الاستخدام."""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._reader_count_lock:
+            if self._reader_count < self.max_readers:
+                self._reader_count += 1
+                create = True
+            else:
+                create = False
+        if create:
+            # اتصال الكتابة يُنشأ أولاً حتى يُفعّل WAL قبل أي قراءة
+            if self._writer is None:
+                with self.writer():
+                    pass
+            return self._connect(read_only=True)
+        return self._readers.get()
+
+    def close(self) -> None:
+        """إغلاق كل الاتصالات (عند إيقاف البوت)."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._reader_count_lock:
+            self._reader_count = 0
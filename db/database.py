@@ -1,139 +1,262 @@
 # db/database.py
 
-import sqlite3
-import threading
+"""
+دوال قاعدة البيانات التي يستخدمها البوت.
+التخزين نفسه في محرك قابل للتبديل (db/backends: SQLite افتراضيًا أو PostgreSQL عبر DATABASE_URL)،
+وهذه الوحدة تضيف فوقه ذاكرة الملفات الشخصية والسجلات.
+"""
+
 import json
-from core.config import DATABASE_PATH, logger
+import time
+from datetime import datetime, timezone
+from core.config import SWEEP_CLAIM_BATCH_SIZE, SWEEP_LEASE_SECONDS, logger
+from .backends import MARK_FIELDS, create_backend
+from .backends.base import mark_key
+from .profile_cache import ProfileCache
+
+_backend = create_backend()
 
-# استخدام lock لضمان عدم حدوث تضارب في الوصول إلى قاعدة البيانات
-db_lock = threading.Lock()
+# الملفات الشخصية للمستخدمين في الذاكرة: كل دالة تكتب في users أو marks تحدث الملفات المخزنة المتأثرة.
+# مع عدة عمليات على PostgreSQL لا ترى كل عملية كتابات غيرها، لذا مدة الصلاحية (TTL) هي حد التقادم.
+profiles = ProfileCache()
 
-def get_db_connection():
-    """إنشاء اتصال آمن بقاعدة البيانات."""
-    conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+def _decode_user(row):
+    user = dict(row)
+    user['student_info'] = json.loads(user['student_info']) if user.get('student_info') else {}
+    return user
+
+def close_db():
+    """إغلاق اتصالات قاعدة البيانات (عند إيقاف البوت)."""
+    _backend.close()
 
 def init_db():
-    """تهيئة جدول قاعدة البيانات بالهيكلية الجديدة."""
-    with db_lock:
-        conn = get_db_connection()
-        try:
-            with conn:
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INTEGER PRIMARY KEY,                -- Telegram User ID
-                        college_id TEXT,                       -- معرف الكلية
-                        university_id TEXT,                    -- الرقم الجامعي
-                        student_info TEXT,                     -- معلومات الطالب (JSON)
-                        last_known_marks TEXT,                 -- آخر علامات معروفة (JSON)
-                        notifications_enabled INTEGER DEFAULT 1 -- تفعيل/تعطيل الإشعارات
-                    );
-                """)
-            logger.info("قاعدة البيانات تم تهيئتها بالهيكلية الجديدة.")
-        finally:
-            conn.close()
+    """تهيئة قاعدة البيانات: تطبيق ترحيلات المخطط غير المطبقة."""
+    version = _backend.init_schema()
+    logger.info(f"قاعدة البيانات جاهزة ({type(_backend).__name__}، إصدار المخطط {version}).")
+
+# --- العلامات ---
+def _stored_marks(marks):
+    """العلامات كما ستُقرأ من جدول marks بعد حفظها: بدون تكرار، ومرتبة مثل get_student_marks (الأحدث أولاً)."""
+    rows = {mark_key(mark): None for mark in marks}
+    stored = [dict(zip(MARK_FIELDS, key)) for key in rows]
+    stored.sort(key=lambda mark: mark['subject'])
+    stored.sort(key=lambda mark: mark['date'], reverse=True)
+    return stored
+
+def record_student_marks(college_id, university_id, marks):
+    """تحفظ آخر علامات رقم جامعي وتُرجع العلامات الجديدة فقط."""
+    new_marks = _backend.record_student_marks(college_id, university_id, marks)
+    profiles.update_numbers({(college_id, university_id): {'marks': _stored_marks(marks)}})
+    if new_marks:
+        logger.info(f"تمت إضافة {len(new_marks)} علامة جديدة للرقم {university_id}.")
+    return new_marks
+
+def get_student_marks(college_id, university_id, newest_first=True, limit=None, offset=0):
+    """
+    جلب علامات رقم جامعي مرتبة حسب التاريخ.
+    يمكن تمرير limit و offset لجلب صفحة واحدة فقط.
+    """
+    return _backend.get_student_marks(college_id, university_id, newest_first, limit, offset)
+
+def get_number_subscribers(college_id, university_id):
+    """جلب معرفات المستخدمين المفعلين للإشعارات والمتابعين لرقم جامعي معين."""
+    return _backend.get_number_subscribers(college_id, university_id)
 
 def get_user_data(user_id):
-    """جلب كامل بيانات المستخدم من قاعدة البيانات."""
-    with db_lock:
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-            user_data = cursor.fetchone()
-            if not user_data:
-                # إذا لم يكن المستخدم موجودًا، قم بإنشائه
-                cursor.execute("INSERT INTO users (id) VALUES (?)", (user_id,))
-                conn.commit()
-                # ثم أعد جلبه مرة أخرى
-                cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-                user_data = cursor.fetchone()
-            return dict(user_data) if user_data else None
-        finally:
-            conn.close()
-
-def save_user_number_and_results(user_id, college_id, university_id, student_info, marks):
-    """حفظ أو تحديث رقم المستخدم ونتائجه الأولية."""
+    """
+    جلب الملف الشخصي للمستخدم (قراءة فقط، من الذاكرة المؤقتة إن وُجد): صف users مع student_info كقاموس.
+    تُرجع None إن لم يكن المستخدم مسجلاً.
+    """
+    user_data = profiles.get(user_id)
+    if user_data:
+        return user_data
+    generation = profiles.generation
+    row = _backend.get_user(user_id)
+    if not row:
+        return None
+    user_data = _decode_user(row)
+    profiles.put(user_data, generation)
+    return user_data
+
+def ensure_user(user_id):
+    """إنشاء المستخدم عند أول تواصل إن لم يكن موجودًا، وإرجاع ملفه الشخصي."""
+    user_data = profiles.get(user_id)
+    if user_data:
+        return user_data
+    row = _backend.insert_user_if_absent(user_id)
+    if not row:
+        # المستخدم موجود مسبقًا
+        return get_user_data(user_id)
+    user_data = _decode_user(row)
+    profiles.put(user_data, profiles.generation)
+    return user_data
+
+def save_user_number_and_results(user_id, college_id, university_id, student_info, marks, marks_hash=None):
+    """حفظ أو تحديث رقم المستخدم ونتائجه الأولية. تُرجع العلامات التي لم تكن مخزنة لهذا الرقم من قبل."""
     student_info_json = json.dumps(student_info, ensure_ascii=False)
-    marks_json = json.dumps(marks, ensure_ascii=False)
-    with db_lock:
-        conn = get_db_connection()
-        try:
-            with conn:
-                conn.execute("""
-                    UPDATE users
-                    SET college_id = ?, university_id = ?, student_info = ?, last_known_marks = ?
-                    WHERE id = ?
-                """, (college_id, university_id, student_info_json, marks_json, user_id))
-            logger.info(f"تم حفظ بيانات ونتائج المستخدم {user_id} بنجاح.")
-        finally:
-            conn.close()
-
-def update_user_marks(user_id, new_marks):
-    """تحديث قائمة العلامات للمستخدم."""
-    new_marks_json = json.dumps(new_marks, ensure_ascii=False)
-    with db_lock:
-        conn = get_db_connection()
-        try:
-            with conn:
-                conn.execute("UPDATE users SET last_known_marks = ? WHERE id = ?", (new_marks_json, user_id))
-            logger.info(f"تم تحديث علامات المستخدم {user_id}.")
-        finally:
-            conn.close()
-
-def get_all_users_for_check():
-    """جلب كل المستخدمين الذين لديهم أرقام محفوظة ومفعلين الإشعارات."""
-    with db_lock:
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            # جلب المستخدمين الذين لديهم رقم جامعي مسجل فقط
-            cursor.execute("SELECT * FROM users WHERE university_id IS NOT NULL AND notifications_enabled = 1")
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
+    new_marks = _backend.save_user_number(user_id, college_id, university_id, student_info_json, marks, marks_hash)
+    stored_marks = _stored_marks(marks)
+    profiles.update_numbers({(college_id, university_id): {'marks': stored_marks}})
+    profiles.update_user(
+        user_id, college_id=college_id, university_id=university_id, student_info=student_info, marks=stored_marks
+    )
+    logger.info(f"تم حفظ بيانات ونتائج المستخدم {user_id} بنجاح.")
+    return new_marks
+
+def update_number_marks_hash(college_id, university_id, marks_hash):
+    """تحديث بصمة صفحة النتائج لكل المستخدمين المتابعين لنفس الرقم الجامعي."""
+    _backend.update_number_marks_hash(college_id, university_id, marks_hash)
+
+def apply_sweep_updates(marks_updates, hash_updates, checked_updates, failed_updates=(), notify=()):
+    """
+    تطبيق دفعة من تحديثات الفحص الدوري في معاملة واحدة:
+    marks_updates: [(college_id, university_id, marks)]
+    hash_updates: [(marks_hash, college_id, university_id)]
+    checked_updates: [(checked_at, next_check_at, college_id, university_id)] (الفحوصات الناجحة)
+    failed_updates: [(error, next_check_at, college_id, university_id)] (الفحوصات الفاشلة وموعد إعادة المحاولة)
+    notify: {(college_id, university_id)} أرقام تُسجل علاماتها المضافة في هذه المعاملة لترسلها عملية البوت
+    (انظر get_queued_notifications)
+    كل رقم في checked_updates أو failed_updates يُحرَّر حجزه في طابور الفحص.
+    """
+    created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    _backend.apply_sweep_updates(marks_updates, hash_updates, checked_updates, failed_updates, notify, created_at)
+    profiles.update_numbers({
+        (college_id, university_id): {'marks': _stored_marks(marks)} for college_id, university_id, marks in marks_updates
+    })
+
+def get_user_marks(user_id):
+    """جلب علامات الرقم الجامعي المسجل للمستخدم (الأحدث أولاً)، من الملف الشخصي المخزن إن أمكن."""
+    user = get_user_data(user_id)
+    if not user or not user.get('university_id'):
+        return []
+    if user.get('marks') is not None:
+        return user['marks']
+    generation = profiles.generation
+    user['marks'] = get_student_marks(user['college_id'], user['university_id'])
+    profiles.put(user, generation)
+    return list(user['marks'])
+
+def get_profile_cache_metrics():
+    """إحصائيات ذاكرة الملفات الشخصية (الإصابات، الإخفاقات، الحجم)."""
+    return profiles.metrics()
+
+# --- طابور الفحص الدوري ---
+def has_numbers_for_check():
+    """هل يوجد رقم جامعي له متابع واحد على الأقل مفعّل للإشعارات (أي أن للفحص الدوري ما يفحصه)."""
+    return _backend.has_numbers_for_check()
+
+def claim_numbers_for_check(owner, limit=SWEEP_CLAIM_BATCH_SIZE, lease_seconds=SWEEP_LEASE_SECONDS, college_id=None,
+                            shard=None):
+    """
+    حجز حتى limit رقمًا حان موعد فحصها (من كلية واحدة إن مُرر college_id، ومن الجزء shard = (index, count) إن مُرر)
+    للعامل owner لمدة lease_seconds.
+    تُرجع (college_id, university_id, marks_hash, attempts) لكل رقم محجوز؛ الرقم المحجوز لا يحجزه عامل آخر
+    حتى يُنهى فحصه (apply_sweep_updates) أو يُحرر حجزه أو تنتهي مدته.
+    """
+    now = int(time.time())
+    return _backend.claim_numbers(owner, now, now + lease_seconds, limit, college_id, shard)
+
+def make_college_due(college_id, checked_before):
+    """جعل كل أرقام الكلية مستحقة الفحص الآن، عدا التي فُحصت منذ checked_before (ISO 8601). تُرجع عدد الأرقام."""
+    return _backend.make_college_due(college_id, int(time.time()), checked_before)
+
+def release_sweep_leases(owner):
+    """تحرير حجوزات العامل owner التي لم يُنهِ فحصها، فتعود إلى الطابور فورًا. تُرجع عدد الأرقام المحررة."""
+    return _backend.release_leases(owner)
+
+def get_queued_notifications(limit=100):
+    """
+    أقدم الإشعارات التي سجلتها عمليات الفحص المنفصلة (id, college_id, university_id, new_marks).
+    علامات هذه الأرقام كتبتها عملية أخرى، لذا تُحذف من الملفات الشخصية المخزنة هنا لتُقرأ من جديد.
+    """
+    notifications = _backend.get_queued_notifications(limit)
+    for notification in notifications:
+        notification['new_marks'] = json.loads(notification['new_marks'])
+    profiles.update_numbers({(n['college_id'], n['university_id']): {'marks': None} for n in notifications})
+    return notifications
+
+def delete_queued_notification(notification_id):
+    """حذف إشعار بعد إرساله."""
+    _backend.delete_queued_notification(notification_id)
+
+def get_canary_numbers(per_college):
+    """أرقام المراقبة: حتى per_college رقمًا من كل كلية، موزعة على نطاق أرقامها الجامعية ولها بصمة معروفة."""
+    return _backend.get_canary_numbers(per_college)
 
 def toggle_notifications(user_id):
     """تبديل حالة الإشعارات للمستخدم."""
-    with db_lock:
-        conn = get_db_connection()
-        try:
-            with conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT notifications_enabled FROM users WHERE id = ?", (user_id,))
-                current_status = cursor.fetchone()[0]
-                new_status = 0 if current_status == 1 else 1
-                cursor.execute("UPDATE users SET notifications_enabled = ? WHERE id = ?", (new_status, user_id))
-                return new_status
-        finally:
-            conn.close()
+    new_status = _backend.toggle_notifications(user_id)
+    profiles.update_user(user_id, notifications_enabled=new_status)
+    return new_status
+
+def get_default_search_college(user_id):
+    """جلب الكلية الافتراضية للبحث الخاصة بالمستخدم (أو None)."""
+    return _backend.get_default_search_college(user_id)
+
+def set_default_search_college(user_id, college_id):
+    """حفظ الكلية الافتراضية للبحث (None لإزالتها)."""
+    _backend.set_default_search_college(user_id, college_id)
+    profiles.update_user(user_id, default_search_college=college_id)
+
+# --- سجل نشر النتائج ---
+def record_publication_events(detections):
+    """
+    تسجيل اكتشاف علامات جديدة (لحساب نشاط كل كلية في الفحص الدوري).
+    detections: {(college_id, semester): عدد الأرقام التي ظهرت لها علامات جديدة}
+    """
+    if not detections:
+        return
+    detected_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    _backend.record_publication_events([
+        (college_id, semester, detected_at, count) for (college_id, semester), count in detections.items()
+    ])
+
+def get_last_publication_times():
+    """آخر وقت اكتُشفت فيه علامات جديدة لكل كلية: {college_id: ISO 8601}."""
+    return _backend.get_last_publication_times()
+
+# --- الأرقام المحفوظة ---
+def get_user_numbers(user_id):
+    """جلب الأرقام التي حفظها المستخدم (id, alias, college_id, university_id, notifications_enabled)."""
+    return _backend.get_user_numbers(user_id)
+
+def add_saved_number(user_id, alias, college_id, university_id):
+    """حفظ رقم جامعي للمستخدم باسم مستعار (أو تحديث الاسم إن كان محفوظًا) وإرجاع معرفه."""
+    number_id = _backend.add_saved_number(user_id, alias, college_id, university_id)
+    logger.info(f"حفظ المستخدم {user_id} الرقم {university_id} باسم '{alias}'.")
+    return number_id
+
+def delete_saved_number(number_id, user_id):
+    """حذف رقم محفوظ (فقط إن كان يخص المستخدم). تُرجع True إن حُذف."""
+    return _backend.delete_saved_number(number_id, user_id)
+
+def toggle_notification_for_number(number_id, user_id):
+    """تبديل حالة الإشعارات لرقم محفوظ يخص المستخدم وإرجاع الحالة الجديدة (أو None إن لم يوجد)."""
+    return _backend.toggle_notification_for_number(number_id, user_id)
+
+def update_marks_hash(number_id, marks_hash):
+    """تحديث بصمة صفحة النتائج للرقم الجامعي الخاص برقم محفوظ."""
+    _backend.update_marks_hash(number_id, marks_hash)
 
 # --- Admin Feature ---
 def admin_get_last_marks(user_id):
     """(للمشرف) جلب العلامات الأخيرة لمستخدم معين كـ JSON string."""
-    with db_lock:
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT last_known_marks FROM users WHERE id = ?", (user_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
-        finally:
-            conn.close()
+    user = _backend.get_user(user_id)
+    if not user or not user['university_id']:
+        return None
+    marks = _backend.get_student_marks(user['college_id'], user['university_id'], newest_first=False)
+    return json.dumps(marks, ensure_ascii=False)
 
 def admin_set_last_marks(user_id, marks_json_string):
     """(للمشرف) تعيين العلامات الأخيرة لمستخدم معين باستخدام JSON string."""
-    with db_lock:
-        conn = get_db_connection()
-        try:
-            # التحقق من أن النص هو JSON صالح قبل الحفظ
-            json.loads(marks_json_string) 
-            with conn:
-                conn.execute("UPDATE users SET last_known_marks = ? WHERE id = ?", (marks_json_string, user_id))
-            return True
-        except (json.JSONDecodeError, sqlite3.Error) as e:
-            logger.error(f"Admin failed to set marks for {user_id}: {e}")
-            return False
-        finally:
-            conn.close()
\ No newline at end of file
+    try:
+        # التحقق من أن النص هو JSON صالح (قائمة علامات) قبل الحفظ
+        marks = json.loads(marks_json_string)
+        if not isinstance(marks, list) or not all(isinstance(mark, dict) for mark in marks):
+            raise ValueError("يجب أن تكون البيانات قائمة من العلامات.")
+        number = _backend.replace_student_marks(user_id, marks)
+        profiles.update_numbers({number: {'marks': _stored_marks(marks)}})
+        return True
+    except (json.JSONDecodeError, ValueError, *_backend.errors) as e:
+        logger.error(f"Admin failed to set marks for {user_id}: {e}")
+        return False
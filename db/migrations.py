@@ -0,0 +1,297 @@
+# db/migrations.py
+
+"""
+ترحيلات مخطط قاعدة بيانات SQLite (ترحيلات PostgreSQL في db/backends/postgres.py).
+رقم إصدار المخطط يُخزن في PRAGMA user_version، وعند كل تشغيل تُطبق الترحيلات الأحدث منه بالترتيب
+داخل معاملة الكاتب. كل ترحيل دالة تأخذ الاتصال، ولا يُعدل ترحيل قديم بعد نشره؛ أي تغيير جديد يُضاف كترحيل جديد.
+قواعد البيانات التي أُنشئت قبل نظام الترحيلات (الإصدار 0) تمر على كل الترحيلات، لذا الترحيلات الأولى متسامحة
+مع وجود الجداول والأعمدة مسبقًا.
+"""
+
+import json
+import time
+import zlib
+
+from core.config import logger
+from .backends.base import (
+    HAS_NUMBERS_FOR_CHECK_SQL, MARK_FIELDS, NUMBER_SUBSCRIBERS_SQL, claim_numbers_sql, number_shard_key,
+)
+
+
+def _columns(conn, table):
+    return {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn, table, column, declaration):
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def _create_users(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,                -- Telegram User ID
+            college_id TEXT,                       -- معرف الكلية
+            university_id TEXT,                    -- الرقم الجامعي
+            student_info TEXT,                     -- معلومات الطالب (JSON)
+            last_known_marks TEXT,                 -- (قديم) العلامات كـ JSON، تُنقل إلى جدول marks
+            notifications_enabled INTEGER DEFAULT 1 -- تفعيل/تعطيل الإشعارات
+        );
+    """)
+
+
+def _add_marks_hash(conn):
+    # بصمة آخر صفحة نتائج تم تحليلها
+    _add_column(conn, "users", "marks_hash", "TEXT")
+
+
+def _create_marks(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS marks (
+            id INTEGER PRIMARY KEY,
+            college_id TEXT NOT NULL,              -- معرف الكلية
+            university_id TEXT NOT NULL,           -- الرقم الجامعي
+            subject TEXT NOT NULL,
+            session TEXT NOT NULL,
+            mark TEXT NOT NULL,
+            status TEXT NOT NULL,
+            date TEXT NOT NULL,
+            semester TEXT NOT NULL,
+            first_seen TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP, -- أول مرة ظهرت فيها العلامة
+            UNIQUE (college_id, university_id, subject, session, mark, status, date, semester)
+        );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_marks_number_date ON marks (college_id, university_id, date)")
+    _migrate_json_marks(conn)
+
+
+def _migrate_json_marks(conn):
+    """نقل العلامات المخزنة كـ JSON في users.last_known_marks إلى جدول marks."""
+    insert_sql = f"""
+        INSERT OR IGNORE INTO marks (college_id, university_id, {", ".join(MARK_FIELDS)})
+        VALUES (?, ?, {", ".join("?" for _ in MARK_FIELDS)})
+    """
+    rows = conn.execute("""
+        SELECT id, college_id, university_id, last_known_marks FROM users
+        WHERE last_known_marks IS NOT NULL AND university_id IS NOT NULL
+    """).fetchall()
+    for row in rows:
+        try:
+            marks = json.loads(row['last_known_marks'])
+        except json.JSONDecodeError:
+            logger.warning(f"تعذر نقل علامات المستخدم {row['id']}: JSON غير صالح.")
+            continue
+        conn.executemany(insert_sql, [
+            (row['college_id'], row['university_id'], *(str(m.get(field, '')) for field in MARK_FIELDS))
+            for m in marks
+        ])
+        conn.execute("UPDATE users SET last_known_marks = NULL WHERE id = ?", (row['id'],))
+    if rows:
+        logger.info(f"تم نقل علامات {len(rows)} مستخدم إلى جدول marks.")
+
+
+def _add_last_checked_at(conn):
+    # آخر فحص ناجح للرقم في الفحص الدوري
+    _add_column(conn, "users", "last_checked_at", "TEXT")
+
+
+def _add_users_indexes(conn):
+    # فهرس جزئي يغطي استعلام الفحص الدوري بالكامل (keyset على id) ويحتوي المشتركين فقط
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_check
+        ON users (id, college_id, university_id, marks_hash)
+        WHERE university_id IS NOT NULL AND notifications_enabled = 1
+    """)
+    # البحث عن المستخدمين المتابعين لرقم جامعي (الإشعارات وتحديث البصمة)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_number ON users (university_id, college_id)")
+
+
+def _add_default_search_college(conn):
+    # الكلية الافتراضية للبحث المؤقت والإضافة (الإعدادات)
+    _add_column(conn, "users", "default_search_college", "TEXT")
+
+
+def _add_saved_numbers(conn):
+    # الأرقام التي يحفظها المستخدم من الإعدادات (إضافة لرقمه الأساسي في users)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS saved_numbers (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,              -- Telegram User ID
+            alias TEXT NOT NULL,                   -- الاسم المستعار
+            college_id TEXT NOT NULL,
+            university_id TEXT NOT NULL,
+            notifications_enabled INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, college_id, university_id)
+        );
+    """)
+    # متابعو رقم معين (الإشعارات والفحص الدوري)؛ البحث حسب المستخدم يستخدم قيد UNIQUE أعلاه
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_saved_numbers_number ON saved_numbers (college_id, university_id)
+        WHERE notifications_enabled = 1
+    """)
+    # رقم جامعي واحد لكل صف مهما كان عدد متابعيه: البصمة ووقت آخر فحص تنتقل إليه من users
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS numbers (
+            college_id TEXT NOT NULL,
+            university_id TEXT NOT NULL,
+            marks_hash TEXT,                       -- بصمة آخر صفحة نتائج تم تحليلها
+            last_checked_at TEXT,                  -- آخر فحص ناجح في الفحص الدوري
+            PRIMARY KEY (college_id, university_id)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO numbers (college_id, university_id, marks_hash, last_checked_at)
+        SELECT college_id, university_id, MAX(marks_hash), MAX(last_checked_at) FROM users
+        WHERE university_id IS NOT NULL AND college_id IS NOT NULL
+        GROUP BY college_id, university_id
+    """)
+    conn.execute("UPDATE users SET marks_hash = NULL, last_checked_at = NULL")
+    # الفحص الدوري لم يعد يمر على users
+    conn.execute("DROP INDEX IF EXISTS idx_users_check")
+
+
+def _add_publication_events(conn):
+    # سجل اكتشاف علامات جديدة لكل كلية وفصل، ومنه تُحسب مدة الفحص الدوري لكل كلية
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS publication_events (
+            id INTEGER PRIMARY KEY,
+            college_id TEXT NOT NULL,
+            semester TEXT NOT NULL,
+            detected_at TEXT NOT NULL,             -- وقت الاكتشاف (ISO 8601 بتوقيت UTC)
+            numbers_count INTEGER NOT NULL         -- عدد الأرقام التي ظهرت لها علامات جديدة
+        );
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_publication_events_college ON publication_events (college_id, detected_at)"
+    )
+
+
+def _add_sweep_queue(conn):
+    # جدول numbers هو طابور الفحص الدوري: موعد الفحص التالي وحجز العامل الذي يفحص الرقم الآن
+    # وعدد المحاولات الفاشلة المتتالية وآخر خطأ. الأوقات هنا بالثواني منذ epoch (UTC) لتسهيل الحساب في الاستعلامات
+    _add_column(conn, "numbers", "next_check_at", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "numbers", "lease_owner", "TEXT")
+    _add_column(conn, "numbers", "lease_expires_at", "INTEGER")
+    _add_column(conn, "numbers", "attempts", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "numbers", "last_error", "TEXT")
+    # توزيع الأرقام الموجودة على الساعة القادمة حتى لا تُفحص كلها في أول دورة
+    now = int(time.time())
+    conn.executemany(
+        "UPDATE numbers SET next_check_at = ? WHERE college_id = ? AND university_id = ?",
+        [
+            (now + zlib.crc32(f"{row['college_id']}:{row['university_id']}".encode()) % 3600,
+             row['college_id'], row['university_id'])
+            for row in conn.execute("SELECT college_id, university_id FROM numbers").fetchall()
+        ]
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_numbers_next_check ON numbers (next_check_at)")
+
+
+def _add_shard_key(conn):
+    # مفتاح ثابت لكل رقم تُقسم به الأرقام على عمليات الفحص المنفصلة (shard = shard_key % عدد الأجزاء)
+    _add_column(conn, "numbers", "shard_key", "INTEGER NOT NULL DEFAULT 0")
+    conn.executemany(
+        "UPDATE numbers SET shard_key = ? WHERE college_id = ? AND university_id = ?",
+        [
+            (number_shard_key(row['college_id'], row['university_id']), row['college_id'], row['university_id'])
+            for row in conn.execute("SELECT college_id, university_id FROM numbers").fetchall()
+        ]
+    )
+
+
+def _create_notifications_outbox(conn):
+    # العلامات الجديدة التي اكتشفتها عمليات الفحص المنفصلة، بانتظار أن ترسلها عملية البوت لمتابعي الرقم
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notifications_outbox (
+            id INTEGER PRIMARY KEY,
+            college_id TEXT NOT NULL,
+            university_id TEXT NOT NULL,
+            new_marks TEXT NOT NULL,               -- العلامات الجديدة (JSON)
+            created_at TEXT NOT NULL               -- وقت الاكتشاف (ISO 8601 بتوقيت UTC)
+        );
+    """)
+
+
+def _add_marks_loaded(conn):
+    # هل حُملت علامات الرقم مرة على الأقل (عند التسجيل أو في فحص ناجح)؛ قبل ذلك لا تُعد علاماته جديدة.
+    # الأرقام الحالية: التي لها علامات مخزنة، أو بصمة مع مستخدم سجّلها (سُجلت علاماته ولو كانت فارغة).
+    # رقم محفوظ له بصمة فقط (من عرض نتائجه) لم تُحمل علاماته
+    _add_column(conn, "numbers", "marks_loaded", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+        UPDATE numbers SET marks_loaded = 1
+        WHERE EXISTS (SELECT 1 FROM marks m WHERE m.college_id = numbers.college_id AND m.university_id = numbers.university_id)
+           OR (marks_hash IS NOT NULL AND EXISTS (
+               SELECT 1 FROM users u WHERE u.college_id = numbers.college_id AND u.university_id = numbers.university_id
+           ))
+    """)
+
+
+# الترتيب هنا هو رقم الإصدار: الترحيل رقم n يرفع user_version إلى n
+MIGRATIONS = (
+    _create_users,
+    _add_marks_hash,
+    _create_marks,
+    _add_last_checked_at,
+    _add_users_indexes,
+    _add_default_search_college,
+    _add_saved_numbers,
+    _add_publication_events,
+    _add_sweep_queue,
+    _add_shard_key,
+    _create_notifications_outbox,
+    _add_marks_loaded,
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def apply_migrations(conn) -> int:
+    """تطبق الترحيلات غير المطبقة داخل المعاملة المفتوحة وتُرجع رقم الإصدار الحالي."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"إصدار مخطط قاعدة البيانات ({version}) أحدث من إصدار الكود ({SCHEMA_VERSION}).")
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        # لا يمكن ربط معاملات PRAGMA، والرقم هنا عدد صحيح من الكود وليس من المستخدم
+        conn.execute(f"PRAGMA user_version = {number}")
+        logger.info(f"تم تطبيق ترحيل قاعدة البيانات رقم {number} ({migration.__name__}).")
+    return SCHEMA_VERSION
+
+
+# استعلامات حساسة للأداء والفهارس التي يجب أن تظهر في خطة كل منها
+EXPECTED_QUERY_PLANS = {
+    "has_numbers_for_check": (
+        HAS_NUMBERS_FOR_CHECK_SQL, (), ("idx_users_number", "idx_saved_numbers_number"),
+    ),
+    "claim_numbers": (
+        claim_numbers_sql(by_college=False), ("", 0, 0, 0, 1),
+        ("idx_numbers_next_check", "idx_users_number", "idx_saved_numbers_number"),
+    ),
+    "number_subscribers": (
+        NUMBER_SUBSCRIBERS_SQL, ("", "", "", ""), ("idx_users_number", "idx_saved_numbers_number"),
+    ),
+    "last_publications": (
+        "SELECT college_id, MAX(detected_at) FROM publication_events GROUP BY college_id",
+        (), ("COVERING INDEX idx_publication_events_college",),
+    ),
+    "number_marks": (
+        "SELECT id FROM marks WHERE college_id = ? AND university_id = ? ORDER BY date DESC",
+        ("", ""), ("idx_marks_number_date",),
+    ),
+}
+
+
+def check_query_plans(conn) -> list:
+    """
+    تتحقق عبر EXPLAIN QUERY PLAN أن الاستعلامات الحساسة تستخدم فهارسها المتوقعة،
+    وتُرجع قائمة بأسماء الاستعلامات التي لم تستخدمها (مع تحذير في السجل لكل منها).
+    """
+    regressions = []
+    for name, (sql, params, indexes) in EXPECTED_QUERY_PLANS.items():
+        plan = " | ".join(row['detail'] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        missing = [index for index in indexes if index not in plan]
+        if missing:
+            regressions.append(name)
+            logger.warning(f"الاستعلام {name} لا يستخدم الفهرس {', '.join(missing)} كما هو متوقع: {plan}")
+    return regressions
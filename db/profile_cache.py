@@ -0,0 +1,137 @@
+# db/profile_cache.py
+
+import threading
+from collections import Counter, defaultdict
+
+from cachetools import TTLCache
+
+from core.config import PROFILE_CACHE_MAX_BYTES, PROFILE_CACHE_TTL_SECONDS
+
+
+def _estimate_size(profile: dict) -> int:
+    """تقدير تقريبي لحجم الملف الشخصي بالبايت (النصوص + كلفة ثابتة لكل كائن)."""
+    size = 256 + sum(len(str(value)) for key, value in profile.items() if key not in ('student_info', 'marks'))
+    size += sum(64 + len(str(k)) + len(str(v)) for k, v in (profile.get('student_info') or {}).items())
+    for mark in profile.get('marks') or ():
+        size += 128 + sum(len(v) for v in mark.values())
+    return size
+
+
+class ProfileCache:
+    """
+    ذاكرة مؤقتة للملفات الشخصية للمستخدمين: صف users مع student_info مفكوكًا من JSON،
+    وعلامات الرقم الجامعي (مفتاح marks) بعد أول تحميل لها.
+    - LRU مع مدة صلاحية (ttl) وحد أقصى للحجم بالبايت (max_bytes) وليس لعدد المستخدمين.
+    - التحديث عند الكتابة (write-through): دوال قاعدة البيانات تحدث الملفات المخزنة بدل حذفها.
+    - رقم الجيل يمنع تخزين قراءة بدأت قبل كتابة انتهت أثناءها.
+    آمنة للاستخدام من عدة خيوط.
+    """
+    def __init__(self, max_bytes: int = PROFILE_CACHE_MAX_BYTES, ttl: float = PROFILE_CACHE_TTL_SECONDS):
+        # القيمة المخزنة (profile, size) والحجم يُحسب مرة واحدة عند التخزين
+        self._cache = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda entry: entry[1])
+        self._lock = threading.Lock()
+        # فهرس (college_id, university_id) -> معرفات المستخدمين، حتى لا تمر تحديثات الرقم على كل الذاكرة.
+        # قد يحوي معرفات خرجت من الذاكرة؛ تُحذف عند المرور عليها ويُعاد بناؤه إذا تضخم
+        self._by_number = defaultdict(set)
+        self._indexed = 0
+        self.generation = 0
+        self.stats = Counter()
+
+    def get(self, user_id: int) -> dict | None:
+        """نسخة من الملف الشخصي المخزن أو None، مع تسجيل الإصابة/الإخفاق."""
+        with self._lock:
+            entry = self._cache.get(user_id)
+            self.stats['hits' if entry else 'misses'] += 1
+        return self._copy(entry[0]) if entry else None
+
+    def put(self, profile: dict, generation: int) -> None:
+        """تخزين ملف قُرئ من قاعدة البيانات، إلا إذا حدثت كتابة منذ بدء القراءة (generation)."""
+        with self._lock:
+            if generation == self.generation:
+                self._store(profile['id'], profile)
+
+    def update_user(self, user_id: int, **fields) -> None:
+        """تحديث حقول ملف مستخدم مخزن (إن وُجد) بعد كتابتها في قاعدة البيانات."""
+        with self._lock:
+            self.generation += 1
+            entry = self._cache.get(user_id)
+            if entry:
+                self._store(user_id, {**entry[0], **fields})
+
+    def update_numbers(self, updates: dict) -> None:
+        """
+        تحديث الملفات المخزنة لكل المستخدمين المتابعين لأرقام جامعية (عبر فهرس الأرقام، دون المرور على كل الذاكرة).
+        updates: {(college_id, university_id): {field: value}}
+        """
+        if not updates:
+            return
+        with self._lock:
+            self.generation += 1
+            for number, fields in updates.items():
+                user_ids = self._by_number.get(number)
+                if not user_ids:
+                    continue
+                for user_id in list(user_ids):
+                    entry = self._cache.get(user_id)
+                    if entry and (entry[0]['college_id'], entry[0]['university_id']) == number:
+                        self._store(user_id, {**entry[0], **fields})
+                    else:
+                        user_ids.discard(user_id)
+                        self._indexed -= 1
+                if not user_ids:
+                    del self._by_number[number]
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            self._cache.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._cache.clear()
+            self._by_number.clear()
+            self._indexed = 0
+
+    def metrics(self) -> dict:
+        """إحصائيات الاستخدام: الإصابات والإخفاقات ونسبة الإصابة وعدد الملفات والحجم المستخدم."""
+        with self._lock:
+            hits, misses = self.stats['hits'], self.stats['misses']
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "entries": len(self._cache),
+                "bytes": self._cache.currsize,
+                "max_bytes": self._cache.maxsize,
+            }
+
+    def _store(self, user_id, profile):
+        profile = self._copy(profile)
+        size = _estimate_size(profile)
+        if size > self._cache.maxsize:
+            self._cache.pop(user_id, None)
+            return
+        self._cache[user_id] = (profile, size)
+        user_ids = self._by_number[(profile['college_id'], profile['university_id'])]
+        if user_id not in user_ids:
+            user_ids.add(user_id)
+            self._indexed += 1
+            if self._indexed > 2 * len(self._cache) + 64:
+                self._rebuild_index()
+
+    def _rebuild_index(self):
+        self._by_number.clear()
+        for user_id, (profile, _) in self._cache.items():
+            self._by_number[(profile['college_id'], profile['university_id'])].add(user_id)
+        self._indexed = len(self._cache)
+
+    @staticmethod
+    def _copy(profile: dict) -> dict:
+        # نسخ سطحي عند التخزين والإرجاع: المستدعون لا يعدلون العلامات نفسها، لكن قد يضيفون مفاتيح أو يعيدون ترتيب القوائم
+        copy = dict(profile)
+        if copy.get('student_info') is not None:
+            copy['student_info'] = dict(copy['student_info'])
+        if copy.get('marks') is not None:
+            copy['marks'] = list(copy['marks'])
+        return copy
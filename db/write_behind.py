@@ -0,0 +1,133 @@
+# db/write_behind.py
+
+import asyncio
+from datetime import datetime, timezone
+
+from core.config import WRITE_BEHIND_MAX_ITEMS, WRITE_BEHIND_MAX_DELAY_SECONDS, logger
+from . import async_database as adb
+
+
+class SweepWriteBuffer:
+    """
+    مخزن كتابة مؤجلة (write-behind) لتحديثات الفحص الدوري.
+    يجمع العلامات والبصمات وأوقات آخر فحص وموعد الفحص التالي (أو الفشل وموعد إعادة المحاولة) لكل رقم جامعي، ويكتبها دفعة واحدة
+    في معاملة واحدة عند بلوغ max_items رقمًا أو بعد max_delay ثانية من أول تحديث معلّق.
+    لكل رقم تُحفظ آخر قيمة فقط، لذا تكرار فحص نفس الرقم لا يضاعف الكتابة.
+    """
+    def __init__(self, max_items: int = WRITE_BEHIND_MAX_ITEMS, max_delay: float = WRITE_BEHIND_MAX_DELAY_SECONDS):
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self._marks: dict[tuple, list] = {}
+        self._hashes: dict[tuple, str] = {}
+        self._checked: dict[tuple, tuple] = {}
+        self._failed: dict[tuple, tuple] = {}
+        # أرقام تُرسل علاماتها الجديدة لمتابعيها عبر عملية البوت (عمليات الفحص المنفصلة فقط)
+        self._notify: set[tuple] = set()
+        # العلامات التي تُكتب الآن: تبقى مرئية لـ pending_marks حتى تُثبَّت المعاملة
+        self._inflight: dict[tuple, list] = {}
+        self._flush_lock = asyncio.Lock()
+        self._delayed_flush: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._checked.keys() | self._failed.keys() | self._marks.keys() | self._hashes.keys())
+
+    def pending_marks(self, college_id: str, university_id: str) -> list | None:
+        """آخر علامات معلّقة لرقم (لم تُثبَّت بعد في قاعدة البيانات)، أو None."""
+        key = (college_id, university_id)
+        if key in self._marks:
+            return self._marks[key]
+        return self._inflight.get(key)
+
+    async def record(self, college_id: str, university_id: str, marks: list | None = None, marks_hash: str | None = None,
+                     next_check_at: int | None = None, notify: bool = False):
+        """
+        تسجيل نتيجة فحص ناجح لرقم: وقت الفحص دائمًا، والعلامات والبصمة وموعد الفحص التالي
+        (بالثواني منذ epoch) إن وُجدت. مع notify تُسجل العلامات التي تضيفها الكتابة فعلًا في notifications_outbox
+        في نفس المعاملة.
+        """
+        key = (college_id, university_id)
+        self._failed.pop(key, None)
+        self._checked[key] = (datetime.now(timezone.utc).isoformat(timespec="seconds"), next_check_at)
+        if marks is not None:
+            self._marks[key] = marks
+        if marks_hash is not None:
+            self._hashes[key] = marks_hash
+        if notify:
+            self._notify.add(key)
+        await self._schedule_flush()
+
+    async def record_failure(self, college_id: str, university_id: str, error: str, next_check_at: int):
+        """تسجيل فشل فحص رقم مع سبب الفشل وموعد إعادة المحاولة (بالثواني منذ epoch)."""
+        key = (college_id, university_id)
+        self._checked.pop(key, None)
+        self._failed[key] = (error, next_check_at)
+        await self._schedule_flush()
+
+    async def _schedule_flush(self):
+        if len(self) >= self.max_items:
+            await self.flush()
+        elif self._delayed_flush is None:
+            self._delayed_flush = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.max_delay)
+        except asyncio.CancelledError:
+            return
+        self._delayed_flush = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # التحديثات أُعيدت إلى المخزن؛ تُعاد المحاولة بعد max_delay بدل انتظار تحديث جديد أو إيقاف العملية
+            logger.error(f"فشلت كتابة دفعة تحديثات الفحص الدوري، ستُعاد المحاولة: {e}", exc_info=True)
+            if len(self) and self._delayed_flush is None:
+                self._delayed_flush = asyncio.create_task(self._flush_later())
+
+    def _take_pending(self):
+        self._inflight = self._marks
+        marks = [(c, u, m) for (c, u), m in self._marks.items()]
+        hashes = [(h, c, u) for (c, u), h in self._hashes.items()]
+        checked = [(t, n, c, u) for (c, u), (t, n) in self._checked.items()]
+        failed = [(e, n, c, u) for (c, u), (e, n) in self._failed.items()]
+        notify = self._notify
+        self._marks, self._hashes, self._checked, self._failed, self._notify = {}, {}, {}, {}, set()
+        return marks, hashes, checked, failed, notify
+
+    async def flush(self) -> None:
+        """كتابة كل التحديثات المعلّقة الآن في معاملة واحدة."""
+        if self._delayed_flush is not None and self._delayed_flush is not asyncio.current_task():
+            self._delayed_flush.cancel()
+            self._delayed_flush = None
+        async with self._flush_lock:
+            if not len(self):
+                return
+            marks, hashes, checked, failed, notify = self._take_pending()
+            try:
+                await adb.apply_sweep_updates(marks, hashes, checked, failed, notify)
+            except Exception:
+                # إعادة التحديثات إلى المخزن (دون الكتابة فوق ما وصل بعدها) لمحاولة لاحقة
+                self._restore(marks, hashes, checked, failed, notify)
+                raise
+            finally:
+                self._inflight = {}
+            logger.info(
+                f"تمت كتابة دفعة تحديثات الفحص الدوري ({len(checked)} رقم، {len(marks)} منها بعلامات، "
+                f"و{len(failed)} فحص فاشل)."
+            )
+
+    def _restore(self, marks, hashes, checked, failed, notify):
+        for c, u, m in marks:
+            self._marks.setdefault((c, u), m)
+        for h, c, u in hashes:
+            self._hashes.setdefault((c, u), h)
+        for t, n, c, u in checked:
+            if (c, u) not in self._failed:
+                self._checked.setdefault((c, u), (t, n))
+        for e, n, c, u in failed:
+            if (c, u) not in self._checked:
+                self._failed.setdefault((c, u), (e, n))
+        self._notify |= notify
+
+
+# الدفعة الأخيرة تُكتب عند الإيقاف قبل إغلاق قاعدة البيانات (on_shutdown في main.py و run_worker في sweep_worker.py)
+sweep_writes = SweepWriteBuffer()
@@ -4,9 +4,12 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup # <-- ت
 from telegram.ext import ContextTypes, ConversationHandler, filters
 from telegram.constants import ParseMode
 import json
+from datetime import datetime
 
 from core.config import ADMIN_ID, logger
-import db.database as db
+import db.async_database as db
+from services.scraper_service import get_scraper
+from services.scheduler import PRIORITY_LABELS
 from .constants import ADMIN_AWAIT_TARGET_USER_ID, ADMIN_AWAIT_MARKS_JSON
 
 # فلتر للتحقق مما إذا كان المستخدم هو المشرف
@@ -19,10 +22,59 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     
     rows = [
         [InlineKeyboardButton("✍️ تعديل نتائج مستخدم", callback_data="admin_set_marks_start")],
+        [InlineKeyboardButton("🩺 حالة خادم الجامعة", callback_data="admin_upstream_status")],
         [InlineKeyboardButton("⬅️ رجوع", callback_data="main_menu")]
     ]
     keyboard = InlineKeyboardMarkup(rows) # <-- الآن هذا السطر سيعمل بشكل صحيح
-    await query.message.edit_text("<b>🛠️ لوحة تحكم المشرف</b>", parse_mode=ParseMode.HTML, reply_markup=keyboard)
+    cache = await db.get_profile_cache_metrics()
+    text = (
+        "<b>🛠️ لوحة تحكم المشرف</b>\n\n"
+        f"<b>ذاكرة الملفات الشخصية:</b> {cache['entries']} مستخدم، "
+        f"{cache['bytes'] // 1024} من {cache['max_bytes'] // 1024} KiB\n"
+        f"إصابات {cache['hits']} / إخفاقات {cache['misses']} ({cache['hit_rate']:.0%})"
+    )
+    await query.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+
+
+BREAKER_STATE_LABELS = {"closed": "🟢 يعمل", "open": "🔴 متوقف مؤقتًا", "half_open": "🟡 تجربة التعافي"}
+
+async def admin_upstream_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """يعرض حالة قاطع الدائرة ومحدد المعدل وجدولة الطلبات وإحصائياتها لخادم الجامعة."""
+    query = update.callback_query
+    # CallbackQueryHandler لا يقبل admin_filter، لذا يتم التحقق من المشرف هنا
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer("هذه الميزة للمشرف فقط.", show_alert=True)
+        return
+    await query.answer()
+
+    scraper = get_scraper(context)
+    status = scraper.upstream.snapshot()
+    scheduling = scraper.scheduler.snapshot()
+    text = (
+        "<b>🩺 حالة خادم الجامعة</b>\n\n"
+        f"<b>الحالة:</b> {BREAKER_STATE_LABELS[status['state']]}\n"
+        f"إخفاقات متتالية: {status['consecutive_failures']}\n"
+    )
+    if status['state'] == "open":
+        text += f"إعادة المحاولة بعد: {status['retry_after']:.0f} ثانية\n"
+    text += (
+        f"معدل الطلبات الحالي: {status['rate']:.1f} من {status['max_rate']:.1f} طلب/ثانية\n\n"
+        f"ناجحة {status.get('successes', 0)}، فاشلة {status.get('failures', 0)}، بطيئة {status.get('slow_calls', 0)}\n"
+        f"مرات الفتح {status.get('opened', 0)}، مرفوضة فورًا {status.get('rejected', 0)}، تجريبية {status.get('probes', 0)}\n"
+        f"طلبات النتائج {scraper.stats['result_fetches']}، من الذاكرة المؤقتة {scraper.stats['result_cache_hits']}\n\n"
+        f"<b>جدولة الطلبات</b> (حد أقصى {scheduling['max_concurrency']} متزامن):\n"
+    )
+    for priority, stats in scheduling['classes'].items():
+        text += (
+            f"• {PRIORITY_LABELS[priority]}: جارية {stats['active']}/{stats['quota']}، منتظرة {stats['waiting']}، "
+            f"p95 للانتظار {stats['p95_wait']:.2f} ث\n"
+        )
+    text += f"\n<i>آخر تحديث: {datetime.now():%H:%M:%S}</i>"
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔄 تحديث", callback_data="admin_upstream_status")],
+        [InlineKeyboardButton("⬅️ رجوع", callback_data="admin_panel")],
+    ])
+    await query.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
 
 
 async def start_set_marks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -41,7 +93,7 @@ async def target_user_id_received(update: Update, context: ContextTypes.DEFAULT_
         return ADMIN_AWAIT_TARGET_USER_ID
 
     context.user_data['admin_target_user_id'] = target_user_id
-    last_marks_json = db.admin_get_last_marks(target_user_id)
+    last_marks_json = await db.admin_get_last_marks(target_user_id)
 
     if not last_marks_json:
         await update.message.reply_text(f"لم يتم العثور على المستخدم {target_user_id} أو ليس لديه نتائج مخزنة.")
@@ -78,7 +130,7 @@ async def marks_json_received(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("خطأ في تنسيق JSON. يرجى إعادة المحاولة.")
         return ADMIN_AWAIT_MARKS_JSON
         
-    if db.admin_set_last_marks(target_user_id, marks_json_string):
+    if await db.admin_set_last_marks(target_user_id, marks_json_string):
         await update.message.reply_text(f"✅ تم تحديث نتائج المستخدم {target_user_id} بنجاح.")
     else:
         await update.message.reply_text(f"❌ فشل تحديث نتائج المستخدم {target_user_id}.")
@@ -1,17 +1,24 @@
 # handlers/main_handlers.py
 
-import json
+from collections import Counter
+
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode, ChatAction
 
-import db.database as db
-from services.scraper_service import ScraperService
+from core.config import MANUAL_CHECK_MAX_STALENESS_SECONDS
+import db.async_database as db
+from db.write_behind import sweep_writes
+from services.scraper_service import get_scraper
+from services.notifications import notify_new_marks
+from services.sweep_planner import count_publications
 from utils.formatting import build_main_menu, format_new_marks_message, display_results_page
 from utils.decorators import rate_limit
 from .constants import PAGING_RESULTS
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # الكتابة الوحيدة عند أول تواصل؛ باقي عرض القوائم قراءة فقط
+    await db.ensure_user(update.effective_user.id)
     await show_main_menu(update, context)
 
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, message_to_replace=None) -> None:
@@ -20,7 +27,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, mes
         await query.answer()
 
     user_id = update.effective_user.id
-    user_data = db.get_user_data(user_id)
+    user_data = await db.get_user_data(user_id) or await db.ensure_user(user_id)
     text, keyboard = build_main_menu(user_data)
 
     target_message = message_to_replace or (query.message if query else update.message)
@@ -36,17 +43,17 @@ async def show_all_my_results(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.message.edit_text("🔍 جارٍ تحميل نتائجك المخزنة...")
     
     user_id = update.effective_user.id
-    user_data = db.get_user_data(user_id)
+    user_data = await db.get_user_data(user_id) or await db.ensure_user(user_id)
     
-    all_marks = json.loads(user_data.get('last_known_marks', '[]'))
-    student_info = json.loads(user_data.get('student_info', '{}'))
+    # العلامات مرتبة مسبقًا (الأحدث أولاً) ومحفوظة في الملف الشخصي بعد أول تحميل
+    all_marks = await db.get_user_marks(user_id)
     
     # تجهيز البيانات للعرض
     context.user_data.update({
-        'student_info': student_info,
+        'student_info': user_data.get('student_info') or {},
         'university_id': user_data.get('university_id'),
         'full_marks_unfiltered': all_marks,
-        'marks_to_display': sorted(all_marks, key=lambda x: x.get('date', ''), reverse=True),
+        'marks_to_display': all_marks,
         'page': 0
     })
     
@@ -60,37 +67,48 @@ async def check_new_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.message.edit_text("🔄 جاري التحقق من موقع الجامعة...")
 
     user_id = update.effective_user.id
-    user_data = db.get_user_data(user_id)
+    user_data = await db.get_user_data(user_id) or await db.ensure_user(user_id)
     
     college_id = user_data.get('college_id')
     university_id = user_data.get('university_id')
-    old_marks = json.loads(user_data.get('last_known_marks', '[]'))
+    if not university_id:
+        # زر من رسالة قديمة لمستخدم لم يسجل رقمه (أو حذف بياناته)
+        await query.message.edit_text("⚠️ لم تسجل رقمك الجامعي بعد.", reply_markup=build_main_menu(user_data)[1])
+        return
 
-    scraper = ScraperService()
-    _, token = scraper.fetch_colleges_and_token()
+    scraper = get_scraper(context)
+    _, token = await scraper.fetch_colleges_and_token()
     if not token:
         await query.message.edit_text("⚠️ خطأ في الاتصال بالخادم. يرجى المحاولة لاحقًا.", reply_markup=build_main_menu(user_data)[1])
         return
 
-    result = scraper.fetch_full_student_data(college_id, university_id, token)
+    # الفحص اليدوي يقبل فقط نتيجة جُلبت قبل ثوانٍ (مثلاً من ضغطة سابقة أو من متابع آخر لنفس الرقم)
+    result = await scraper.fetch_full_student_data(
+        college_id, university_id, token, max_staleness=MANUAL_CHECK_MAX_STALENESS_SECONDS
+    )
 
     if not result.get('success'):
         await query.message.edit_text(f"⚠️ {result.get('error')}", reply_markup=build_main_menu(user_data)[1])
         return
 
-    new_marks_list = scraper.find_new_marks(old_marks, result['marks'])
+    # تثبيت ما جمعه الفحص الدوري أولاً حتى لا تُعتبر علامات أُبلغ عنها للتو جديدةً مرة أخرى
+    await sweep_writes.flush()
+    new_marks_list = await db.record_student_marks(college_id, university_id, result['marks'])
+    await db.update_number_marks_hash(college_id, university_id, result['fingerprint'])
 
     if new_marks_list:
-        db.update_user_marks(user_id, result['marks'])
+        await db.record_publication_events(count_publications(Counter(), college_id, new_marks_list))
+        # المتابعون الآخرون لنفس الرقم لن يكتشفوا هذه العلامات في الفحص الدوري، لذا نُعلمهم الآن
+        await notify_new_marks(context.bot, college_id, university_id, new_marks_list, exclude_user_id=user_id)
         response_text = format_new_marks_message(new_marks_list, "🎉 تم العثور على نتائج جديدة!")
-        await query.message.edit_text(response_text, parse_mode=ParseMode.HTML, reply_markup=build_main_menu(db.get_user_data(user_id))[1])
+        await query.message.edit_text(response_text, parse_mode=ParseMode.HTML, reply_markup=build_main_menu(await db.get_user_data(user_id))[1])
     else:
         await query.message.edit_text("✅ لا توجد نتائج جديدة. بياناتك محدّثة.", reply_markup=build_main_menu(user_data)[1])
 
 async def toggle_notifications_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     user_id = update.effective_user.id
-    new_status = db.toggle_notifications(user_id)
+    new_status = await db.toggle_notifications(user_id)
     await query.answer(f"أصبحت الإشعارات التلقائية {' مفعلة' if new_status else 'متوقفة'}", show_alert=True)
     await show_main_menu(update, context)
 
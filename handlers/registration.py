@@ -5,8 +5,10 @@ from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode, ChatAction
 
 from core.config import logger
-import db.database as db
-from services.scraper_service import ScraperService
+import db.async_database as db
+from services.scraper_service import get_scraper
+from services.scheduler import Priority
+from services.notifications import notify_new_marks
 from .constants import AWAIT_COLLEGE, AWAIT_UNIVERSITY_ID
 
 async def register_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -14,8 +16,8 @@ async def register_start(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     await query.answer()
 
-    scraper = ScraperService()
-    colleges, _ = scraper.fetch_colleges_and_token()
+    scraper = get_scraper(context)
+    colleges, _ = await scraper.fetch_colleges_and_token()
     if not colleges:
         await query.message.edit_text("خطأ في الاتصال بخادم الجامعة. لا يمكن التسجيل حاليًا.")
         return ConversationHandler.END
@@ -62,26 +64,30 @@ async def university_id_received(update: Update, context: ContextTypes.DEFAULT_T
     user_id = update.effective_user.id
     college_id = context.user_data['reg_college_id']
     
-    scraper = ScraperService()
-    _, token = scraper.fetch_colleges_and_token()
+    scraper = get_scraper(context)
+    _, token = await scraper.fetch_colleges_and_token()
     if not token:
         await processing_message.edit_text("خطأ: لا يمكن الاتصال بخادم الجامعة حاليًا.")
         return ConversationHandler.END
 
-    result = scraper.fetch_full_student_data(college_id, university_id, token)
+    result = await scraper.fetch_full_student_data(college_id, university_id, token, priority=Priority.REGISTRATION)
     
     if not result.get('success'):
         await processing_message.edit_text(f"⚠️ فشل التحقق: {result.get('error', 'حدث خطأ غير معروف.')}")
         return ConversationHandler.END
 
     # حفظ البيانات في قاعدة البيانات
-    db.save_user_number_and_results(
+    new_marks = await db.save_user_number_and_results(
         user_id=user_id,
         college_id=college_id,
         university_id=university_id,
         student_info=result['info'],
-        marks=result['marks']
+        marks=result['marks'],
+        marks_hash=result['fingerprint']
     )
+    if new_marks:
+        # إذا كان الرقم متابعًا من مستخدمين آخرين فهذه العلامات جديدة عليهم أيضًا
+        await notify_new_marks(context.bot, college_id, university_id, new_marks, exclude_user_id=user_id)
     
     name = result.get('info', {}).get('name', '')
     await processing_message.edit_text(
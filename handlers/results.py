@@ -4,9 +4,9 @@ from telegram import Update, InlineKeyboardButton
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode, ChatAction
 
-from core.config import logger
-import db.database as db
-from services.scraper_service import ScraperService
+from core.config import MANUAL_CHECK_MAX_STALENESS_SECONDS, logger
+import db.async_database as db
+from services.scraper_service import get_scraper
 from utils.formatting import build_keyboard, display_results_page
 from .constants import (
     AWAIT_SAVED_NUMBER_CHOICE, PAGING_RESULTS, AWAIT_SEMESTER_FILTER, AWAIT_GPA_YEAR
@@ -20,7 +20,7 @@ async def my_results_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await query.answer()
     user_id = update.effective_user.id
     
-    user_numbers = db.get_user_numbers(user_id)
+    user_numbers = await db.get_user_numbers(user_id)
     if not user_numbers:
         rows = [[InlineKeyboardButton("➕ إضافة رقم الآن", callback_data="add_number_start")]]
         await query.message.edit_text(
@@ -48,7 +48,7 @@ async def selected_number_for_results(update: Update, context: ContextTypes.DEFA
     query = update.callback_query
     await query.answer()
     number_id = int(query.data.split('_')[-1])
-    number_info = next((num for num in db.get_user_numbers(query.from_user.id) if num['id'] == number_id), None)
+    number_info = next((num for num in await db.get_user_numbers(query.from_user.id) if num['id'] == number_id), None)
     
     if not number_info:
         await query.message.edit_text("خطأ: لم يتم العثور على الرقم.", reply_markup=build_keyboard([], back_callback="main_menu"))
@@ -64,22 +64,25 @@ async def fetch_and_display_results(update: Update, context: ContextTypes.DEFAUL
     await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
     number_info = context.user_data['number_info']
     
-    scraper = ScraperService()
-    _, token = scraper.fetch_colleges_and_token()
+    scraper = get_scraper(context)
+    _, token = await scraper.fetch_colleges_and_token()
     if not token:
         await message_to_handle.edit_text("خطأ: لا يمكن الاتصال بخادم الجامعة حاليًا.", reply_markup=build_keyboard([], back_callback="main_menu"))
         return ConversationHandler.END
 
-    result = scraper.fetch_full_student_data(number_info['college_id'], number_info['university_id'], token)
+    result = await scraper.fetch_full_student_data(
+        number_info['college_id'], number_info['university_id'], token,
+        max_staleness=MANUAL_CHECK_MAX_STALENESS_SECONDS
+    )
     
     if not result.get('success'):
         await message_to_handle.edit_text(f"⚠️ {result.get('error', 'حدث خطأ غير معروف.')}", reply_markup=build_keyboard([], back_callback="main_menu"))
         return ConversationHandler.END
 
-    # تحديث تجزئة العلامات في قاعدة البيانات
-    new_hash = scraper.generate_marks_hash(result['marks'])
+    # تحديث بصمة صفحة النتائج في قاعدة البيانات
+    new_hash = result['fingerprint']
     if 'id' in number_info: # تأكد من أنه رقم محفوظ وليس بحث مؤقت
-        db.update_marks_hash(number_info['id'], new_hash)
+        await db.update_marks_hash(number_info['id'], new_hash)
 
     # تخزين البيانات في user_data للاستخدام في التصفح والفرز
     context.user_data.update({
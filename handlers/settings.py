@@ -5,8 +5,8 @@ from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 
 from core.config import logger
-import db.database as db
-from services.scraper_service import ScraperService
+import db.async_database as db
+from services.scraper_service import get_scraper
 from utils.formatting import build_keyboard
 from utils.decorators import rate_limit
 from .constants import (
@@ -39,7 +39,7 @@ async def manage_numbers_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
     """يعرض قائمة لإدارة الأرقام المحفوظة."""
     query = update.callback_query
     await query.answer()
-    user_numbers = db.get_user_numbers(query.from_user.id)
+    user_numbers = await db.get_user_numbers(query.from_user.id)
     
     rows = [[InlineKeyboardButton("➕ إضافة رقم جديد", callback_data="add_number_start")]]
     if user_numbers:
@@ -57,7 +57,7 @@ async def delete_number_handler(update: Update, context: ContextTypes.DEFAULT_TY
     """يحذف الرقم المختار بعد التأكيد."""
     query = update.callback_query
     number_id = int(query.data.split('_')[-1])
-    db.delete_saved_number(number_id)
+    await db.delete_saved_number(number_id, query.from_user.id)
     await query.answer("🗑️ تم حذف الرقم بنجاح.", show_alert=True)
     
     # تحديث القائمة بعد الحذف
@@ -71,8 +71,8 @@ async def add_number_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     # تحديد مصدر الطلب (من الإعدادات أو من التوجيه)
     context.user_data['add_number_source'] = "onboarding" if "onboarding" in query.data else "settings"
     
-    scraper = ScraperService()
-    colleges, _ = scraper.fetch_colleges_and_token()
+    scraper = get_scraper(context)
+    colleges, _ = await scraper.fetch_colleges_and_token()
     if not colleges:
         await query.message.edit_text("خطأ في الاتصال بالخادم.", reply_markup=build_keyboard([], back_callback="manage_numbers_menu"))
         return SETTINGS_MANAGE_NUMBERS
@@ -141,7 +141,7 @@ async def add_number_id_received(update: Update, context: ContextTypes.DEFAULT_T
     alias = context.user_data['add_alias']
     college_id = context.user_data['add_college_id']
     
-    db.add_saved_number(user_id, alias, college_id, university_id)
+    await db.add_saved_number(user_id, alias, college_id, university_id)
     
     await last_message.edit_text(
         f"👍 تم حفظ الرقم (<b>{alias}</b>) بنجاح!",
@@ -168,7 +168,7 @@ async def notifications_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """يعرض قائمة الأرقام لتبديل حالة الإشعارات."""
     query = update.callback_query
     await query.answer()
-    user_numbers = db.get_user_numbers(query.from_user.id)
+    user_numbers = await db.get_user_numbers(query.from_user.id)
     
     if not user_numbers:
         await query.message.edit_text("ليس لديك أرقام محفوظة لتفعيل الإشعارات.", reply_markup=build_keyboard([], back_callback="settings_main"))
@@ -191,7 +191,7 @@ async def toggle_notification(update: Update, context: ContextTypes.DEFAULT_TYPE
     """يبدل حالة الإشعار ويعيد تحميل القائمة."""
     query = update.callback_query
     number_id = int(query.data.split('_')[-1])
-    new_status = db.toggle_notification_for_number(number_id)
+    new_status = await db.toggle_notification_for_number(number_id, query.from_user.id)
     status_text = "مفعلة" if new_status else "متوقفة"
     await query.answer(f"✅ أصبحت الإشعارات {status_text} لهذا الرقم.", show_alert=True)
     
@@ -206,8 +206,8 @@ async def set_default_college_menu(update: Update, context: ContextTypes.DEFAULT
     query = update.callback_query
     await query.answer()
     
-    scraper = ScraperService()
-    colleges, _ = scraper.fetch_colleges_and_token()
+    scraper = get_scraper(context)
+    colleges, _ = await scraper.fetch_colleges_and_token()
     if not colleges:
         await query.message.edit_text("خطأ في الاتصال بالخادم.", reply_markup=build_keyboard([], back_callback="settings_main"))
         return SETTINGS_MAIN
@@ -215,7 +215,7 @@ async def set_default_college_menu(update: Update, context: ContextTypes.DEFAULT
     rows = [[InlineKeyboardButton(c['name'], callback_data=f"save_def_college_{c['id']}")] for c in colleges]
     rows.append([InlineKeyboardButton("🚫 إزالة الكلية الافتراضية", callback_data="save_def_college_none")])
     
-    current_default_id = db.get_default_search_college(query.from_user.id)
+    current_default_id = await db.get_default_search_college(query.from_user.id)
     current_college_name = "لا يوجد"
     if current_default_id:
         current_college_name = next((c['name'] for c in colleges if c['id'] == current_default_id), "غير معروفة")
@@ -230,7 +230,7 @@ async def save_default_college(update: Update, context: ContextTypes.DEFAULT_TYP
     college_id = query.data.split('save_def_college_')[-1]
     college_id_to_save = None if college_id == 'none' else college_id
     
-    db.set_default_search_college(query.from_user.id, college_id_to_save)
+    await db.set_default_search_college(query.from_user.id, college_id_to_save)
     await query.answer("✅ تم حفظ الإعداد بنجاح.", show_alert=True)
     
     return await set_default_college_menu(update, context)
\ No newline at end of file
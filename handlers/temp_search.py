@@ -4,7 +4,7 @@ from telegram import Update, InlineKeyboardButton
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode, ChatAction
 
-from services.scraper_service import ScraperService
+from services.scraper_service import get_scraper
 from utils.formatting import build_keyboard, display_results_page
 from utils.decorators import rate_limit
 from .constants import AWAIT_TEMP_COLLEGE, AWAIT_TEMP_ID, PAGING_RESULTS
@@ -13,8 +13,8 @@ async def temp_search_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
 
-    scraper = ScraperService()
-    colleges, _ = scraper.fetch_colleges_and_token()
+    scraper = get_scraper(context)
+    colleges, _ = await scraper.fetch_colleges_and_token()
     if not colleges:
         await query.message.edit_text("خطأ في الاتصال بالخادم.", reply_markup=build_keyboard([], back_callback="main_menu"))
         return ConversationHandler.END
@@ -43,14 +43,14 @@ async def temp_search_id_received(update: Update, context: ContextTypes.DEFAULT_
         await processing_message.edit_text("⚠️ رقم جامعي غير صالح.")
         return AWAIT_TEMP_ID
 
-    scraper = ScraperService()
-    _, token = scraper.fetch_colleges_and_token()
+    scraper = get_scraper(context)
+    _, token = await scraper.fetch_colleges_and_token()
     if not token:
         await processing_message.edit_text("⚠️ خطأ في الاتصال بالخادم.")
         return ConversationHandler.END
 
     college_id = context.user_data['temp_college_id']
-    result = scraper.fetch_full_student_data(college_id, university_id, token)
+    result = await scraper.fetch_full_student_data(college_id, university_id, token)
 
     if not result.get('success'):
         await processing_message.edit_text(f"⚠️ {result.get('error')}")
@@ -8,13 +8,19 @@ from telegram.ext import (
     filters,
     ConversationHandler,
 )
-import json
 
 # --- استيراد الإعدادات والخدمات الأساسية ---
-from core.config import BOT_TOKEN, CHECK_INTERVAL_SECONDS, logger
+from core.config import (
+    BOT_TOKEN, CHECK_INTERVAL_SECONDS, SWEEP_TICK_SECONDS, SWEEP_IN_BOT, NOTIFICATIONS_POLL_SECONDS, logger
+)
 import db.database as db
-from services.scraper_service import ScraperService
-from utils.formatting import format_new_marks_message, display_results_page
+import db.async_database as adb
+from db.backends import is_shared_database
+from db.write_behind import sweep_writes
+from services.scraper_service import AsyncScraperService, SCRAPER_BOT_DATA_KEY, get_scraper
+from services.notifications import deliver_queued_notifications
+from services.sweep import SWEEP_WORKER_ID, run_sweep_cycle
+from utils.formatting import display_results_page
 
 # --- استيراد ثوابت الحالات ---
 from handlers.constants import *
@@ -36,47 +42,42 @@ from handlers.results_browser import (
     filter_by_semester, show_gpa_year_menu, calculate_and_show_gpa
 )
 from handlers.admin import (
-    admin_filter, admin_panel, start_set_marks, target_user_id_received, 
+    admin_filter, admin_panel, admin_upstream_status, start_set_marks, target_user_id_received, 
     marks_json_received, admin_cancel
 )
 from handlers.common import error_handler
 
-# --- مهمة الخلفية لفحص العلامات الجديدة ---
+# --- مهام الخلفية: فحص العلامات الجديدة وإرسال إشعارات عمليات الفحص المنفصلة ---
 async def check_for_new_marks_job(context):
-    logger.info("بدء الفحص الدوري للعلامات الجديدة...")
-    users_to_check = db.get_all_users_for_check()
-    if not users_to_check:
-        logger.info("لا توجد أرقام مفعلة للإشعارات. تخطي الفحص.")
-        return
-
-    scraper = ScraperService()
-    _, token = scraper.fetch_colleges_and_token()
-    if not token:
-        logger.warning("فشل في الحصول على token. إلغاء فحص الإشعارات لهذه الدورة.")
-        return
-        
-    for user in users_to_check:
-        try:
-            result = scraper.fetch_full_student_data(user['college_id'], user['university_id'], token)
-            if not result.get('success'): continue
+    await run_sweep_cycle(get_scraper(context), context.bot)
 
-            old_marks = json.loads(user.get('last_known_marks', '[]'))
-            newly_found_marks = scraper.find_new_marks(old_marks, result['marks'])
+async def deliver_notifications_job(context):
+    await deliver_queued_notifications(context.bot)
 
-            if newly_found_marks:
-                logger.info(f"تم اكتشاف علامات جديدة للمستخدم {user['id']} عبر المهمة الدورية.")
-                response_text = format_new_marks_message(newly_found_marks, "🎉 إشعار بنتائج جديدة!")
-                await context.bot.send_message(chat_id=user['id'], text=response_text, parse_mode='HTML')
-                db.update_user_marks(user['id'], result['marks'])
-        except Exception as e:
-            logger.error(f"خطأ أثناء فحص العلامات للمستخدم {user['id']}: {e}", exc_info=True)
+async def on_shutdown(application) -> None:
+    """تحرير موارد الشبكة وقاعدة البيانات المشتركة عند إيقاف البوت."""
+    scraper = application.bot_data.get(SCRAPER_BOT_DATA_KEY)
+    if scraper:
+        await scraper.aclose()
+    # كتابة أي تحديثات معلّقة من الفحص الدوري قبل إغلاق قاعدة البيانات، ثم إعادة ما بقي محجوزًا إلى الطابور
+    await sweep_writes.flush()
+    await adb.release_sweep_leases(SWEEP_WORKER_ID)
+    await adb.close_db()
 
 def main() -> None:
+    if not SWEEP_IN_BOT and not is_shared_database():
+        # مع SQLite قد تفتح عملية الفحص ملفًا آخر (حاوية أخرى)، فلا تصل إشعاراتها ولا يُفحص شيء دون أي خطأ
+        raise SystemExit("SWEEP_IN_BOT=0 يتطلب قاعدة بيانات مشتركة مع عمليات الفحص: عيّن DATABASE_URL إلى PostgreSQL.")
     db.init_db()
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_shutdown(on_shutdown).build()
+    # نسخة واحدة من خدمة الاستخلاص لكل العملية: تحميل المحددات ومجمع الاتصالات مرة واحدة
+    application.bot_data[SCRAPER_BOT_DATA_KEY] = AsyncScraperService()
     
-    if CHECK_INTERVAL_SECONDS > 0:
-        application.job_queue.run_repeating(check_for_new_marks_job, interval=CHECK_INTERVAL_SECONDS, first=10)
+    if CHECK_INTERVAL_SECONDS > 0 and SWEEP_IN_BOT:
+        # دورات قصيرة تفحص كل منها الأرقام التي حان موعدها (انظر services/sweep_planner.py)
+        application.job_queue.run_repeating(check_for_new_marks_job, interval=SWEEP_TICK_SECONDS, first=10)
+    # الإشعارات التي تسجلها عمليات الفحص المنفصلة (sweep_worker.py)
+    application.job_queue.run_repeating(deliver_notifications_job, interval=NOTIFICATIONS_POLL_SECONDS, first=5)
 
     # --- تعريف الحالات المشتركة لعرض النتائج ---
     results_browser_states = {
@@ -150,6 +151,7 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(delete_my_data_confirmed, pattern=r"^delete_my_data_confirmed$"))
     application.add_handler(CallbackQueryHandler(help_menu, pattern=r"^help_menu$"))
     application.add_handler(CallbackQueryHandler(admin_panel, pattern=r"^admin_panel$"))
+    application.add_handler(CallbackQueryHandler(admin_upstream_status, pattern=r"^admin_upstream_status$"))
     application.add_handler(CallbackQueryHandler(show_main_menu, pattern=r"^main_menu$"))
     
     application.add_error_handler(error_handler)
@@ -0,0 +1,151 @@
+# services/html_parsers.py
+
+"""
+واجهات تحليل HTML القابلة للتبديل.
+كل واجهة تقدم نفس العمليات الصغيرة التي يحتاجها ScraperService (تحليل، select، select_one، نص، سمات)،
+وتعمل بنفس محددات CSS الموجودة في selectors.json.
+"""
+
+import re
+from functools import lru_cache
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+
+from core.config import logger
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax اختيارية
+    LexborHTMLParser = None
+
+# المحددات البسيطة من الشكل tag.class هي وحدها القابلة للتحليل الانتقائي
+SIMPLE_SELECTOR = re.compile(r"^([a-zA-Z][\w-]*)\.([\w-]+)$")
+
+
+def split_simple_selectors(targets: tuple) -> list[tuple[str, str]] | None:
+    """تحول المحددات إلى أزواج (tag, class)، أو تُرجع None إذا لم تكن كلها بسيطة."""
+    matches = [SIMPLE_SELECTOR.match(target) for target in targets]
+    if not all(matches):
+        return None
+    return [(match[1], match[2]) for match in matches]
+
+
+@lru_cache(maxsize=None)
+def build_strainer(targets: tuple) -> SoupStrainer | None:
+    """تبني SoupStrainer يبقي فقط العناصر المطابقة للمحددات (مع محتواها)."""
+    pairs = split_simple_selectors(targets)
+    if pairs is None:
+        return None
+    tags = sorted({tag for tag, _ in pairs})
+    classes = "|".join(re.escape(class_name) for _, class_name in pairs)
+    return SoupStrainer(tags, attrs={"class": re.compile(rf"(^|\s)({classes})(\s|$)")})
+
+
+def trim_before_targets(content: bytes, targets: tuple) -> bytes:
+    """
+    تحذف كل ما يسبق أول ظهور لأي من أصناف المحددات (الترويسة، القوائم، السكربتات...).
+    القص من البداية فقط آمن دائمًا لأن كل العناصر المطلوبة تقع بعده.
+    """
+    pairs = split_simple_selectors(targets)
+    if pairs is None:
+        return content
+    positions = [pos for _, class_name in pairs if (pos := content.find(class_name.encode())) != -1]
+    if not positions:
+        return content
+    start = content.rfind(b"<", 0, min(positions))
+    return content[start:] if start > 0 else content
+
+
+class SoupBackend:
+    """واجهة BeautifulSoup، مع اختيار باني الشجرة (html.parser أو lxml المسرّع بلغة C)."""
+    def __init__(self, features: str):
+        self.name = features
+        self.features = features
+        # التحليل الانتقائي أسرع فعلًا مع html.parser فقط (parse_benchmark)؛ مع lxml قد يكون أبطأ من التحليل الكامل
+        self.supports_targeted = features == "html.parser"
+
+    def parse(self, content: bytes, targets: tuple | None = None):
+        """
+        تحلل الصفحة. إذا مُررت targets تُبنى فقط الأشجار الفرعية المطابقة لها
+        بدل المستند كاملًا (ويبقى البحث عنها بنفس المحددات ممكنًا).
+        """
+        strainer = build_strainer(targets) if targets else None
+        return BeautifulSoup(content, self.features, parse_only=strainer)
+
+    @staticmethod
+    def select_one(node, selector: str):
+        return node.select_one(selector)
+
+    @staticmethod
+    def select(node, selector: str) -> list:
+        return node.select(selector)
+
+    @staticmethod
+    def text(node) -> str:
+        return node.text.strip()
+
+    @staticmethod
+    def attr(node, name: str):
+        return node.get(name)
+
+    @staticmethod
+    def has_class(node, class_name: str) -> bool:
+        return class_name in node.get('class', [])
+
+
+class SelectolaxBackend:
+    """واجهة selectolax (محرك lexbor المكتوب بلغة C)، وهي الأسرع."""
+    name = "selectolax"
+    # lexbor لا يدعم بناء أشجار جزئية، فتُحلل الصفحة كاملة دائمًا
+    supports_targeted = False
+
+    @staticmethod
+    def parse(content: bytes, targets: tuple | None = None):
+        return LexborHTMLParser(content)
+
+    @staticmethod
+    def select_one(node, selector: str):
+        return node.css_first(selector)
+
+    @staticmethod
+    def select(node, selector: str) -> list:
+        return node.css(selector)
+
+    @staticmethod
+    def text(node) -> str:
+        return node.text(deep=True).strip()
+
+    @staticmethod
+    def attr(node, name: str):
+        return node.attributes.get(name)
+
+    @staticmethod
+    def has_class(node, class_name: str) -> bool:
+        return class_name in (node.attributes.get('class') or '').split()
+
+
+def available_backends() -> list[str]:
+    """أسماء الواجهات المتاحة في البيئة الحالية، من الأسرع إلى الأبطأ."""
+    names = []
+    if LexborHTMLParser is not None:
+        names.append("selectolax")
+    if builder_registry.lookup("lxml") is not None:
+        names.append("lxml")
+    names.append("html.parser")
+    return names
+
+
+@lru_cache(maxsize=None)
+def get_parser_backend(name: str):
+    """
+    تُرجع واجهة التحليل المطلوبة بالاسم.
+    إذا لم تكن المكتبة المطلوبة مثبتة يتم الرجوع إلى أسرع واجهة متاحة (وأخيرًا html.parser المدمجة) مع تحذير.
+    """
+    available = available_backends()
+    if name not in available:
+        logger.warning(f"واجهة التحليل '{name}' غير متاحة. سيتم استخدام {available[0]} بدلاً منها.")
+        name = available[0]
+    if name == "selectolax":
+        return SelectolaxBackend()
+    return SoupBackend(name)
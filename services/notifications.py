@@ -0,0 +1,47 @@
+# services/notifications.py
+
+from telegram.constants import ParseMode
+
+from core.config import logger
+import db.async_database as db
+from utils.formatting import format_new_marks_message
+
+NEW_MARKS_TITLE = "🎉 إشعار بنتائج جديدة!"
+
+
+async def notify_new_marks(bot, college_id: str, university_id: str, new_marks: list,
+                           exclude_user_id: int | None = None) -> int:
+    """
+    ترسل إشعار العلامات الجديدة لكل المستخدمين المتابعين للرقم الجامعي والمفعلين للإشعارات
+    (من سجّله كرقمه الأساسي ومن حفظه في الإعدادات، كلٌّ مرة واحدة).
+    exclude_user_id يستثني المستخدم الذي اكتشف العلامات بنفسه (وقد رآها في ردّه).
+    تُرجع عدد الرسائل المرسلة.
+    """
+    # المستخدم قد يتابع أكثر من رقم (رقمه الأساسي وأرقام محفوظة)، لذا يُذكر الرقم في العنوان
+    text = format_new_marks_message(new_marks, f"{NEW_MARKS_TITLE} ({university_id})")
+    sent = 0
+    for user_id in await db.get_number_subscribers(college_id, university_id):
+        if user_id == exclude_user_id:
+            continue
+        try:
+            await bot.send_message(chat_id=user_id, text=text, parse_mode=ParseMode.HTML)
+            sent += 1
+        except Exception as e:
+            logger.warning(f"فشل إرسال إشعار العلامات الجديدة للمستخدم {user_id}: {e}")
+    return sent
+
+
+async def deliver_queued_notifications(bot, limit: int = 100) -> int:
+    """
+    ترسل الإشعارات التي سجلتها عمليات الفحص المنفصلة (sweep_worker.py) في notifications_outbox،
+    وتحذف كل إشعار بعد إرساله. تُرجع عدد الأرقام التي أُرسلت إشعاراتها.
+    """
+    delivered = 0
+    for notification in await db.get_queued_notifications(limit):
+        sent = await notify_new_marks(
+            bot, notification['college_id'], notification['university_id'], notification['new_marks']
+        )
+        await db.delete_queued_notification(notification['id'])
+        logger.info(f"أُرسلت العلامات الجديدة للرقم {notification['university_id']} (من عملية الفحص) إلى {sent} متابع.")
+        delivered += 1
+    return delivered
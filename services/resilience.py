@@ -0,0 +1,247 @@
+# services/resilience.py
+
+"""
+حماية خادم الجامعة (وحماية البوت منه) عند الضغط: محدد معدل متكيف وقاطع دائرة (circuit breaker).
+كل طلب إلى الخادم يمر عبر UpstreamGuard.call، ومعه أقصى مدة يقبل المستدعي انتظارها:
+المستخدمون ينتظرون ثوانٍ قليلة ثم يحصلون فورًا على رسالة "الخادم مشغول"، والفحص الدوري ينتظر حتى يتعافى الخادم.
+"""
+
+import asyncio
+import random
+import time
+from collections import Counter
+
+from core.config import (
+    UPSTREAM_RATE_LIMIT_PER_SECOND,
+    UPSTREAM_RATE_LIMIT_MIN_PER_SECOND,
+    UPSTREAM_RATE_LIMIT_BURST,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_SLOW_CALL_SECONDS,
+    BREAKER_RESET_TIMEOUT_SECONDS,
+    BREAKER_MAX_RESET_TIMEOUT_SECONDS,
+    logger,
+)
+
+
+class UpstreamUnavailable(Exception):
+    """الخادم غير متاح الآن (الدائرة مفتوحة أو الانتظار سيتجاوز المهلة). retry_after تقدير بالثواني."""
+    def __init__(self, reason: str, retry_after: float = 0.0):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdaptiveTokenBucket:
+    """
+    محدد معدل (token bucket) يتكيف مع حالة الخادم (AIMD): يرتفع المعدل تدريجيًا مع كل طلب ناجح حتى max_rate،
+    وينخفض إلى النصف عند الفشل أو البطء (مرة واحدة على الأكثر كل decrease_cooldown ثانية) حتى min_rate.
+    الطلبات تحجز دورها مسبقًا، فتخرج بترتيب وصولها.
+    """
+    def __init__(self, max_rate: float = UPSTREAM_RATE_LIMIT_PER_SECOND, min_rate: float = UPSTREAM_RATE_LIMIT_MIN_PER_SECOND,
+                 burst: float = UPSTREAM_RATE_LIMIT_BURST, decrease_cooldown: float = 2.0):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.capacity = max(1.0, burst)
+        self.decrease_cooldown = decrease_cooldown
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._decreased_at = 0.0
+
+    async def acquire(self, deadline: float) -> None:
+        """تنتظر دور الطلب، أو ترفع UpstreamUnavailable فورًا إن كان الدور سيأتي بعد deadline (time.monotonic)."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        if now + wait > deadline:
+            raise UpstreamUnavailable("تجاوز معدل الطلبات المسموح إلى الخادم.", wait)
+        self._tokens -= 1
+        if wait:
+            await asyncio.sleep(wait)
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_overload(self) -> None:
+        now = time.monotonic()
+        if now - self._decreased_at >= self.decrease_cooldown:
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._decreased_at = now
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+class CircuitBreaker:
+    """
+    قاطع دائرة بثلاث حالات:
+    - closed: الطلبات تمر. بعد failure_threshold إخفاقات متتالية (أخطاء أو طلبات أبطأ من slow_call_seconds) تُفتح الدائرة.
+    - open: تُرفض الطلبات فورًا حتى انتهاء مدة الفتح. المدة تتضاعف مع كل فتح متتالٍ (حتى max_reset_timeout)
+      مع عشوائية (jitter) حتى لا تعود كل العمليات إلى الخادم في نفس اللحظة.
+    - half_open: يُسمح بطلب تجريبي واحد؛ نجاحه يغلق الدائرة وفشله يعيد فتحها.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT_SECONDS,
+                 max_reset_timeout: float = BREAKER_MAX_RESET_TIMEOUT_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.opened_at = None
+        self._reopen_count = 0
+        self._probe_in_flight = False
+        self._state_changed = asyncio.Event()
+        self.stats = Counter()
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.open_until - time.monotonic()) if self.state == self.OPEN else 0.0
+
+    async def acquire(self, deadline: float) -> bool:
+        """
+        تنتظر السماح بطلب حتى deadline (time.monotonic)، وتُرجع True إن كان الطلب هو الطلب التجريبي.
+        ترفع UpstreamUnavailable فورًا إن كانت الدائرة ستبقى مفتوحة بعد deadline.
+        """
+        while True:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                return False
+            if self.state == self.OPEN:
+                if now >= self.open_until:
+                    self._set_state(self.HALF_OPEN)
+                    continue
+                wait = self.open_until - now
+            elif not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.stats['probes'] += 1
+                return True
+            else:
+                # طلب تجريبي جارٍ: الانتظار حتى نتيجته
+                wait = self.reset_timeout
+            if now + wait > deadline and self.state == self.OPEN:
+                self.stats['rejected'] += 1
+                raise UpstreamUnavailable(f"خادم الجامعة غير متاح مؤقتًا ({self.name}).", wait)
+            remaining = deadline - now
+            if remaining <= 0:
+                self.stats['rejected'] += 1
+                raise UpstreamUnavailable(f"خادم الجامعة غير متاح مؤقتًا ({self.name}).", self.retry_after)
+            try:
+                await asyncio.wait_for(self._state_changed.wait(), timeout=min(wait, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def record_success(self, latency: float, probe: bool = False) -> None:
+        if latency > self.slow_call_seconds:
+            self.stats['slow_calls'] += 1
+            self.record_failure(probe)
+            return
+        self.stats['successes'] += 1
+        self.consecutive_failures = 0
+        if probe:
+            self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            self._reopen_count = 0
+            self.opened_at = None
+            logger.info(f"عاد خادم الجامعة للعمل ({self.name}): تم إغلاق الدائرة.")
+            self._set_state(self.CLOSED)
+
+    def record_failure(self, probe: bool = False) -> None:
+        self.stats['failures'] += 1
+        self.consecutive_failures += 1
+        if probe:
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self._open()
+
+    def release_probe(self) -> None:
+        """إلغاء الطلب التجريبي دون نتيجة (مثلاً أُلغي الطلب)، حتى يأخذ طلب آخر مكانه."""
+        self._probe_in_flight = False
+        self._notify()
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": self.retry_after,
+            "opened_at": self.opened_at,
+            **self.stats,
+        }
+
+    def _open(self) -> None:
+        timeout = min(self.max_reset_timeout, self.reset_timeout * 2 ** self._reopen_count)
+        timeout = timeout / 2 + random.uniform(0, timeout / 2)
+        self._reopen_count += 1
+        self.open_until = time.monotonic() + timeout
+        self.opened_at = self.opened_at or time.time()
+        self.stats['opened'] += 1
+        logger.warning(
+            f"فتح الدائرة ({self.name}) بعد {self.consecutive_failures} إخفاقات متتالية: "
+            f"تتوقف الطلبات إلى خادم الجامعة لمدة {timeout:.0f} ثانية."
+        )
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self._notify()
+
+    def _notify(self) -> None:
+        self._state_changed.set()
+        self._state_changed = asyncio.Event()
+
+
+class UpstreamGuard:
+    """يجمع محدد المعدل وقاطع الدائرة حول كل طلب إلى خادم واحد."""
+    def __init__(self, name: str, limiter: AdaptiveTokenBucket | None = None, breaker: CircuitBreaker | None = None):
+        self.name = name
+        self.limiter = limiter or AdaptiveTokenBucket()
+        self.breaker = breaker or CircuitBreaker(name)
+
+    async def call(self, request, max_wait: float, is_failure=lambda response: False):
+        """
+        تنفذ request() (دالة غير متزامنة) وتُرجع نتيجتها، بعد انتظار القاطع والمحدد مدة لا تتجاوز max_wait.
+        is_failure(response) تحدد الردود التي تعني أن الخادم مضغوط (مثل 503)، وتُحسب إخفاقًا مثل الاستثناءات.
+        ترفع UpstreamUnavailable دون إرسال الطلب إن لم يكن الانتظار ممكنًا.
+        """
+        deadline = time.monotonic() + max_wait
+        probe = await self.breaker.acquire(deadline)
+        try:
+            await self.limiter.acquire(deadline if not probe else float("inf"))
+            started = time.monotonic()
+            response = await request()
+        except UpstreamUnavailable:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        except asyncio.CancelledError:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        except Exception:
+            self.breaker.record_failure(probe)
+            self.limiter.on_overload()
+            raise
+
+        latency = time.monotonic() - started
+        if is_failure(response):
+            self.breaker.record_failure(probe)
+            self.limiter.on_overload()
+        else:
+            self.breaker.record_success(latency, probe)
+            if latency > self.breaker.slow_call_seconds:
+                self.limiter.on_overload()
+            else:
+                self.limiter.on_success()
+        return response
+
+    def snapshot(self) -> dict:
+        """حالة الحماية للعرض على المشرف."""
+        return {**self.breaker.snapshot(), "rate": self.limiter.rate, "max_rate": self.limiter.max_rate}
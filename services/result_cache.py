@@ -0,0 +1,115 @@
+# services/result_cache.py
+
+import asyncio
+import time
+
+from cachetools import TTLCache
+
+from core.config import RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_ENTRIES
+
+
+def copy_result(result: dict) -> dict:
+    """نسخة من النتيجة يمكن للمستدعي تعديلها (إعادة ترتيب العلامات أو إضافة مفاتيح) دون المساس بالمخزنة."""
+    copy = dict(result)
+    if copy.get('info') is not None:
+        copy['info'] = dict(copy['info'])
+    if copy.get('marks') is not None:
+        copy['marks'] = list(copy['marks'])
+    return copy
+
+
+class ResultPage:
+    """
+    صفحة نتائج جُلبت من الموقع: بصمتها ومحتواها الخام، مع تحليل كسول يُنفذ مرة واحدة مهما كان عدد المنتظرين.
+    المحتوى الخام يُحذف بعد التحليل، ولا يُخزن في الذاكرة المؤقتة إلا الناتج المحلل.
+    """
+    def __init__(self, fingerprint: str, content: bytes):
+        self.fingerprint = fingerprint
+        self.content = content
+        self._parsing: asyncio.Future | None = None
+
+    async def parse(self, parse, executor=None) -> dict:
+        """
+        تُرجع ناتج parse(content)؛ التحليل يتم في executor (افتراضيًا: خيط منفصل) ويشترك فيه كل من يطلبه.
+        مع مجمع عمليات يجب أن تكون parse دالة على مستوى الوحدة (قابلة للنقل إلى عملية أخرى).
+        """
+        if self._parsing is None:
+            self._parsing = asyncio.get_running_loop().run_in_executor(executor, parse, self.content)
+            self._parsing.add_done_callback(self._drop_content)
+        return await asyncio.shield(self._parsing)
+
+    def _drop_content(self, _future) -> None:
+        self.content = None
+
+
+class StudentResultCache:
+    """
+    ذاكرة مؤقتة قصيرة العمر لنتائج الطلاب، مفتاحها (college_id, university_id)، يشترك فيها التسجيل
+    والبحث المؤقت والفحص اليدوي والفحص الدوري.
+    - طلب واحد فقط إلى الخادم لنفس الرقم مهما كان عدد الطلبات المتزامنة (single-flight)، إلا إذا كان الطلب الجاري
+      بأولوية أدنى من أولوية المستدعي.
+    - كل مستدعٍ يحدد أقصى عمر يقبله للنتيجة المخزنة (max_staleness)، فالفحص اليدوي يطلب نتيجة أحدث من الفحص الدوري.
+    - لا تُخزن إلا النتائج الناجحة.
+    """
+    def __init__(self, ttl: float = RESULT_CACHE_TTL_SECONDS, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        # القيمة المخزنة (fetched_at, result)
+        self._results = TTLCache(maxsize=max_entries, ttl=ttl) if ttl > 0 and max_entries > 0 else None
+        # المفتاح -> (الطلب الجاري، أولويته)
+        self._inflight: dict[tuple, tuple[asyncio.Task, int]] = {}
+
+    def get(self, key: tuple, max_staleness: float | None = None) -> dict | None:
+        """تُرجع نسخة من النتيجة المخزنة إن كان عمرها لا يتجاوز max_staleness (افتراضيًا: ttl)، وإلا None."""
+        if self._results is None:
+            return None
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        fetched_at, result = entry
+        if max_staleness is not None and time.monotonic() - fetched_at > max_staleness:
+            return None
+        return copy_result(result)
+
+    def put(self, key: tuple, result: dict, fetched_at: float) -> None:
+        """تخزين نتيجة ناجحة، إلا إذا كانت المخزنة أحدث منها."""
+        if self._results is None or not result.get('success'):
+            return
+        entry = self._results.get(key)
+        if entry is None or entry[0] <= fetched_at:
+            self._results[key] = (fetched_at, copy_result(result))
+
+    async def fetch(self, key: tuple, loader, priority: int = 0) -> tuple[ResultPage, float]:
+        """
+        تُرجع (page, fetched_at) من طلب جارٍ لنفس المفتاح إن وُجد، وإلا تبدأ طلبًا جديدًا عبر loader.
+        loader دالة غير متزامنة تُرجع ResultPage أو ترفع استثناءً عند الفشل (ويصل الاستثناء لكل المنتظرين).
+        priority أولوية المستدعي (الأصغر أعلى): لا ينضم إلى طلب جارٍ بأولوية أدنى، لأن ذلك الطلب قد ينتظر دوره
+        في جدولة الطلبات أطول مما يقبله المستدعي، بل يبدأ طلبه بأولويته وينضم إليه من يأتي بعده.
+        """
+        entry = self._inflight.get(key)
+        if entry is None or entry[1] > priority:
+            task = asyncio.create_task(self._load(key, loader))
+            self._inflight[key] = (task, priority)
+        else:
+            task = entry[0]
+        # shield حتى لا يُلغى الطلب المشترك إذا أُلغي أحد المنتظرين
+        return await asyncio.shield(task)
+
+    def invalidate(self, key: tuple) -> None:
+        if self._results is not None:
+            self._results.pop(key, None)
+
+    def clear(self) -> None:
+        if self._results is not None:
+            self._results.clear()
+
+    def __len__(self) -> int:
+        return len(self._results) if self._results is not None else 0
+
+    async def _load(self, key, loader):
+        try:
+            started_at = time.monotonic()
+            return await loader(), started_at
+        finally:
+            # قد يكون طلب بأولوية أعلى حل محل هذا الطلب
+            if self._inflight.get(key, (None,))[0] is asyncio.current_task():
+                del self._inflight[key]
@@ -0,0 +1,147 @@
+# services/scheduler.py
+
+import asyncio
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+
+from core.config import (
+    SCRAPER_MAX_CONCURRENT_REQUESTS,
+    SCRAPER_QUOTA_INTERACTIVE,
+    SCRAPER_QUOTA_REGISTRATION,
+    SCRAPER_QUOTA_FANOUT,
+    SCRAPER_QUOTA_SWEEP,
+)
+from .resilience import UpstreamUnavailable
+
+
+class Priority(IntEnum):
+    """فئات الطلبات إلى خادم الجامعة، الأصغر أعلى أولوية."""
+    INTERACTIVE = 0   # مستخدم ينتظر الرد الآن (التحقق اليدوي، البحث المؤقت، عرض رقم محفوظ)
+    REGISTRATION = 1  # التحقق من رقم عند التسجيل
+    FANOUT = 2        # فحص كل أرقام كلية بعد أن كشفت أرقام المراقبة نشر نتائج جديدة فيها
+    SWEEP = 3         # الفحص الدوري في الخلفية
+
+
+PRIORITY_LABELS = {
+    Priority.INTERACTIVE: "تفاعلي",
+    Priority.REGISTRATION: "تسجيل",
+    Priority.FANOUT: "نشر جديد",
+    Priority.SWEEP: "فحص دوري",
+}
+
+
+class FetchScheduler:
+    """
+    يوزع خانات الطلبات المتزامنة إلى خادم الجامعة بين فئات الأولوية:
+    - لا يتجاوز مجموع الطلبات الجارية max_concurrency، ولا طلبات كل فئة حصتها (quotas)،
+      فحصة الفحص الدوري الأصغر تُبقي خانات محجوزة دائمًا لطلبات المستخدمين.
+    - عند تحرر خانة تُعطى لأعلى فئة منتظرة لم تبلغ حصتها (الفحص الدوري يأخذ ما يتبقى فقط).
+    - داخل الفئة الواحدة تُخدم التدفقات (flow، مثل الكلية) بالتناوب حتى لا يحجز تدفق واحد كل الخانات.
+    """
+    def __init__(self, max_concurrency: int = SCRAPER_MAX_CONCURRENT_REQUESTS, quotas: dict | None = None):
+        self.max_concurrency = max(1, max_concurrency)
+        quotas = quotas or {
+            Priority.INTERACTIVE: SCRAPER_QUOTA_INTERACTIVE,
+            Priority.REGISTRATION: SCRAPER_QUOTA_REGISTRATION,
+            Priority.FANOUT: SCRAPER_QUOTA_FANOUT,
+            Priority.SWEEP: SCRAPER_QUOTA_SWEEP,
+        }
+        self.quotas = {priority: max(1, min(quotas[priority], self.max_concurrency)) for priority in Priority}
+        self._active = Counter()
+        # لكل فئة: flow -> طابور المنتظرين (Futures)، وترتيب المفاتيح هو دور التناوب
+        self._waiting = {priority: OrderedDict() for priority in Priority}
+        self._waits = {priority: deque(maxlen=500) for priority in Priority}
+        self.stats = Counter()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, flow=None, deadline: float = float("inf")):
+        """
+        يحجز خانة طلب حتى نهاية الكتلة.
+        يرفع UpstreamUnavailable إن لم تتوفر خانة قبل deadline (time.monotonic).
+        """
+        await self.acquire(priority, flow, deadline)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    async def acquire(self, priority: Priority, flow=None, deadline: float = float("inf")) -> None:
+        enqueued_at = time.monotonic()
+        # لا يتخطى الطلب الجديد من ينتظر في فئته؛ أما المنتظرون في الفئات الأعلى فلا يبقون إلا إذا بلغوا حصتهم
+        # أو امتلأت كل الخانات، والحالة الثانية يكشفها _can_run
+        if not self._waiting[priority] and self._can_run(priority):
+            self._grant(priority, enqueued_at)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[priority].setdefault(flow, deque()).append((future, enqueued_at))
+        try:
+            timeout = None if deadline == float("inf") else max(0.0, deadline - enqueued_at)
+            await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # حصل على الخانة في نفس اللحظة: نعيدها لمن يليه
+                self.release(priority)
+            else:
+                future.cancel()
+                self._discard(priority, flow, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats[f'timeouts_{priority.name.lower()}'] += 1
+                raise UpstreamUnavailable("كل خانات الطلبات إلى الخادم مشغولة.", 0.0) from None
+            raise
+
+    def release(self, priority: Priority) -> None:
+        self._active[priority] -= 1
+        self._dispatch()
+
+    def snapshot(self) -> dict:
+        """لكل فئة: الطلبات الجارية والمنتظرة والحصة، والمئين 95 لمدة الانتظار (بالثواني) لآخر الطلبات."""
+        classes = {}
+        for priority in Priority:
+            waits = sorted(self._waits[priority])
+            classes[priority] = {
+                "active": self._active[priority],
+                "waiting": sum(len(queue) for queue in self._waiting[priority].values()),
+                "quota": self.quotas[priority],
+                "granted": self.stats[f'granted_{priority.name.lower()}'],
+                "p95_wait": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            }
+        return {"max_concurrency": self.max_concurrency, "classes": classes}
+
+    def _can_run(self, priority: Priority) -> bool:
+        return sum(self._active.values()) < self.max_concurrency and self._active[priority] < self.quotas[priority]
+
+    def _grant(self, priority: Priority, enqueued_at: float) -> None:
+        self._active[priority] += 1
+        self.stats[f'granted_{priority.name.lower()}'] += 1
+        self._waits[priority].append(time.monotonic() - enqueued_at)
+
+    def _dispatch(self) -> None:
+        for priority in Priority:
+            flows = self._waiting[priority]
+            while flows and self._can_run(priority):
+                flow, queue = next(iter(flows.items()))
+                future, enqueued_at = queue.popleft()
+                if queue:
+                    flows.move_to_end(flow)
+                else:
+                    del flows[flow]
+                if future.done():
+                    continue
+                self._grant(priority, enqueued_at)
+                future.set_result(None)
+            if sum(self._active.values()) >= self.max_concurrency:
+                return
+
+    def _discard(self, priority: Priority, flow, future) -> None:
+        queue = self._waiting[priority].get(flow)
+        if queue is None:
+            return
+        for item in queue:
+            if item[0] is future:
+                queue.remove(item)
+                break
+        if not queue:
+            del self._waiting[priority][flow]
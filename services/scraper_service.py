@@ -1,120 +1,172 @@
 # services/scraper_service.py
 
+import asyncio
+import hashlib
+import re
+import time
 import requests
+import httpx
 import json
+from collections import Counter
+from functools import lru_cache
 from pathlib import Path
-from bs4 import BeautifulSoup
 from cachetools import cached, TTLCache
+from cachetools.keys import hashkey
 
 from core.config import (
     BASE_URL,
     RESULT_URL,
     REQUEST_TIMEOUT,
+    HTML_PARSER_BACKEND,
+    HTML_PARSE_MODE,
+    SCRAPER_MAX_CONNECTIONS,
+    SCRAPER_MAX_KEEPALIVE_CONNECTIONS,
+    SCRAPER_KEEPALIVE_EXPIRY,
+    INTERACTIVE_MAX_WAIT_SECONDS,
     logger,
 )
+from .html_parsers import get_parser_backend, trim_before_targets
+from .resilience import UpstreamGuard, UpstreamUnavailable
+from .result_cache import ResultPage, StudentResultCache, copy_result
+from .scheduler import FetchScheduler, Priority
+from .token_cache import get_token_cache
 
-class ScraperService:
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': BASE_URL
+}
+
+COLLEGE_EMOJIS = { "البشري": "👨‍⚕️", "الصيدلة": "💊", "الأسنان": "🦷", "الآداب": "📚", "المدنية": "🏗️", "المعمارية": "🏛️","الزراعي": "🧑‍🌾", "البيطري": "🐾", "العلوم": "🔬", "التربية": "🧑‍🏫", "الاقتصاد": "📈", "الرياضية": "🏁", "الميكانيك": "⚙️", "حاسوب": "🖥️"}
+
+CONNECTION_ERROR_MESSAGE = "حدث خطأ أثناء الاتصال بالخادم. يرجى المحاولة لاحقًا."
+UPSTREAM_BUSY_MESSAGE = "خادم الجامعة مضغوط حاليًا. يرجى المحاولة بعد قليل."
+
+# ردود تعني أن الخادم مضغوط (وليس أن الطلب نفسه خاطئ)
+OVERLOAD_STATUSES = {429, 500, 502, 503, 504}
+
+# علامات رفض رمز التحقق (Anti-Forgery) في ردود ASP.NET
+TOKEN_REJECTION_STATUSES = {400, 403, 500}
+TOKEN_REJECTION_SIGNATURES = (b"anti-forgery", b"antiforgery", b"__RequestVerificationToken")
+
+# قيمة رمز التحقق تتغير مع كل رد، لذا تُحذف من الصفحة قبل حساب بصمتها
+TOKEN_VALUE_PATTERN = re.compile(rb'(__RequestVerificationToken"[^>]*?value=")[^"]*')
+
+# المفتاح الذي تُخزن تحته نسخة الخدمة المشتركة في application.bot_data
+SCRAPER_BOT_DATA_KEY = "scraper"
+
+
+@lru_cache(maxsize=1)
+def load_selectors() -> dict:
+    """تحمّل ملف المحددات مرة واحدة فقط لكل عملية."""
+    selectors_path = Path(__file__).parent / 'selectors.json'
+    try:
+        with open(selectors_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        logger.error(f"فشل حاسم: لا يمكن تحميل ملف المحددات 'selectors.json'. الخطأ: {e}")
+        raise RuntimeError("Scraper cannot operate without selectors.") from e
+
+
+class BaseScraper:
     """
-    خدمة مستقلة مسؤولة عن كل عمليات استخلاص البيانات من موقع الجامعة.
+    الأساس المشترك لخدمات الاستخلاص: تحميل المحددات وتحليل صفحات الموقع.
+    لا يقوم بأي عمليات شبكة، بل يترك ذلك للأصناف المشتقة.
+    واجهة التحليل قابلة للتبديل (انظر services/html_parsers.py).
     """
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Referer': BASE_URL
-        })
-        selectors_path = Path(__file__).parent / 'selectors.json'
-        try:
-            with open(selectors_path, 'r', encoding='utf-8') as f:
-                self.selectors = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.error(f"فشل حاسم: لا يمكن تحميل ملف المحددات 'selectors.json'. الخطأ: {e}")
-            raise RuntimeError("Scraper cannot operate without selectors.") from e
+    def __init__(self, parser_backend: str = HTML_PARSER_BACKEND, parse_mode: str = HTML_PARSE_MODE):
+        self.selectors = load_selectors()
+        self.parser = get_parser_backend(parser_backend)
+        # في الوضع الانتقائي لا تُبنى إلا أجزاء الصفحة التي تحتوي رسالة الخطأ ومعلومات الطالب وجداول العلامات
+        # (مع html.parser فقط؛ باقي الواجهات تحلل الصفحة كاملة)
+        self.result_targets = None
+        if parse_mode == "targeted" and self.parser.supports_targeted:
+            self.result_targets = tuple(
+                self.selectors[key] for key in ('validation_error_summary', 'student_info_card', 'result_panels')
+            )
 
-    @cached(cache=TTLCache(maxsize=1, ttl=3600))
-    def fetch_colleges_and_token(self):
+    def parse_colleges_and_token(self, content: bytes) -> tuple[list, str]:
         """
-        تجلب قائمة الكليات ورمز التحقق.
-        يتم تخزين النتائج مؤقتًا لمدة ساعة لتقليل الضغط على الخادم.
+        تحلل الصفحة الرئيسية وتستخرج قائمة الكليات ورمز التحقق.
+        ترفع ValueError إذا لم تكن الصفحة بالشكل المتوقع.
         """
-        try:
-            response = self.session.get(BASE_URL, timeout=REQUEST_TIMEOUT)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, "html.parser")
-            
-            token_input = soup.select_one(self.selectors['request_verification_token'])
-            if not token_input or 'value' not in token_input.attrs:
-                raise ValueError("لم يتم العثور على رمز التحقق (__RequestVerificationToken).")
-            token = token_input["value"]
-            
-            college_select = soup.select_one(self.selectors['college_select_dropdown'])
-            if not college_select:
-                raise ValueError("لم يتم العثور على قائمة الكليات المنسدلة.")
+        parser = self.parser
+        document = parser.parse(content)
 
-            college_emojis = { "البشري": "👨‍⚕️", "الصيدلة": "💊", "الأسنان": "🦷", "الآداب": "📚", "المدنية": "🏗️", "المعمارية": "🏛️","الزراعي": "🧑‍🌾", "البيطري": "🐾", "العلوم": "🔬", "التربية": "🧑‍🏫", "الاقتصاد": "📈", "الرياضية": "🏁", "الميكانيك": "⚙️", "حاسوب": "🖥️"}
-            
-            colleges = []
-            for opt in college_select.select(self.selectors['college_option']):
-                value = opt.get("value")
-                if not value: continue
-                
-                name = opt.text.strip()
-                emoji = next((emoji for keyword, emoji in college_emojis.items() if keyword in name), "🎓")
-                colleges.append({"name": f"{emoji} {name}", "id": value})
-
-            return colleges, token
-        
-        except (requests.RequestException, ValueError, AttributeError) as e:
-            logger.error(f"فشل جلب الكليات ورمز التحقق: {e}", exc_info=True)
-            return None, None
+        token_input = parser.select_one(document, self.selectors['request_verification_token'])
+        token = parser.attr(token_input, "value") if token_input else None
+        if token is None:
+            raise ValueError("لم يتم العثور على رمز التحقق (__RequestVerificationToken).")
 
-    def fetch_full_student_data(self, college_id: str, university_id: str, token: str):
+        college_select = parser.select_one(document, self.selectors['college_select_dropdown'])
+        if not college_select:
+            raise ValueError("لم يتم العثور على قائمة الكليات المنسدلة.")
+
+        colleges = []
+        for opt in parser.select(college_select, self.selectors['college_option']):
+            value = parser.attr(opt, "value")
+            if not value: continue
+
+            name = parser.text(opt)
+            emoji = next((emoji for keyword, emoji in COLLEGE_EMOJIS.items() if keyword in name), "🎓")
+            colleges.append({"name": f"{emoji} {name}", "id": value})
+
+        return colleges, token
+
+    def parse_student_page(self, content: bytes) -> dict:
         """
-        تجلب كامل بيانات الطالب ونتائجه من الموقع.
+        تحلل صفحة النتائج وتُرجع قاموس النتيجة بنفس الشكل الذي تُرجعه fetch_full_student_data.
         """
-        payload = {
-            "UniversityId": university_id,
-            "CollegeId": college_id,
-            "__RequestVerificationToken": token,
-            "Year": ""
-        }
-        try:
-            response = self.session.post(RESULT_URL, data=payload, timeout=REQUEST_TIMEOUT)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, "html.parser")
+        document = self.parser.parse(content, self.result_targets)
 
-            if error_div := soup.select_one(self.selectors['validation_error_summary']):
-                return {"success": False, "error": error_div.text.strip()}
+        if error_div := self.parser.select_one(document, self.selectors['validation_error_summary']):
+            return {"success": False, "error": self.parser.text(error_div)}
 
-            student_info = self._parse_student_info(soup)
-            all_marks = self._parse_student_marks(soup)
+        student_info = self._parse_student_info(document)
+        all_marks = self._parse_student_marks(document)
 
-            if not student_info and not all_marks:
-                return {"success": False, "error": "الرقم الجامعي غير موجود أو لا توجد له نتائج في هذه الكلية."}
+        if not student_info and not all_marks:
+            return {"success": False, "error": "الرقم الجامعي غير موجود أو لا توجد له نتائج في هذه الكلية."}
 
-            # فرز النتائج دائما حسب التاريخ لضمان التناسق عند المقارنة
-            sorted_marks = sorted(all_marks, key=lambda x: (x.get('date', ''), x.get('subject', '')))
-            
-            return {"success": True, "info": student_info, "marks": sorted_marks}
+        # فرز النتائج دائما حسب التاريخ لضمان التناسق عند المقارنة
+        sorted_marks = sorted(all_marks, key=lambda x: (x.get('date', ''), x.get('subject', '')))
 
-        except requests.RequestException as e:
-            logger.error(f"فشل التحقق والجلب للرقم {university_id}: {e}", exc_info=True)
-            return {"success": False, "error": "حدث خطأ أثناء الاتصال بالخادم. يرجى المحاولة لاحقًا."}
+        return {"success": True, "info": student_info, "marks": sorted_marks}
+
+    def fingerprint_results(self, content: bytes) -> str:
+        """
+        بصمة رخيصة لقسم النتائج في الصفحة الخام، تُحسب دون تحليل HTML.
+        تطابق البصمة مع البصمة المخزنة يعني أن الصفحة لم تتغير، فلا داعي لتحليلها أو مقارنة العلامات.
+        """
+        targets = (self.selectors['student_info_card'], self.selectors['result_panels'])
+        section = trim_before_targets(content, targets)
+        section = TOKEN_VALUE_PATTERN.sub(rb"\1", section)
+        return hashlib.blake2b(section, digest_size=16).hexdigest()
 
-    def _parse_student_info(self, soup: BeautifulSoup) -> dict:
+    @staticmethod
+    def build_result_payload(college_id: str, university_id: str, token: str) -> dict:
+        """تبني بيانات نموذج طلب النتائج."""
+        return {
+            "UniversityId": university_id,
+            "CollegeId": college_id,
+            "__RequestVerificationToken": token,
+            "Year": ""
+        }
+
+    def _parse_student_info(self, document) -> dict:
         """دالة مساعدة لتحليل معلومات الطالب الشخصية."""
+        parser = self.parser
         student_info = {}
-        info_card = soup.select_one(self.selectors['student_info_card'])
+        info_card = parser.select_one(document, self.selectors['student_info_card'])
         if not info_card: return student_info
 
-        spans = info_card.select(f"{self.selectors['info_key_span']}, {self.selectors['info_value_span']}")
+        spans = parser.select(info_card, f"{self.selectors['info_key_span']}, {self.selectors['info_value_span']}")
         i = 0
         while i < len(spans) - 1:
             key_span = spans[i]
             value_span = spans[i+1]
-            if 'head' in key_span.get('class', []) and 'bottom' in value_span.get('class', []):
-                key_text = key_span.text.strip()
-                value_text = value_span.text.strip()
+            if parser.has_class(key_span, 'head') and parser.has_class(value_span, 'bottom'):
+                key_text = parser.text(key_span)
+                value_text = parser.text(value_span)
                 if "الاسم" in key_text and "الأب" not in key_text: student_info['name'] = value_text
                 elif "اسم الأب" in key_text: student_info['father_name'] = value_text
                 elif "الكلية" in key_text: student_info['college_name'] = value_text
@@ -123,18 +175,19 @@ class ScraperService:
                 i += 1
         return student_info
 
-    def _parse_student_marks(self, soup: BeautifulSoup) -> list:
+    def _parse_student_marks(self, document) -> list:
         """دالة مساعدة لتحليل جدول العلامات."""
+        parser = self.parser
         all_marks = []
-        result_panels = soup.select(self.selectors['result_panels'])
+        result_panels = parser.select(document, self.selectors['result_panels'])
         for panel in result_panels:
-            heading_tag = panel.select_one(self.selectors['panel_heading'])
-            heading = heading_tag.text.strip() if heading_tag else "فصل غير محدد"
+            heading_tag = parser.select_one(panel, self.selectors['panel_heading'])
+            heading = parser.text(heading_tag) if heading_tag else "فصل غير محدد"
             
-            table = panel.select_one(self.selectors['results_table'])
-            if table and (tbody := table.select_one(self.selectors['table_body'])):
-                for row in tbody.select(self.selectors['table_row']):
-                    cols = [td.text.strip() for td in row.select(self.selectors['table_cell'])]
+            table = parser.select_one(panel, self.selectors['results_table'])
+            if table and (tbody := parser.select_one(table, self.selectors['table_body'])):
+                for row in parser.select(tbody, self.selectors['table_row']):
+                    cols = [parser.text(td) for td in parser.select(row, self.selectors['table_cell'])]
                     if len(cols) >= 5:
                         all_marks.append({
                             "subject": cols[0], "session": cols[1], "mark": cols[2], 
@@ -154,4 +207,224 @@ class ScraperService:
         for mark in new_marks:
             if json.dumps(mark, sort_keys=True) not in old_marks_set:
                 new_marks_list.append(mark)
-        return new_marks_list
\ No newline at end of file
+        return new_marks_list
+
+
+class ScraperService(BaseScraper):
+    """
+    خدمة مستقلة مسؤولة عن كل عمليات استخلاص البيانات من موقع الجامعة (نسخة متزامنة).
+    """
+    def __init__(self):
+        super().__init__()
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+
+    # المفتاح لا يتضمن self حتى تشترك كل النسخ في نفس القيمة المخزنة
+    @cached(cache=TTLCache(maxsize=1, ttl=3600), key=lambda self: hashkey(BASE_URL))
+    def fetch_colleges_and_token(self):
+        """
+        تجلب قائمة الكليات ورمز التحقق.
+        يتم تخزين النتائج مؤقتًا لمدة ساعة لتقليل الضغط على الخادم.
+        """
+        try:
+            response = self.session.get(BASE_URL, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            return self.parse_colleges_and_token(response.content)
+        except (requests.RequestException, ValueError, AttributeError) as e:
+            logger.error(f"فشل جلب الكليات ورمز التحقق: {e}", exc_info=True)
+            return None, None
+
+    def fetch_full_student_data(self, college_id: str, university_id: str, token: str):
+        """
+        تجلب كامل بيانات الطالب ونتائجه من الموقع.
+        """
+        payload = self.build_result_payload(college_id, university_id, token)
+        try:
+            response = self.session.post(RESULT_URL, data=payload, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            return self.parse_student_page(response.content)
+        except requests.RequestException as e:
+            logger.error(f"فشل التحقق والجلب للرقم {university_id}: {e}", exc_info=True)
+            return {"success": False, "error": CONNECTION_ERROR_MESSAGE}
+
+
+def build_async_client() -> httpx.AsyncClient:
+    """تنشئ عميل httpx بمجمع اتصالات مضبوط يحافظ على الاتصالات مفتوحة مع خادم الجامعة."""
+    return httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        timeout=REQUEST_TIMEOUT,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=SCRAPER_MAX_CONNECTIONS,
+            max_keepalive_connections=SCRAPER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=SCRAPER_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+@lru_cache(maxsize=1)
+def _process_scraper() -> BaseScraper:
+    return BaseScraper()
+
+
+def parse_student_page(content: bytes) -> dict:
+    """
+    تحليل صفحة النتائج في عملية تحليل منفصلة (مجمع العمليات في sweep_worker.py):
+    كل عملية تحمّل المحددات وواجهة التحليل مرة واحدة.
+    """
+    return _process_scraper().parse_student_page(content)
+
+
+def get_scraper(context) -> "AsyncScraperService":
+    """
+    تُرجع نسخة الخدمة المشتركة المخزنة في bot_data.
+    تُنشأ النسخة في main() عند بدء التشغيل، وتُنشأ هنا فقط كاحتياط.
+    """
+    scraper = context.bot_data.get(SCRAPER_BOT_DATA_KEY)
+    if scraper is None:
+        scraper = context.bot_data[SCRAPER_BOT_DATA_KEY] = AsyncScraperService()
+    return scraper
+
+
+class AsyncScraperService(BaseScraper):
+    """
+    نسخة غير متزامنة من خدمة الاستخلاص، مبنية على عميل httpx مشترك،
+    كي لا يتوقف البوت عن خدمة المستخدمين أثناء انتظار رد خادم الجامعة.
+    تُنشأ نسخة واحدة طويلة العمر لكل عملية وتُشارك عبر bot_data.
+    parse_executor مجمع عمليات لتحليل صفحات النتائج على أنوية أخرى (None: خيط داخل العملية).
+    """
+    def __init__(self, client: httpx.AsyncClient | None = None, parse_executor=None):
+        super().__init__()
+        self.client = client or build_async_client()
+        self.parse_executor = parse_executor
+        self.token_cache = get_token_cache(BASE_URL)
+        # نتائج الطلاب المجلوبة حديثًا، مشتركة بين كل من يطلب نفس الرقم
+        self.results = StudentResultCache()
+        # محدد المعدل وقاطع الدائرة لكل الطلبات إلى خادم الجامعة
+        self.upstream = UpstreamGuard(BASE_URL)
+        # توزيع الطلبات المتزامنة حسب الأولوية، حتى لا ينتظر المستخدم خلف طلبات الفحص الدوري
+        self.scheduler = FetchScheduler()
+        # عدادات تشغيلية (مثل عدد مرات رفض رمز التحقق وإعادة المحاولة)
+        self.stats = Counter()
+
+    async def aclose(self) -> None:
+        """تغلق مجمع الاتصالات (تُستدعى عند إيقاف البوت)."""
+        await self.client.aclose()
+
+    async def fetch_colleges_and_token(self):
+        """
+        تجلب قائمة الكليات ورمز التحقق دون حجب حلقة الأحداث.
+        القيمة مشتركة بين كل المستخدمين ومخزنة مؤقتًا لكل عنوان، وتُحدّث في الخلفية قبل انتهائها.
+        """
+        try:
+            return await self.token_cache.get(self._load_colleges_and_token)
+        except UpstreamUnavailable as e:
+            logger.warning(f"تعذر جلب الكليات ورمز التحقق: {e}")
+            return None, None
+        except (httpx.HTTPError, ValueError, AttributeError) as e:
+            logger.error(f"فشل جلب الكليات ورمز التحقق: {e}", exc_info=True)
+            return None, None
+
+    async def _load_colleges_and_token(self):
+        """تجلب الصفحة الرئيسية وتحللها. ترفع استثناءً عند الفشل حتى لا يُخزن."""
+        # كل الطلبات تحتاج رمز التحقق، لذا يُجلب بأعلى أولوية
+        response = await self._request(lambda: self.client.get(BASE_URL), INTERACTIVE_MAX_WAIT_SECONDS, Priority.INTERACTIVE)
+        response.raise_for_status()
+        # التحليل عمل حسابي، لذا يُنفذ في خيط منفصل
+        return await asyncio.to_thread(self.parse_colleges_and_token, response.content)
+
+    async def fetch_full_student_data(self, college_id: str, university_id: str, token: str | None = None,
+                                      known_fingerprint: str | None = None, max_staleness: float | None = None,
+                                      max_wait: float = INTERACTIVE_MAX_WAIT_SECONDS,
+                                      priority: Priority = Priority.INTERACTIVE):
+        """
+        تجلب كامل بيانات الطالب ونتائجه من الموقع دون حجب حلقة الأحداث.
+        إذا رفض الخادم رمز التحقق يُجدد الرمز مرة واحدة ويُعاد الطلب تلقائيًا.
+        تحتوي النتيجة الناجحة على بصمة قسم النتائج (fingerprint). إذا طابقت known_fingerprint
+        تُرجع {"success": True, "unchanged": True, ...} دون تحليل الصفحة.
+        النتائج الناجحة تُخزن لمدة قصيرة، والطلبات المتزامنة لنفس الرقم تشترك في طلب واحد.
+        max_staleness أقصى عمر مقبول بالثواني لنتيجة مخزنة (None: مدة صلاحية الذاكرة، 0: نتيجة جديدة دائمًا).
+        max_wait أقصى مدة لانتظار محدد المعدل وقاطع الدائرة: إن لم يكن الخادم متاحًا خلالها تُرجع فورًا
+        {"success": False, "unavailable": True, "retry_after": ...} دون إرسال الطلب.
+        priority فئة الطلب في جدولة الطلبات إلى الخادم (انظر services/scheduler.py).
+        """
+        key = (college_id, university_id)
+        if (cached := self.results.get(key, max_staleness)) is not None:
+            self.stats['result_cache_hits'] += 1
+            if known_fingerprint and cached['fingerprint'] == known_fingerprint:
+                self.stats['unchanged_pages'] += 1
+                return {"success": True, "unchanged": True, "fingerprint": known_fingerprint}
+            return cached
+
+        try:
+            page, fetched_at = await self.results.fetch(
+                key, lambda: self._fetch_result_page(college_id, university_id, token, max_wait, priority), priority
+            )
+            if known_fingerprint and page.fingerprint == known_fingerprint:
+                self.stats['unchanged_pages'] += 1
+                return {"success": True, "unchanged": True, "fingerprint": page.fingerprint}
+
+            if self.parse_executor is not None:
+                result = await page.parse(parse_student_page, self.parse_executor)
+            else:
+                result = await page.parse(self.parse_student_page)
+            if result.get('success'):
+                result = {**result, 'fingerprint': page.fingerprint}
+                self.results.put(key, result, fetched_at)
+            return copy_result(result)
+        except UpstreamUnavailable as e:
+            self.stats['upstream_unavailable'] += 1
+            logger.warning(f"لم يُرسل طلب الرقم {university_id}: {e}")
+            return {"success": False, "error": UPSTREAM_BUSY_MESSAGE, "unavailable": True, "retry_after": e.retry_after}
+        except (httpx.HTTPError, ValueError, AttributeError) as e:
+            logger.error(f"فشل التحقق والجلب للرقم {university_id}: {e}", exc_info=True)
+            return {"success": False, "error": CONNECTION_ERROR_MESSAGE}
+
+    async def _fetch_result_page(self, college_id: str, university_id: str, token: str | None,
+                                 max_wait: float, priority: Priority) -> ResultPage:
+        """تجلب صفحة النتائج الخام وبصمتها. ترفع استثناءً عند الفشل."""
+        self.stats['result_fetches'] += 1
+        if token is None:
+            _, token = await self.token_cache.get(self._load_colleges_and_token)
+
+        response = await self._post_result(college_id, university_id, token, max_wait, priority)
+        if self.is_token_rejection(response):
+            self.stats['token_rejections'] += 1
+            logger.warning(f"رفض الخادم رمز التحقق أثناء جلب الرقم {university_id}. سيتم التجديد وإعادة المحاولة.")
+            _, token = await self.token_cache.refresh_rejected(self._load_colleges_and_token, token)
+            self.stats['token_retries'] += 1
+            response = await self._post_result(college_id, university_id, token, max_wait, priority)
+
+        response.raise_for_status()
+        return ResultPage(self.fingerprint_results(response.content), response.content)
+
+    async def _post_result(self, college_id: str, university_id: str, token: str, max_wait: float,
+                           priority: Priority) -> httpx.Response:
+        payload = self.build_result_payload(college_id, university_id, token)
+        return await self._request(
+            lambda: self.client.post(RESULT_URL, data=payload), max_wait, priority, flow=college_id
+        )
+
+    async def _request(self, send, max_wait: float, priority: Priority, flow=None) -> httpx.Response:
+        """
+        ترسل طلبًا إلى خادم الجامعة بعد حجز خانة في جدولة الأولويات، عبر محدد المعدل وقاطع الدائرة.
+        max_wait يشمل انتظار الخانة وانتظار المحدد والقاطع معًا.
+        """
+        deadline = time.monotonic() + max_wait
+        async with self.scheduler.slot(priority, flow, deadline):
+            return await self.upstream.call(send, max(0.0, deadline - time.monotonic()), is_failure=self.is_overload)
+
+    def is_overload(self, response: httpx.Response) -> bool:
+        """رد يدل على ضغط الخادم: 429 أو 5xx، إلا رفض رمز التحقق (له معالجته الخاصة)."""
+        return response.status_code in OVERLOAD_STATUSES and not self.is_token_rejection(response)
+
+    @staticmethod
+    def is_token_rejection(response: httpx.Response) -> bool:
+        """
+        تتعرف على رفض رمز التحقق: رد بحالة خطأ يذكر Anti-Forgery،
+        أو إعادة توجيه إلى الصفحة الرئيسية بدل صفحة النتائج.
+        """
+        if response.status_code in TOKEN_REJECTION_STATUSES:
+            body = response.content.lower()
+            return any(signature.lower() in body for signature in TOKEN_REJECTION_SIGNATURES)
+        return bool(response.history) and str(response.url).rstrip('/') == BASE_URL.rstrip('/')
@@ -0,0 +1,278 @@
+# services/sweep.py
+
+import asyncio
+import os
+import socket
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from core.config import (
+    SWEEP_MAX_CONCURRENCY,
+    SWEEP_PER_COLLEGE_CONCURRENCY,
+    SWEEP_DEADLINE_SECONDS,
+    SWEEP_CANARY_COUNT,
+    logger,
+)
+import db.async_database as db
+from db.write_behind import sweep_writes
+from .notifications import notify_new_marks
+from .scheduler import Priority
+from .sweep_planner import count_publications, sweep_planner
+
+# اسم هذه العملية في حجوزات طابور الفحص الدوري (فريد حتى لو تكرر رقم العملية في حاويات مختلفة)
+SWEEP_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def run_marks_sweep(
+    scraper,
+    numbers,
+    bot,
+    max_concurrency: int = SWEEP_MAX_CONCURRENCY,
+    per_college_concurrency: int = SWEEP_PER_COLLEGE_CONCURRENCY,
+    deadline_seconds: float = SWEEP_DEADLINE_SECONDS,
+    priority: Priority = Priority.SWEEP,
+) -> dict:
+    """
+    تفحص الأرقام الجامعية بشكل متوازٍ ومحدود، كل رقم مرة واحدة مهما كان عدد متابعيه، وتُرسل العلامات
+    الجديدة لكل المتابعين (أو تسجلها في notifications_outbox إن كان bot هو None). numbers مُكرِّر غير متزامن (مثل db.iter_claimed_numbers) أو قائمة عادية
+    من قواميس (college_id, university_id, marks_hash, attempts)، ويُقرأ تدريجيًا بالتوازي مع الفحص عبر طابور محدود الحجم:
+    - لا يتجاوز عدد الطلبات الجارية max_concurrency.
+    - لا يتجاوز عدد الطلبات الجارية لكل كلية per_college_concurrency.
+    - بعد انقضاء deadline_seconds لا يبدأ فحص أي رقم جديد ولا يُقرأ المزيد من numbers.
+    - إذا كان خادم الجامعة مضغوطًا (قاطع الدائرة مفتوح) ينتظر الفحص تعافيه حتى المهلة بدل إغراقه بالطلبات،
+      والأرقام التي لم تُفحص حتى المهلة لهذا السبب تُعد مؤجلة (deferred).
+    كل فحص ينتهي يُسجَّل في طابور الفحص مع موعد الفحص التالي، والفحص الفاشل مع موعد إعادة المحاولة.
+    تُرجع ملخصًا بعدد الأرقام التي تم فحصها، تغيرت نتائجها، فشل فحصها، أُجلت، أو تم تخطيها (لم يبدأ فحصها قبل المهلة)،
+    وعدد الصفحات التي طابقت بصمتها المخزنة فلم تُحلل (unmodified، وهي من ضمن checked)،
+    والكليات التي ظهرت فيها علامات جديدة لأرقام كانت لها علامات معروفة (published_colleges).
+    priority فئة طلبات الجولة في جدولة الطلبات إلى الخادم.
+    """
+    summary = _empty_summary()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + deadline_seconds
+    college_limits = defaultdict(lambda: asyncio.Semaphore(per_college_concurrency))
+    # (college_id, semester) -> عدد الأرقام التي ظهرت لها علامات جديدة في هذه الجولة
+    publications = Counter()
+
+    worker_count = max(1, max_concurrency)
+    queue = asyncio.Queue(maxsize=worker_count * 2)
+
+    async def producer():
+        queued = 0
+        try:
+            async for number in _aiter(numbers):
+                if loop.time() >= deadline:
+                    # من القائمة يُعد كل ما لم يدخل الطابور؛ من المُكرِّر يُعد الرقم المقروء فقط، فالباقي لم يُقرأ (ولم يُحجز)
+                    summary["skipped"] += len(numbers) - queued if isinstance(numbers, (list, tuple)) else 1
+                    break
+                queued += 1
+                await queue.put(number)
+        finally:
+            for _ in range(worker_count):
+                await queue.put(None)
+
+    async def worker():
+        while (number := await queue.get()) is not None:
+            if loop.time() >= deadline:
+                summary["skipped"] += 1
+                continue
+            async with college_limits[number['college_id']]:
+                outcome = await _check_number(
+                    scraper, number, bot, publications, max_wait=max(0.0, deadline - loop.time()), priority=priority
+                )
+            if outcome in ("failed", "deferred"):
+                summary[outcome] += 1
+            else:
+                summary["checked"] += 1
+                if outcome in ("changed", "unmodified"):
+                    summary[outcome] += 1
+
+    workers = [asyncio.create_task(worker()) for _ in range(worker_count)]
+    try:
+        await asyncio.gather(producer(), *workers)
+    finally:
+        # كتابة ما تبقى من تحديثات الجولة قبل انتهائها
+        await sweep_writes.flush()
+        if publications:
+            await db.record_publication_events(publications)
+    summary["published_colleges"] = sorted({college_id for college_id, _ in publications})
+    return summary
+
+
+async def run_sweep_tick(
+    scraper,
+    bot,
+    canary_count: int = SWEEP_CANARY_COUNT,
+    deadline_seconds: float = SWEEP_DEADLINE_SECONDS,
+    owner: str = SWEEP_WORKER_ID,
+    shard: tuple | None = None,
+) -> dict:
+    """
+    دورة واحدة من الفحص الدوري، بمهلة كلية deadline_seconds.
+    الأرقام المستحقة تُحجز من طابور قاعدة البيانات (next_check_at في جدول numbers) باسم العامل owner،
+    فتعمل عدة عمليات على نفس الطابور دون فحص الرقم مرتين، وما لم يُفحص حتى المهلة (أو حتى توقف العملية)
+    يبقى مستحقًا فتبدأ به الدورة التالية:
+    1. أرقام المراقبة (canary_count من كل كلية) تُفحص في كل دورة، في عملية واحدة فقط (الجزء الأول عند التقسيم)
+       حتى لا تفحصها كل العمليات وتكشف كل منها نفس النشر.
+    2. الكليات التي ظهرت فيها علامات جديدة لأحد أرقام المراقبة تصبح كل أرقامها مستحقة فورًا
+       وتُفحص بأولوية FANOUT، فيُكتشف النشر خلال دورة واحدة دون فحص كل الأرقام في الفترات الهادئة.
+    3. باقي الأرقام المستحقة، الأقدم موعدًا أولاً.
+    shard = (shard_index, shard_count) يقصر الدورة على أرقام جزء واحد (عملية فحص من عدة عمليات، انظر sweep_worker.py)؛
+    الكلية التي كشفت فيها أرقام المراقبة نشرًا تصبح كل أرقامها مستحقة، فتفحص كل عملية جزءها منها في دورتها.
+    تُرجع ملخص كل مرحلة (canary و fanout و planned).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + deadline_seconds
+    remaining = lambda: max(0.0, deadline - loop.time())
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    await sweep_planner.refresh()
+    probes_canaries = canary_count > 0 and (shard is None or shard[0] == 0)
+    canaries = await db.get_canary_numbers(canary_count) if probes_canaries else []
+    canary = await run_marks_sweep(scraper, canaries, bot, deadline_seconds=remaining(), priority=Priority.FANOUT)
+
+    published = canary["published_colleges"]
+    fanout = _empty_summary()
+    if published:
+        logger.info(f"كشفت أرقام المراقبة نتائج جديدة في الكليات {', '.join(published)}. فحص كل أرقامها الآن...")
+        for college_id in published:
+            # أرقام المراقبة فُحصت للتو (وما فحصه عامل آخر منذ بداية الدورة) فلا تُعاد
+            await db.make_college_due(college_id, checked_before=started_at)
+        fanout = await _run_claimed(scraper, bot, owner, published, remaining(), Priority.FANOUT, shard)
+
+    planned = await _run_claimed(scraper, bot, owner, (None,), remaining(), Priority.SWEEP, shard)
+    return {"canary": canary, "fanout": fanout, "planned": planned}
+
+
+async def run_sweep_cycle(scraper, bot, shard: tuple | None = None) -> dict | None:
+    """
+    دورة فحص كاملة كما تشغلها عملية البوت (check_for_new_marks_job) أو عملية فحص منفصلة (sweep_worker.py):
+    تتخطى الدورة إن لم توجد أرقام مفعلة للإشعارات أو تعذر جلب رمز التحقق، وإلا تشغل run_sweep_tick وتسجل ملخصها.
+    """
+    label = f" (الجزء {shard[0] + 1} من {shard[1]})" if shard is not None else ""
+    logger.info(f"بدء الفحص الدوري للعلامات الجديدة{label}...")
+    if not await db.has_numbers_for_check():
+        logger.info("لا توجد أرقام مفعلة للإشعارات. تخطي الفحص.")
+        return None
+
+    _, token = await scraper.fetch_colleges_and_token()
+    if not token:
+        logger.warning("فشل في الحصول على token. إلغاء فحص الإشعارات لهذه الدورة.")
+        return None
+
+    # كل رقم جامعي يُفحص مرة واحدة والأرقام تُحجز على دفعات أثناء الفحص بدل تحميلها كلها في الذاكرة مسبقًا.
+    # في كل دورة تُفحص أرقام المراقبة والأرقام المستحقة من طابور الفحص في قاعدة البيانات،
+    # فإعادة تشغيل العملية تكمل من حيث توقفت بدل البدء من جديد
+    tick = await run_sweep_tick(scraper, bot, shard=shard)
+    canary, fanout, planned = tick['canary'], tick['fanout'], tick['planned']
+    total = {key: sum(tick[stage][key] for stage in ("canary", "fanout", "planned"))
+             for key in ("checked", "unmodified", "changed", "failed", "deferred", "skipped")}
+    logger.info(
+        f"انتهت دورة الفحص الدوري{label}: أرقام المراقبة {canary['checked']} (كشفت نشرًا في {len(canary['published_colleges'])} كلية، "
+        f"فُحص بعده {fanout['checked']} رقمًا)، ومن طابور الأرقام المستحقة {planned['checked']} رقمًا. "
+        f"المجموع: تم فحص {total['checked']} رقمًا (منها {total['unmodified']} دون تغيير في الصفحة)، "
+        f"تغيرت نتائج {total['changed']}، فشل {total['failed']}، تأجل {total['deferred']} لضغط الخادم، "
+        f"تم تخطي {total['skipped']}. "
+        f"(منذ التشغيل: طلبات النتائج {scraper.stats['result_fetches']}، من الذاكرة المؤقتة {scraper.stats['result_cache_hits']}، "
+        f"مرات رفض رمز التحقق {scraper.stats['token_rejections']})"
+    )
+    return tick
+
+
+async def _run_claimed(scraper, bot, owner: str, college_ids, deadline_seconds: float, priority: Priority,
+                       shard: tuple | None = None) -> dict:
+    """تفحص الأرقام المستحقة في الكليات college_ids (None لكل الكليات) بحجزها من الطابور دفعة بعد دفعة."""
+    async def claimed():
+        for college_id in college_ids:
+            async for number in db.iter_claimed_numbers(owner, college_id, shard):
+                yield number
+
+    try:
+        return await run_marks_sweep(scraper, claimed(), bot, deadline_seconds=deadline_seconds, priority=priority)
+    finally:
+        # ما حُجز ولم يُنهَ فحصه (المهلة أو ضغط الخادم) يعود إلى الطابور بموعده الحالي، فيُفحص في الدورة التالية
+        released = await db.release_sweep_leases(owner)
+        if released:
+            logger.info(f"أُعيد {released} رقمًا محجوزًا لم يُفحص إلى طابور الفحص الدوري.")
+
+
+def _empty_summary() -> dict:
+    return {"checked": 0, "changed": 0, "failed": 0, "deferred": 0, "skipped": 0, "unmodified": 0,
+            "published_colleges": []}
+
+
+async def _aiter(items):
+    """توحيد القوائم العادية والمكررات غير المتزامنة."""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def _check_number(scraper, number: dict, bot, publications: Counter, max_wait: float,
+                        priority: Priority = Priority.SWEEP) -> str:
+    """
+    تفحص رقمًا جامعيًا واحدًا وتُرجع نتيجة الفحص: unmodified أو unchanged أو changed أو deferred أو failed.
+    الفحص الناجح يُسجَّل مع موعد الفحص التالي حسب نشاط الكلية، والفاشل مع موعد إعادة محاولة يتضاعف مع كل فشل متتالٍ.
+    المؤجل (deferred) لا يُسجَّل، فيبقى الرقم مستحقًا.
+    """
+    college_id, university_id = number['college_id'], number['university_id']
+    try:
+        # بصمة رقم لم تُحمل علاماته (من عرض نتائج رقم محفوظ) لا تغني عن تحليل الصفحة وتسجيل علاماته
+        known_fingerprint = number.get('marks_hash') if number.get('marks_loaded') else None
+        result = await scraper.fetch_full_student_data(
+            college_id, university_id, known_fingerprint=known_fingerprint, max_wait=max_wait,
+            priority=priority
+        )
+        if result.get('unavailable'):
+            return "deferred"
+        if result.get('success'):
+            return await _record_result(scraper, number, result, bot, publications)
+        error = result.get('error') or "فشل جلب النتيجة."
+    except Exception as e:
+        logger.error(f"خطأ أثناء فحص العلامات للرقم {university_id}: {e}", exc_info=True)
+        error = str(e) or type(e).__name__
+
+    try:
+        await sweep_writes.record_failure(
+            college_id, university_id, error[:500], sweep_planner.retry_at(number.get('attempts') or 0)
+        )
+    except Exception as e:
+        logger.error(f"تعذر تسجيل فشل فحص الرقم {university_id}: {e}")
+    return "failed"
+
+
+async def _record_result(scraper, number: dict, result: dict, bot, publications: Counter) -> str:
+    college_id, university_id = number['college_id'], number['university_id']
+    next_check_at = sweep_planner.next_check_at(college_id)
+    if result.get('unchanged'):
+        await sweep_writes.record(college_id, university_id, next_check_at=next_check_at)
+        return "unmodified"
+
+    # الكشف عن العلامات الجديدة يتم فورًا بالمقارنة مع آخر نسخة معروفة (المعلّقة في المخزن أولاً، ثم جدول marks)،
+    # أما الكتابة نفسها فتؤجل وتُجمع مع غيرها في معاملة واحدة
+    pending_marks = sweep_writes.pending_marks(college_id, university_id)
+    known_marks = pending_marks if pending_marks is not None else await db.get_student_marks(college_id, university_id)
+    # رقم لم تُحمَّل علاماته من قبل (رقم محفوظ لم يُفحص بعد): علاماته الحالية أساس المقارنة وليست علامات جديدة
+    baseline = pending_marks is None and not number.get('marks_loaded')
+    newly_found_marks = [] if baseline else scraper.find_new_marks(known_marks, result['marks'])
+    # بدون بوت (عملية فحص منفصلة) تُسجل العلامات التي تضيفها كتابة الدفعة فعلًا لترسلها عملية البوت
+    await sweep_writes.record(
+        college_id, university_id, marks=result['marks'], marks_hash=result['fingerprint'], next_check_at=next_check_at,
+        notify=bool(newly_found_marks) and bot is None
+    )
+    if not newly_found_marks:
+        return "unchanged"
+    if known_marks:
+        # أول تحميل لعلامات رقم لا يعني أن الكلية نشرت شيئًا الآن
+        count_publications(publications, college_id, newly_found_marks)
+
+    if bot is None:
+        logger.info(f"تم اكتشاف علامات جديدة للرقم {university_id}، وسُجلت لترسلها عملية البوت.")
+        return "changed"
+    sent = await notify_new_marks(bot, college_id, university_id, newly_found_marks)
+    logger.info(f"تم اكتشاف علامات جديدة للرقم {university_id} عبر المهمة الدورية، وأُرسلت إلى {sent} متابع.")
+    return "changed"
@@ -0,0 +1,74 @@
+# services/sweep_planner.py
+
+import random
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from core.config import (
+    CHECK_INTERVAL_SECONDS,
+    SWEEP_TICK_SECONDS,
+    SWEEP_MIN_INTERVAL_SECONDS,
+    SWEEP_MAX_INTERVAL_SECONDS,
+    SWEEP_INTERVAL_DOUBLING_HOURS,
+    SWEEP_RETRY_BASE_SECONDS,
+    SWEEP_RETRY_MAX_SECONDS,
+)
+import db.async_database as db
+
+
+def count_publications(detections: Counter, college_id: str, new_marks: list) -> Counter:
+    """إضافة العلامات الجديدة لرقم واحد إلى detections: كل فصل ظهرت فيه علامة يُحسب مرة واحدة للرقم."""
+    for semester in {mark.get('semester', '') for mark in new_marks}:
+        detections[(college_id, semester)] += 1
+    return detections
+
+
+class SweepPlanner:
+    """
+    يحدد موعد الفحص التالي لكل رقم في طابور الفحص الدوري (numbers.next_check_at):
+    - مدة الفحص لكل كلية تتكيف مع آخر نشر لنتائجها (من جدول publication_events): min_interval بعد النشر مباشرة،
+      وتتضاعف كل doubling_hours بلا نشر حتى max_interval. الكليات بلا أي سجل تُفحص كل default_interval.
+    - الموعد يُحسب مع عشوائية صغيرة حول المدة، فتبقى مواعيد الأرقام موزعة على الدورات ولا تتجمع في دورة واحدة.
+    - الفحص الفاشل يُعاد بعد retry_base ثانية، وتتضاعف المدة مع كل فشل متتالٍ حتى retry_max.
+    """
+    def __init__(self, tick: float = SWEEP_TICK_SECONDS, min_interval: float = SWEEP_MIN_INTERVAL_SECONDS,
+                 max_interval: float = SWEEP_MAX_INTERVAL_SECONDS, doubling_hours: float = SWEEP_INTERVAL_DOUBLING_HOURS,
+                 default_interval: float = CHECK_INTERVAL_SECONDS, retry_base: float = SWEEP_RETRY_BASE_SECONDS,
+                 retry_max: float = SWEEP_RETRY_MAX_SECONDS):
+        self.tick = tick
+        self.min_interval = max(tick, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.doubling_hours = doubling_hours
+        self.default_interval = min(max(default_interval, self.min_interval), self.max_interval)
+        self.retry_base = retry_base
+        self.retry_max = max(retry_base, retry_max)
+        self._last_publications: dict[str, datetime] = {}
+
+    async def refresh(self) -> None:
+        """إعادة قراءة آخر نشر لكل كلية (مرة في بداية كل دورة)."""
+        self._last_publications = {
+            college_id: datetime.fromisoformat(detected_at)
+            for college_id, detected_at in (await db.get_last_publication_times()).items()
+        }
+
+    def interval(self, college_id: str, now: datetime | None = None) -> float:
+        """مدة الفحص الحالية لأرقام الكلية بالثواني."""
+        last = self._last_publications.get(college_id)
+        if last is None:
+            return self.default_interval
+        hours_since = ((now or datetime.now(timezone.utc)) - last).total_seconds() / 3600
+        return min(self.max_interval, self.min_interval * 2 ** (max(0.0, hours_since) / self.doubling_hours))
+
+    def next_check_at(self, college_id: str) -> int:
+        """موعد الفحص التالي لرقم فُحص الآن (بالثواني منذ epoch)."""
+        return int(time.time() + self.interval(college_id) * random.uniform(0.9, 1.1))
+
+    def retry_at(self, attempts: int) -> int:
+        """موعد إعادة محاولة رقم فشل فحصه بعد attempts محاولة فاشلة متتالية سابقة (بالثواني منذ epoch)."""
+        backoff = min(self.retry_max, self.retry_base * 2 ** min(attempts, 32))
+        return int(time.time() + backoff / 2 + random.uniform(0, backoff / 2))
+
+
+# مخطط واحد لكل عملية
+sweep_planner = SweepPlanner()
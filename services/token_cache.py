@@ -0,0 +1,92 @@
+# services/token_cache.py
+
+import asyncio
+import time
+
+from core.config import TOKEN_CACHE_TTL_SECONDS, TOKEN_REFRESH_MARGIN_SECONDS, logger
+
+
+class TokenCache:
+    """
+    ذاكرة مؤقتة مشتركة لقائمة الكليات ورمز التحقق الخاصين بعنوان واحد.
+    - طلب واحد فقط إلى الخادم مهما كان عدد المستخدمين المنتظرين (single-flight).
+    - تحديث استباقي في الخلفية قبل انتهاء الصلاحية بمدة refresh_margin.
+    - إبطال فوري عند رفض الخادم للرمز.
+    """
+    def __init__(self, endpoint: str, ttl: float = TOKEN_CACHE_TTL_SECONDS, refresh_margin: float = TOKEN_REFRESH_MARGIN_SECONDS):
+        self.endpoint = endpoint
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self._value = None
+        self._expires_at = 0.0
+        self._inflight: asyncio.Task | None = None
+        self._refresh_lock = asyncio.Lock()
+        self.refresh_count = 0
+
+    @property
+    def token(self) -> str | None:
+        return self._value[1] if self._value else None
+
+    async def get(self, loader):
+        """
+        تُرجع (colleges, token) من الذاكرة إن كانت صالحة، وإلا تستدعي loader.
+        loader دالة غير متزامنة تُرجع (colleges, token) أو ترفع استثناءً عند الفشل.
+        """
+        now = time.monotonic()
+        if self._value and now < self._expires_at:
+            if now >= self._expires_at - self.refresh_margin:
+                self._start_load(loader)
+            return self._value
+        # shield حتى لا يُلغى التحميل المشترك إذا أُلغي أحد المنتظرين
+        return await asyncio.shield(self._start_load(loader))
+
+    def invalidate(self, token: str | None = None) -> None:
+        """تبطل القيمة المخزنة. إذا مُرر token فلا تُبطل إلا إذا كان هو الرمز الحالي."""
+        if token is None or token == self.token:
+            logger.info(f"إبطال رمز التحقق المخزن للعنوان {self.endpoint}.")
+            self._value = None
+            self._expires_at = 0.0
+
+    async def refresh_rejected(self, loader, rejected_token: str):
+        """
+        تُستدعى عندما يرفض الخادم رمزًا. تحت القفل: إذا كان الرمز المرفوض هو الحالي
+        تُبطله وتجلب رمزًا جديدًا مرة واحدة، وإلا فقد سبقها طلب آخر إلى التحديث فتُرجع الرمز الجديد.
+        """
+        async with self._refresh_lock:
+            if self._value is None or self.token == rejected_token:
+                self.invalidate(rejected_token)
+                value = await asyncio.shield(self._start_load(loader))
+                self.refresh_count += 1
+                logger.warning(f"تم تجديد رمز التحقق بعد رفضه من الخادم (المرة {self.refresh_count}).")
+                return value
+            return self._value
+
+    def _start_load(self, loader) -> asyncio.Task:
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._load(loader))
+            # مرة واحدة لكل تحميل، مهما كان عدد من ينضم إليه (التحديث الاستباقي لا ينتظره أحد)
+            self._inflight.add_done_callback(self._log_load_failure)
+        return self._inflight
+
+    def _log_load_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logger.warning(f"فشل جلب رمز التحقق للعنوان {self.endpoint}: {task.exception()}")
+
+    async def _load(self, loader):
+        try:
+            value = await loader()
+            self._value = value
+            self._expires_at = time.monotonic() + self.ttl
+            return value
+        finally:
+            self._inflight = None
+
+
+# ذاكرة واحدة لكل عنوان على مستوى العملية، بغض النظر عن عدد نسخ الخدمة
+_caches: dict[str, TokenCache] = {}
+
+def get_token_cache(endpoint: str) -> TokenCache:
+    """تُرجع الذاكرة المؤقتة المشتركة الخاصة بالعنوان endpoint."""
+    if endpoint not in _caches:
+        _caches[endpoint] = TokenCache(endpoint)
+    return _caches[endpoint]
@@ -0,0 +1,121 @@
+# sweep_worker.py
+
+"""
+عملية فحص دوري منفصلة عن عملية البوت، حتى يتوزع الفحص (وتحليل صفحات النتائج) على عدة أنوية.
+- الأرقام الجامعية مقسمة على SWEEP_SHARD_COUNT جزءًا ثابتًا (حسب shard_key لكل رقم)، وكل عملية تحجز أرقام جزئها فقط
+  من طابور الفحص في قاعدة البيانات.
+- تحليل صفحات النتائج يتم في مجمع عمليات (SWEEP_PARSE_PROCESSES) بدل خيط داخل العملية.
+- العلامات الجديدة تُسجل في notifications_outbox وترسلها عملية البوت (main.py) لمتابعي الرقم.
+
+يتطلب قاعدة PostgreSQL مشتركة (DATABASE_URL) بين عملية البوت وعمليات الفحص: مع ملف SQLite قد تفتح كل عملية
+(في حاوية أو خادم آخر) ملفًا مختلفًا، فلا يرى البوت الإشعارات، لذلك ترفض العملية البدء دونها.
+الإعداد الافتراضي في Procfile عملية بوت واحدة تفحص الأرقام بنفسها (SWEEP_IN_BOT=1) ولا يحتاج هذه العملية.
+
+التقسيم على عدة عمليات، مثلاً في Procfile:
+    worker: SWEEP_IN_BOT=0 python main.py
+    sweep: SWEEP_SHARD_COUNT=4 python sweep_worker.py                 # أربع عمليات في نفس الحاوية، واحدة لكل جزء
+أو عملية لكل حاوية أو خادم، بنفس SWEEP_SHARD_COUNT في كل منها ورقم جزء مختلف:
+    SWEEP_SHARD_COUNT=4 SWEEP_SHARD_INDEX=2 python sweep_worker.py
+يجب أن تعمل كل الأجزاء من 0 إلى SWEEP_SHARD_COUNT - 1 (وإلا لا تُفحص أرقام الجزء الغائب)، وأرقام المراقبة يفحصها
+الجزء 0 فقط. SWEEP_IN_BOT=0 لعملية البوت حتى لا تفحص هي أيضًا أرقام المراقبة وكل الأرقام.
+"""
+
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+from core.config import (
+    SWEEP_TICK_SECONDS,
+    SWEEP_SHARD_COUNT,
+    SWEEP_SHARD_INDEX,
+    SWEEP_PARSE_PROCESSES,
+    logger,
+)
+import db.database as db
+import db.async_database as adb
+from db.backends import is_shared_database
+from db.write_behind import sweep_writes
+from services.scraper_service import AsyncScraperService
+from services.sweep import SWEEP_WORKER_ID, run_sweep_cycle
+
+
+async def run_worker(shard: tuple | None) -> None:
+    """تشغيل دورات الفحص كل SWEEP_TICK_SECONDS حتى SIGINT أو SIGTERM، ثم إعادة ما بقي محجوزًا إلى الطابور."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    stopping = False
+
+    def stop():
+        # إشارة ثانية (مثلاً من العملية الأم ومن مدير العمليات معًا) لا تقطع التنظيف الجاري
+        nonlocal stopping
+        if not stopping:
+            stopping = True
+            task.cancel()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop)
+
+    # spawn وليس fork: العملية الأم فيها حلقة أحداث وخيوط قاعدة البيانات
+    parse_pool = ProcessPoolExecutor(
+        SWEEP_PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+    ) if SWEEP_PARSE_PROCESSES > 0 else None
+    scraper = AsyncScraperService(parse_executor=parse_pool)
+    part = f"الجزء {shard[0] + 1} من {shard[1]}" if shard is not None else "كل الأرقام"
+    logger.info(f"بدأت عملية الفحص {SWEEP_WORKER_ID} ({part}، عمليات التحليل {SWEEP_PARSE_PROCESSES}).")
+    try:
+        while True:
+            started = loop.time()
+            try:
+                await run_sweep_cycle(scraper, None, shard)
+            except Exception as e:
+                logger.error(f"فشلت دورة الفحص الدوري: {e}", exc_info=True)
+            await asyncio.sleep(max(0.0, SWEEP_TICK_SECONDS - (loop.time() - started)))
+    except asyncio.CancelledError:
+        logger.info(f"إيقاف عملية الفحص {SWEEP_WORKER_ID}...")
+    finally:
+        await scraper.aclose()
+        await sweep_writes.flush()
+        await adb.release_sweep_leases(SWEEP_WORKER_ID)
+        if parse_pool is not None:
+            parse_pool.shutdown(cancel_futures=True)
+        await adb.close_db()
+
+
+def run_shard(index: int, count: int) -> None:
+    asyncio.run(run_worker((index, count) if count > 1 else None))
+
+
+def main() -> None:
+    if not is_shared_database():
+        raise SystemExit("عمليات الفحص المنفصلة تتطلب قاعدة بيانات مشتركة مع البوت: عيّن DATABASE_URL إلى PostgreSQL.")
+    count = max(1, SWEEP_SHARD_COUNT)
+    if SWEEP_SHARD_INDEX >= count:
+        raise SystemExit(f"SWEEP_SHARD_INDEX ({SWEEP_SHARD_INDEX}) يجب أن يكون أصغر من SWEEP_SHARD_COUNT ({count}).")
+    db.init_db()
+    if SWEEP_SHARD_INDEX >= 0 or count == 1:
+        run_shard(max(0, SWEEP_SHARD_INDEX), count)
+        return
+
+    # عملية لكل جزء؛ إيقاف العملية الأم يوقف كل الأجزاء (وكل منها يعيد حجوزاته إلى الطابور)
+    db.close_db()
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_shard, args=(index, count), name=f"sweep-{index}") for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# tests/test_postgres_sql.py
+
+"""
+ترجمة الاستعلامات المشتركة إلى صيغة psycopg وقائمة ترحيلات PostgreSQL، بلا خادم PostgreSQL.
+
+التشغيل من جذر المشروع:
+    python -m unittest tests.test_postgres_sql
+"""
+
+import os
+import unittest
+
+os.environ.setdefault("BOT_TOKEN", "test")
+
+from db.backends.base import CANARY_NUMBERS_SQL, NUMBER_SUBSCRIBERS_SQL, claim_numbers_sql
+from db.backends.postgres import MIGRATIONS, PostgresBackend, _to_pyformat
+
+
+class ToPyformatTest(unittest.TestCase):
+    def test_placeholders_become_pyformat(self):
+        self.assertEqual(
+            _to_pyformat("SELECT * FROM users WHERE id = ? AND college_id = ?"),
+            "SELECT * FROM users WHERE id = %s AND college_id = %s",
+        )
+
+    def test_percent_is_escaped_everywhere(self):
+        self.assertEqual(
+            _to_pyformat("SELECT ? WHERE name LIKE 'a%' AND id % 2 = 0"),
+            "SELECT %s WHERE name LIKE 'a%%' AND id %% 2 = 0",
+        )
+
+    def test_quoted_text_is_kept(self):
+        self.assertEqual(
+            _to_pyformat("""SELECT 'why?', 'it''s ?', "col?" FROM t WHERE id = ?"""),
+            """SELECT 'why?', 'it''s ?', "col?" FROM t WHERE id = %s""",
+        )
+
+    def test_dollar_quoted_body_is_kept(self):
+        sql = "DO $body$ BEGIN PERFORM 1; IF ? THEN NULL; END IF; END $body$; SELECT $$?$$, ?"
+        self.assertEqual(
+            _to_pyformat(sql),
+            "DO $body$ BEGIN PERFORM 1; IF ? THEN NULL; END IF; END $body$; SELECT $$?$$, %s",
+        )
+
+    def test_comments_are_kept(self):
+        sql = "SELECT ? -- any ?\nFROM t /* or ? */ WHERE id = ?"
+        self.assertEqual(_to_pyformat(sql), "SELECT %s -- any ?\nFROM t /* or ? */ WHERE id = %s")
+
+    def test_shared_queries_have_no_placeholder_left(self):
+        queries = [
+            NUMBER_SUBSCRIBERS_SQL,
+            CANARY_NUMBERS_SQL,
+            claim_numbers_sql(False, PostgresBackend.claim_lock_clause),
+            claim_numbers_sql(True, PostgresBackend.claim_lock_clause, sharded=True),
+        ]
+        for sql in queries:
+            converted = _to_pyformat(sql)
+            self.assertNotIn("?", converted)
+            self.assertEqual(converted.count("%s"), sql.count("?"))
+
+
+class MigrationsTest(unittest.TestCase):
+    def test_every_migration_is_a_list_of_statements(self):
+        self.assertTrue(MIGRATIONS)
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            self.assertIsInstance(migration, tuple, number)
+            self.assertTrue(migration, number)
+            for statement in migration:
+                self.assertIsInstance(statement, str, number)
+                self.assertTrue(statement.strip(), number)
+                # كل جملة تُنفذ وحدها: لا فواصل ولا معاملات
+                self.assertNotIn(";", statement, number)
+                self.assertNotIn("?", statement, number)
+
+
+if __name__ == "__main__":
+    unittest.main()
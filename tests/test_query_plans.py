@@ -0,0 +1,39 @@
+# tests/test_query_plans.py
+
+"""
+الاستعلامات الحساسة للأداء تستخدم فهارسها على قاعدة بيانات SQLite مُرحّلة للتو
+(نفس الفحص الذي يجريه التشغيل ويكتفي فيه بتحذير في السجل).
+
+التشغيل من جذر المشروع:
+    python -m unittest tests.test_query_plans
+"""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+os.environ.setdefault("BOT_TOKEN", "test")
+
+from db.backends.sqlite import SQLiteBackend
+from db.migrations import EXPECTED_QUERY_PLANS, SCHEMA_VERSION, check_query_plans
+
+
+class QueryPlansTest(unittest.TestCase):
+    def test_fresh_database_uses_expected_indexes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(str(Path(tmp) / "plans.sqlite"))
+            try:
+                self.assertEqual(backend.init_schema(), SCHEMA_VERSION)
+                with backend.reader() as conn:
+                    self.assertEqual(check_query_plans(conn), [])
+            finally:
+                backend.close()
+
+    def test_every_plan_names_an_index(self):
+        for name, (_, _, indexes) in EXPECTED_QUERY_PLANS.items():
+            self.assertTrue(indexes, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
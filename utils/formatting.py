@@ -3,7 +3,6 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
-import json
 
 from core.config import RESULTS_PER_PAGE, ADMIN_ID
 
@@ -24,13 +23,13 @@ def build_keyboard(rows: list, add_main_menu: bool = True, back_callback: str =
 def build_main_menu(user_data: dict) -> tuple[str, InlineKeyboardMarkup]:
     """
     يبني القائمة الرئيسية بناءً على حالة المستخدم وميزاته.
+    user_data هو الملف الشخصي من db.get_user_data (student_info مفكوك مسبقًا).
     """
     user_id = user_data.get('id')
     university_id = user_data.get('university_id')
     notifications_enabled = user_data.get('notifications_enabled', 1)
     
-    student_info_str = user_data.get('student_info')
-    student_info = json.loads(student_info_str) if student_info_str else {}
+    student_info = user_data.get('student_info') or {}
 
     rows = []
     if university_id: